@@ -0,0 +1,241 @@
+"""
+Streaming anomaly detection on decoded telemetry
+Per controller and numeric parameter the detector keeps O(1) online state
+(one NumPy column per parameter, updated in a few vector operations per frame):
+an EWMA mean/variance of the value and of its rate of change (per second), a
+slow EWMA baseline and the sample-to-sample noise. A z-score reaching Z_ON
+starts an anomaly, which ends once it falls below Z_OFF:
+
+    level   value far from its recent mean (spike, sudden sag)
+    rate    value changing much faster than it recently did
+    drift   recent mean moving away from the long-term baseline by more than
+            the noise explains (drifting coolant, slowly sagging battery)
+
+When the controller's state changes (start, stop, transfer) its baselines
+are learned again, so expected steps are not reported.
+"""
+
+from collections import deque
+from operator import itemgetter
+
+import numpy as np
+
+ALPHA = 0.05            # EWMA weight of a new sample (~20 sample memory)
+SLOW_ALPHA = 0.005      # Long-term baseline for drift (~200 samples)
+Z_ON = 5.0              # |z| starting an anomaly
+Z_OFF = 2.0             # |z| ending it
+WARMUP = 10             # samples per controller before anything is reported
+REL_STD_FLOOR = 0.01    # std never below 1% of |mean| (quantization, idle signals)
+ABS_STD_FLOOR = 0.01
+RATE_WINDOW = 60.0      # rate std floor: the level floor per RATE_WINDOW seconds
+MAX_EVENTS = 200        # recent events kept for the API
+
+# Identifiers, enumerations and counters - not analogue signals
+IGNORED_KEYS = frozenset(("mode", "state", "latitude", "longitude", "satellites"))
+IGNORED_PARTS = ("count", "kWh", "kVArh", "hours", "days", "timer", "version", "consumption", "energy")
+# Multiplexed by the channel selector at 10403 (a selector switch changes what they measure);
+# power_quality tracks them per channel
+CHANNEL_PARTS = ("scopemeter", "harmonic_")
+# Drift is checked for health signals only; load-following values wander by design
+DRIFT_PARTS = ("temp", "voltage", "_V", "pressure", "freq")
+
+KINDS = ("level", "rate", "drift")
+
+# Rows of a controller's state matrix (one column per parameter). The three
+# EWMA means and the three EWMA variances are adjacent blocks, so each block
+# updates in one vector operation
+MEAN, RATE_MEAN, BASE, VAR, RATE_VAR, NOISE, LAST = range(7)
+MEANS = slice(MEAN, BASE + 1)
+SPREADS = slice(VAR, NOISE + 1)
+
+
+def is_tracked(key: str) -> bool:
+    return key not in IGNORED_KEYS and not any(part in key for part in IGNORED_PARTS + CHANNEL_PARTS)
+
+
+def numeric_keys(telemetry: dict) -> tuple:
+    """Tracked keys of a decoded frame holding a number"""
+    keys = []
+    for key, item in telemetry.items():
+        if type(item) is dict and type(item.get("value")) in (int, float) and is_tracked(key):
+            keys.append(key)
+    return tuple(keys)
+
+
+class ControllerBaseline:
+    """O(1) state of one controller: a 7 x parameters matrix plus open anomalies"""
+
+    def __init__(self, keys: tuple, state, values: np.ndarray, timestamp: float):
+        self.keys = keys
+        self.state = state
+        self.getter = itemgetter(*keys) if len(keys) > 1 else (lambda telemetry: (telemetry[keys[0]],))
+        self.drift = np.array([any(part in key for part in DRIFT_PARTS) for key in keys])
+        self.stats = np.zeros((7, len(keys)))
+        self.stats[[MEAN, LAST, BASE]] = values
+        self.z = np.zeros((3, len(keys)))
+        # Scratch rows: deviations from the three means and the level/rate std floors
+        self.delta = np.zeros((3, len(keys)))
+        self.floor = np.zeros((2, len(keys)))
+        self.open = np.zeros((3, len(keys)), dtype=bool)
+        self.active = {}   # (key, kind) -> start event
+        self.samples = 1
+        self.time = timestamp
+
+    def values(self, telemetry: dict):
+        """This frame's values in column order, None if the key set changed"""
+        try:
+            return np.array([item["value"] for item in self.getter(telemetry)], dtype=np.float64)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+class AnomalyDetector:
+    """
+    EWMA anomaly detector for the numeric outputs of decode_telemetry
+
+    Args:
+        alpha: EWMA weight of a new sample
+        z_on: |z| starting an anomaly
+        z_off: |z| ending an anomaly
+        warmup: Samples per controller before anomalies are reported
+        slow_alpha: EWMA weight of the drift baseline
+    """
+
+    def __init__(self, alpha: float = ALPHA, z_on: float = Z_ON, z_off: float = Z_OFF, warmup: int = WARMUP,
+                 slow_alpha: float = SLOW_ALPHA):
+        self.alpha = alpha
+        self.slow_alpha = slow_alpha
+        # Weights of the MEANS rows (level, rate, drift baseline)
+        self.alphas = np.array([[alpha], [alpha], [slow_alpha]])
+        self.z_on = z_on
+        self.z_off = z_off
+        self.warmup = warmup
+        # Std of (fast mean - slow baseline) for white noise of unit std
+        self.drift_scale = np.sqrt(alpha / (2 - alpha))
+        self.drift_warmup = max(warmup, int(1 / slow_alpha))
+        self.controllers = {}   # controller id -> ControllerBaseline
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.version = 0        # increments with every event
+
+    def update(self, controller: str, telemetry: dict, timestamp: float) -> list:
+        """
+        Feed one decoded frame, returns the events it caused (start/end of anomalies)
+
+        Args:
+            controller: Controller id (decoded unique_id)
+            telemetry: decode_telemetry output
+            timestamp: Frame time, unix seconds
+        """
+        baseline = self.controllers.get(controller)
+        state = telemetry.get("state", {}).get("value")
+        values = None
+        if baseline is not None and baseline.state == state:
+            values = baseline.values(telemetry)
+        if values is None:
+            # New controller, state transition (start, stop, transfer) or new parameters: learn again
+            events = self._end_all(baseline, timestamp) if baseline else []
+            keys = numeric_keys(telemetry)
+            if keys:
+                self.controllers[controller] = ControllerBaseline(
+                    keys, state, np.array([telemetry[key]["value"] for key in keys], dtype=np.float64), timestamp)
+            return self._record(events)
+
+        stats = baseline.stats
+        mean = stats[MEAN]
+        z = baseline.z
+        delta = baseline.delta
+        floor = baseline.floor
+
+        step = values - stats[LAST]
+        np.subtract(values, mean, out=delta[0])
+        dt = timestamp - baseline.time
+        if dt > 0:
+            np.divide(step, dt, out=delta[1])
+            delta[1] -= stats[RATE_MEAN]
+        else:
+            delta[1] = 0.0
+        np.subtract(values, stats[BASE], out=delta[2])
+        np.abs(mean, out=floor[0])
+        floor[0] *= REL_STD_FLOOR
+        np.maximum(floor[0], ABS_STD_FLOOR, out=floor[0])
+        np.divide(floor[0], RATE_WINDOW, out=floor[1])
+
+        # Level and rate z against the current EWMAs
+        spread = np.sqrt(stats[VAR:RATE_VAR + 1])
+        np.divide(delta[:2], np.maximum(spread, floor, out=spread), out=z[:2])
+
+        stats[MEANS] += self.alphas * delta
+        # Variances of the level and rate deviations; noise from the differences,
+        # which see white noise twice and a slow trend hardly at all
+        delta[2] = step
+        delta *= delta
+        delta[2] *= 0.5
+        stats[SPREADS] += self.alphas[0] * delta
+        stats[SPREADS] *= 1 - self.alphas[0]
+        stats[LAST] = values
+        baseline.time = timestamp
+        baseline.samples += 1
+
+        if baseline.samples <= self.warmup:
+            return []
+        if baseline.samples > self.drift_warmup:
+            noise = np.maximum(np.sqrt(stats[NOISE]) * self.drift_scale, floor[0])
+            np.divide(mean - stats[BASE], noise, out=z[2])
+            z[2] *= baseline.drift
+
+        magnitude = np.abs(z)
+        if baseline.active:
+            changed = np.where(baseline.open, magnitude < self.z_off, magnitude >= self.z_on)
+            if not changed.any():
+                return []
+        elif magnitude.max() < self.z_on:
+            return []
+        else:
+            changed = magnitude >= self.z_on
+
+        events = []
+        for kind, column in zip(*np.nonzero(changed)):
+            name = (baseline.keys[column], KINDS[kind])
+            if baseline.open[kind, column]:
+                event = dict(baseline.active.pop(name), event="end", value=values[column].item(),
+                             z=round(z[kind, column].item(), 2), time=timestamp)
+            else:
+                event = baseline.active[name] = {
+                    "event": "start",
+                    "controller": controller,
+                    "parameter": name[0],
+                    "kind": name[1],
+                    "value": values[column].item(),
+                    "mean": round(mean[column].item(), 4),
+                    "std": round(np.sqrt(stats[VAR, column]).item(), 4),
+                    "baseline": round(stats[BASE, column].item(), 4),
+                    "z": round(z[kind, column].item(), 2),
+                    "time": timestamp,
+                }
+            events.append(event)
+        baseline.open ^= changed
+        return self._record(events)
+
+    def _record(self, events: list) -> list:
+        if events:
+            self.events.extend(events)
+            self.version += 1
+        return events
+
+    def _end_all(self, baseline: ControllerBaseline, timestamp: float) -> list:
+        return [dict(started, event="end", time=timestamp) for started in baseline.active.values()]
+
+    def active(self, controller: str) -> list:
+        """Anomalies currently open for a controller (the start events)"""
+        baseline = self.controllers.get(controller)
+        return list(baseline.active.values()) if baseline else []
+
+    def snapshot(self) -> dict:
+        """Active anomalies per controller and the recent events, for the API"""
+        return {
+            "active": {controller: list(baseline.active.values())
+                       for controller, baseline in self.controllers.items() if baseline.active},
+            "events": list(self.events),
+            "controllers": len(self.controllers),
+            "parameters": sum(len(baseline.keys) for baseline in self.controllers.values()),
+        }
@@ -5,18 +5,26 @@ Provides HTTP API access to telemetry data collected by datakom_listener
 
 import os
 import json
+import time
+import asyncio
+import threading
 import subprocess
 import psutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, List
-from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-from config import API_HOST, API_PORT, DEFAULT_LANGUAGE
-from param_mapping import get_param_id_label, get_all_param_names
-import importlib
+from config import API_HOST, API_PORT, DEFAULT_LANGUAGE, LISTENER_PORT, API_IO_WORKERS, ALERT_RULES_FILE
+from param_mapping import get_param_id_label
+from translations import get_table, UNTITLED_PARAM_NAMES
+from snapshot_cache import JsonFileCache, LiveSnapshot, file_signature
+import compact_format
+from response_cache import ResponseCache, render_json
+from frame_archive import ArchiveFanout, ArchiveFollower, FrameArchiveReader, LATEST_FRAME, iter_file_range, segment_day
 
 app = FastAPI(
     title="Datakom D500 MK3 API",
@@ -29,135 +37,125 @@ DATA_DIR = Path("data")
 TELEMETRY_JSON = DATA_DIR / "telemetry.json"
 ALERTS_JSON = DATA_DIR / "alerts.json"
 HEALTH_JSON = DATA_DIR / "health.json"
+ANOMALIES_JSON = DATA_DIR / "anomalies.json"
+FUEL_EVENTS_JSON = DATA_DIR / "fuel_events.json"
+POWER_QUALITY_JSON = DATA_DIR / "power_quality.json"
+RAW_MEDIA_TYPE = "application/octet-stream"
 
 # Listener process management
 LISTENER_SCRIPT = "datakom_listener.py"
 listener_process: Optional[subprocess.Popen] = None
-listener_status_cache = {"running": False, "last_check": 0}
+listener_status_cache = {"running": False, "last_check": 0.0}
+listener_probe_task: Optional[asyncio.Task] = None
+listener_start_lock = asyncio.Lock()
 CACHE_TTL = 1.0  # Cache status for 1 second
 
+# Combined mode: listener engine on this event loop instead of a child process
+ingest_engine = None
 
-def load_language_module(lang_code: str):
-    """Load language module dynamically"""
-    try:
-        return importlib.import_module(f"lang.{lang_code}")
-    except ImportError:
-        # Fallback to default language
-        return importlib.import_module(f"lang.{DEFAULT_LANGUAGE}")
+# All blocking work (file reads, stat, process spawn) runs here, never on the event loop
+io_executor = ThreadPoolExecutor(max_workers=API_IO_WORKERS, thread_name_prefix="api-io")
 
 
-def get_param_title(label: str, lang_code: str = None) -> str:
-    """Get translated title for parameter label"""
-    if not lang_code:
-        lang_code = DEFAULT_LANGUAGE
-    
-    lang_module = load_language_module(lang_code)
-    
-    # Try to find translation in PARAM_TITLES if exists
-    if hasattr(lang_module, 'PARAM_TITLES'):
-        return lang_module.PARAM_TITLES.get(label, "")
-    
-    return ""
+async def run_blocking(func, *args):
+    """Run a blocking call in the bounded I/O executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, func, *args)
 
 
-def get_value_hint(label: str, value, lang_code: str = None) -> str:
-    """Get text description for numeric value from language dictionaries"""
-    if not isinstance(value, (int, float)):
-        return ""
-    
-    if not lang_code:
-        lang_code = DEFAULT_LANGUAGE
-    
-    lang_module = load_language_module(lang_code)
-    
-    # Map labels to dictionary names
-    label_to_dict = {
-        "Genset Mode": "MODE_NAMES",
-        "Genset State": "STATE_NAMES",
-        "Engine State": "ENGINE_STATE_NAMES",
-        "Breaker State": "BREAKER_STATE_NAMES",
-        "Mains State": "MAINS_STATE_NAMES",
-        "Battery State": "BATTERY_STATE_NAMES",
-        "Start Source": "START_SOURCE_NAMES",
-        "Running Type": "RUNNING_TYPE_NAMES",
-    }
-    
-    dict_name = label_to_dict.get(label)
-    if dict_name and hasattr(lang_module, dict_name):
-        value_dict = getattr(lang_module, dict_name)
-        return value_dict.get(int(value), "")
-    
-    return ""
+def get_param_title(param_id: int, lang_code: str = None) -> str:
+    """Get translated title for parameter ID"""
+    return get_table(lang_code).title(param_id)
 
 
-def is_listener_running() -> bool:
-    """Check if listener process is running (optimized with caching)"""
-    global listener_process, listener_status_cache
-    
-    # Use cached result if fresh (< 1 second old)
-    import time
-    now = time.time()
-    if now - listener_status_cache["last_check"] < CACHE_TTL:
-        return listener_status_cache["running"]
+def get_value_hint(param_id: int, value, lang_code: str = None) -> str:
+    """Get text description for numeric value from language tables"""
+    return get_table(lang_code).value_hint(param_id, value)
+
+
+async def probe_listener() -> bool:
+    """Check if listener process is running without blocking the event loop"""
+    if ingest_engine is not None:
+        return ingest_engine.is_serving
     
     # Check our subprocess first (if started by this API)
     if listener_process and listener_process.poll() is None:
-        listener_status_cache.update({"running": True, "last_check": now})
         return True
     
     # For PM2-managed processes, check health.json timestamp
     # If file was updated recently (within 60 seconds), listener is alive
-    try:
-        if HEALTH_JSON.exists():
-            file_mtime = HEALTH_JSON.stat().st_mtime
-            age_seconds = now - file_mtime
-            
-            # If health.json updated within last 60 seconds, listener is running
-            is_running = (age_seconds < 60)
-            listener_status_cache.update({"running": is_running, "last_check": now})
-            return is_running
-    except Exception as e:
-        print(f"Error checking listener health file: {e}")
+    signature = await run_blocking(file_signature, HEALTH_JSON)
+    if signature is not None:
+        age_seconds = time.time() - signature[0] / 1e9
+        return age_seconds < 60
     
     # Fallback: try to connect to listener port
     try:
-        import socket
-        from config import LISTENER_PORT
-        
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(0.5)
-        result = sock.connect_ex(('127.0.0.1', LISTENER_PORT))
-        sock.close()
-        
-        is_running = (result == 0)
-        listener_status_cache.update({"running": is_running, "last_check": now})
-        return is_running
+        _, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', LISTENER_PORT), timeout=0.5)
+        writer.close()
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
     except Exception as e:
         print(f"Error checking listener port: {e}")
-        listener_status_cache.update({"running": False, "last_check": now})
         return False
 
 
-def start_listener() -> bool:
+async def refresh_listener_status() -> bool:
+    """Probe the listener and store the result in the status cache"""
+    running = await probe_listener()
+    listener_status_cache.update({"running": running, "last_check": time.monotonic()})
+    return running
+
+
+async def is_listener_running() -> bool:
+    """Check if listener process is running (cached, probed in the background)"""
+    global listener_probe_task
+    
+    # Serve the cached result; a stale one triggers a single background probe
+    if time.monotonic() - listener_status_cache["last_check"] >= CACHE_TTL:
+        if listener_probe_task is None or listener_probe_task.done():
+            listener_probe_task = asyncio.create_task(refresh_listener_status())
+        if listener_status_cache["last_check"] == 0:
+            # Nothing known yet - wait for the first probe
+            await asyncio.shield(listener_probe_task)
+    
+    return listener_status_cache["running"]
+
+
+def spawn_listener() -> subprocess.Popen:
+    """Start the listener script as a child process (blocking)"""
+    # Use python3 on Linux, python on Windows
+    python_cmd = "python" if os.name == 'nt' else "python3"
+    return subprocess.Popen(
+        [python_cmd, LISTENER_SCRIPT],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        creationflags=subprocess.CREATE_NEW_CONSOLE if os.name == 'nt' else 0
+    )
+
+
+async def start_listener() -> bool:
     """Start listener process if not running"""
     global listener_process
     
-    if is_listener_running():
+    if await is_listener_running():
         return True
-    
-    try:
-        # Use python3 on Linux, python on Windows
-        python_cmd = "python" if os.name == 'nt' else "python3"
-        listener_process = subprocess.Popen(
-            [python_cmd, LISTENER_SCRIPT],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NEW_CONSOLE if os.name == 'nt' else 0
-        )
-        return True
-    except Exception as e:
-        print(f"Failed to start listener: {e}")
+    if ingest_engine is not None:
+        # In-process engine is started and stopped with the app, never spawned
         return False
+    
+    # Concurrent requests must not spawn several listeners
+    async with listener_start_lock:
+        if listener_process and listener_process.poll() is None:
+            return True
+        try:
+            listener_process = await run_blocking(spawn_listener)
+            listener_status_cache.update({"running": True, "last_check": time.monotonic()})
+            return True
+        except Exception as e:
+            print(f"Failed to start listener: {e}")
+            return False
 
 
 def load_health() -> dict:
@@ -205,9 +203,76 @@ def load_alerts() -> dict:
     return {"shutDown": [], "loadDump": [], "warning": []}
 
 
+def load_anomalies() -> dict:
+    """Load anomaly detector snapshot"""
+    if ANOMALIES_JSON.exists():
+        with open(ANOMALIES_JSON, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"active": {}, "events": [], "controllers": 0, "parameters": 0}
+
+
+EMPTY_FUEL_EVENTS = {"events": [], "open": {}, "controllers": 0}
+
+
+def load_fuel_events() -> dict:
+    """Load refuel/theft monitor snapshot"""
+    if FUEL_EVENTS_JSON.exists():
+        with open(FUEL_EVENTS_JSON, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return EMPTY_FUEL_EVENTS
+
+
+EMPTY_POWER_QUALITY = {"controllers": {}}
+
+
+def load_power_quality() -> dict:
+    """Load power quality snapshot"""
+    if POWER_QUALITY_JSON.exists():
+        with open(POWER_QUALITY_JSON, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return EMPTY_POWER_QUALITY
+
+
+# In-memory snapshots of the listener's files, re-read only when they change
+telemetry_cache = JsonFileCache(TELEMETRY_JSON, load_telemetry, io_executor, CACHE_TTL)
+alerts_cache = JsonFileCache(ALERTS_JSON, load_alerts, io_executor, CACHE_TTL)
+health_cache = JsonFileCache(HEALTH_JSON, load_health, io_executor, CACHE_TTL)
+anomalies_cache = JsonFileCache(ANOMALIES_JSON, load_anomalies, io_executor, CACHE_TTL)
+fuel_cache = JsonFileCache(FUEL_EVENTS_JSON, load_fuel_events, io_executor, CACHE_TTL)
+power_quality_cache = JsonFileCache(POWER_QUALITY_JSON, load_power_quality, io_executor, CACHE_TTL)
+
+
+def use_ingest_engine(engine):
+    """
+    Combined mode: run `engine` on the API event loop and serve its in-memory
+    state instead of re-reading the JSON files it writes
+    """
+    global ingest_engine, telemetry_cache, alerts_cache, health_cache, anomalies_cache, fuel_cache
+    global power_quality_cache
+    ingest_engine = engine
+    telemetry_cache = LiveSnapshot(lambda: engine.telemetry)
+    alerts_cache = LiveSnapshot(lambda: engine.alerts)
+    health_cache = LiveSnapshot(lambda: engine.health)
+    anomalies_cache = LiveSnapshot(lambda: engine.anomalies)
+    fuel_cache = LiveSnapshot(lambda: engine.snapshot(FUEL_EVENTS_JSON.name, EMPTY_FUEL_EVENTS))
+    power_quality_cache = LiveSnapshot(lambda: engine.snapshot(POWER_QUALITY_JSON.name, EMPTY_POWER_QUALITY))
+
+
+# Rendered (and gzip/deflate-compressed) bodies, rebuilt once per snapshot version
+response_cache = ResponseCache()
+
+
+def cached_response(request: Request, key: tuple, version, render, media_type: str = "application/json",
+                    headers: dict = None) -> Response:
+    """Serve a body rendered once per version, compressed once per encoding"""
+    rendered = response_cache.get(key, version, render, media_type, headers)
+    return rendered.respond(request.headers.get("accept-encoding"), request.headers.get("if-none-match"))
+
+
 def telemetry_to_params(telemetry: dict, lang_code: str = None) -> List[dict]:
     """Convert telemetry JSON to parameter list with fixed IDs"""
     params = []
+    table = get_table(lang_code)
     
     for key, value_obj in telemetry.items():
         if key in ('timestamp', 'raw_packet_file', '_alerts_internal'):
@@ -224,9 +289,9 @@ def telemetry_to_params(telemetry: dict, lang_code: str = None) -> List[dict]:
             param = {
                 "id": param_id,
                 "label": label,
-                "labelHint": get_param_title(label, lang_code or DEFAULT_LANGUAGE),
+                "labelHint": table.title(param_id),
                 "value": value,
-                "valueHint": get_value_hint(label, value, lang_code or DEFAULT_LANGUAGE),
+                "valueHint": table.value_hint(param_id, value),
                 "unit": value_obj.get('unit', ''),
             }
             params.append(param)
@@ -246,8 +311,8 @@ async def api_test_page():
 @app.get("/api/health")
 async def get_health():
     """Server health check"""
-    listener_running = is_listener_running()
-    health = load_health()
+    listener_running = await is_listener_running()
+    health = dict(await health_cache.get())
     
     health["listener_running"] = listener_running
     health["status"] = "ok" if listener_running else "listener_stopped"
@@ -265,109 +330,744 @@ async def get_health():
 
 @app.get("/api/dump_devm")
 async def get_parameters(
+    request: Request,
     id: Optional[str] = Query(None, description="Comma-separated parameter IDs"),
-    language: Optional[str] = Query(None, description="Language code: uk, en, ru")
+    language: Optional[str] = Query(None, description="Language code: uk, en, ru"),
+    response_format: Optional[str] = Query(None, alias="format", description="Response format: json (default) or bin")
 ):
     """Get device parameters (all or filtered by id)"""
     
     # Ensure listener is running
-    listener_running = is_listener_running()
+    listener_running = await is_listener_running()
     if not listener_running:
-        start_listener()
+        await start_listener()
     
-    telemetry = load_telemetry()
-    all_params = telemetry_to_params(telemetry, language)
+    telemetry = await telemetry_cache.get()
+    version = telemetry_cache.version
+    requested_ids = {int(x.strip()) for x in id.split(',')} if id else None
+    ids_key = tuple(sorted(requested_ids)) if requested_ids else None
     
-    # Filter by IDs if specified
-    if id:
-        requested_ids = [int(x.strip()) for x in id.split(',')]
-        filtered_params = [p for p in all_params if p['id'] in requested_ids]
-        result_params = filtered_params
-    else:
-        result_params = all_params
+    # Compact binary records; labels/units come from /api/dump_devm_schema
+    if compact_format.wants_binary(response_format, request.headers.get("accept")):
+        return cached_response(
+            request, ("dump_devm", "bin", ids_key), version,
+            lambda: compact_format.encode_telemetry(telemetry, requested_ids),
+            media_type=compact_format.MEDIA_TYPE,
+            headers={"X-Schema-Version": str(compact_format.SCHEMA_VERSION)}
+        )
     
-    return {
-        "success": True,
-        "result": result_params,
-        "cached": True,
-        "timestamp": telemetry.get('timestamp', datetime.now().isoformat())
-    }
+    lang_code = get_table(language).code
+    
+    def render():
+        all_params = telemetry_to_params(telemetry, lang_code)
+        
+        # Filter by IDs if specified
+        if requested_ids:
+            filtered_params = [p for p in all_params if p['id'] in requested_ids]
+            result_params = filtered_params
+        else:
+            result_params = all_params
+        
+        return render_json({
+            "success": True,
+            "result": result_params,
+            "cached": True,
+            "timestamp": telemetry.get('timestamp', datetime.now().isoformat())
+        })
+    
+    return cached_response(request, ("dump_devm", lang_code, ids_key), version, render)
+
+
+@app.get("/api/dump_devm_schema")
+async def get_parameter_schema(
+    request: Request,
+    language: Optional[str] = Query(None, description="Language code: uk, en, ru")
+):
+    """Get parameter schema (ID -> label, title, unit, value hints) for the binary format"""
+    
+    # Schema only changes with a new release; let clients and proxies cache it
+    lang_code = get_table(language).code
+    return cached_response(
+        request, ("schema", lang_code), compact_format.SCHEMA_VERSION,
+        lambda: render_json(compact_format.schema_document(lang_code)),
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
 
 
 @app.get("/api/dump_devm_param_names")
-async def get_parameter_names(language: Optional[str] = Query(None, description="Language code: uk, en, ru")):
+async def get_parameter_names(
+    request: Request,
+    language: Optional[str] = Query(None, description="Language code: uk, en, ru")
+):
     """Get all parameter IDs and labels"""
     
-    # Return all defined parameter names from mapping
-    param_names = get_all_param_names()
-    
-    # Add title field with translation if language specified
+    # Precomputed listing; titles only when a language is requested
     if language:
-        for param in param_names:
-            param['title'] = get_param_title(param['label'], language)
+        lang_code = get_table(language).code
+        param_names = get_table(language).param_names
     else:
-        for param in param_names:
-            param['title'] = ""
+        lang_code = None
+        param_names = UNTITLED_PARAM_NAMES
     
-    return {
-        "success": True,
-        "params": param_names,
-        "cached": True
-    }
+    return cached_response(
+        request, ("param_names", lang_code), 0,
+        lambda: render_json({
+            "success": True,
+            "params": param_names,
+            "cached": True
+        })
+    )
 
 
 @app.get("/api/dump_devm_alarm")
-async def get_alarms(language: Optional[str] = Query(None, description="Language code: uk, en, ru")):
+async def get_alarms(
+    request: Request,
+    language: Optional[str] = Query(None, description="Language code: uk, en, ru")
+):
     """Get current alarm states"""
     
     # Ensure listener is running
-    listener_running = is_listener_running()
+    listener_running = await is_listener_running()
     if not listener_running:
-        start_listener()
+        await start_listener()
     
-    alerts = load_alerts()
+    alerts = await alerts_cache.get()
+    version = alerts_cache.version
     
-    # Load language module for translations
-    lang_code = language or DEFAULT_LANGUAGE
-    lang_module = load_language_module(lang_code)
-    alarm_messages = lang_module.ALARM_MESSAGES
+    # Precompiled alarm message table for the requested language
+    table = get_table(language)
     
     # Convert alarm indices to translated messages
     def translate_alarms(alarm_list):
-        return [alarm_messages.get(idx, f"Alarm #{idx}") for idx in alarm_list]
+        return [table.alarm_message(idx) for idx in alarm_list]
     
-    # Convert to API format with capital letters and translated messages
-    alarm_data = {
-        "ShutDown": translate_alarms(alerts.get("shutDown", [])),
-        "LoadDump": translate_alarms(alerts.get("loadDump", [])),
-        "Warning": translate_alarms(alerts.get("warning", []))
-    }
+    def render():
+        # Convert to API format with capital letters and translated messages
+        alarm_data = {
+            "ShutDown": translate_alarms(alerts.get("shutDown", [])),
+            "LoadDump": translate_alarms(alerts.get("loadDump", [])),
+            "Warning": translate_alarms(alerts.get("warning", [])),
+            "Anomaly": alerts.get("anomaly", []),
+            "Rules": alerts.get("rules", []),
+        }
+        
+        return render_json({
+            "success": True,
+            "alarm": alarm_data,
+            "cached": True
+        })
     
-    return {
-        "success": True,
-        "alarm": alarm_data,
-        "cached": True
-    }
+    return cached_response(request, ("alarm", table.code), version, render)
+
+
+@app.get("/api/anomalies")
+async def get_anomalies(
+    request: Request,
+    controller: Optional[str] = Query(None, description="Controller unique_id (default: all)")
+):
+    """Active anomalies per controller and recent anomaly events"""
+    snapshot = await anomalies_cache.get()
+    version = anomalies_cache.version
+
+    def render():
+        active = snapshot.get("active", {})
+        events = snapshot.get("events", [])
+        if controller is not None:
+            active = {controller: active.get(controller, [])}
+            events = [event for event in events if event.get("controller") == controller]
+        return render_json({
+            "success": True,
+            "active": active,
+            "events": events,
+            "controllers": snapshot.get("controllers", 0),
+            "parameters": snapshot.get("parameters", 0),
+        })
+
+    return cached_response(request, ("anomalies", controller), version, render)
+
+
+@app.get("/api/fuel_events")
+async def get_fuel_events(
+    request: Request,
+    controller: Optional[str] = Query(None, description="Controller unique_id (default: all)"),
+    kind: Optional[str] = Query(None, description="refuel or theft (default: both)")
+):
+    """Refuel and theft events detected from the tank level, and events still in progress"""
+    snapshot = await fuel_cache.get()
+    version = fuel_cache.version
+
+    def render():
+        events = snapshot.get("events", [])
+        opened = snapshot.get("open", {})
+        if controller is not None:
+            events = [event for event in events if event.get("controller") == controller]
+            opened = {controller: opened[controller]} if controller in opened else {}
+        if kind is not None:
+            events = [event for event in events if event.get("kind") == kind]
+        return render_json({
+            "success": True,
+            "events": events,
+            "open": opened,
+            "controllers": snapshot.get("controllers", 0),
+        })
+
+    return cached_response(request, ("fuel_events", controller, kind), version, render)
+
+
+@app.get("/api/power_quality")
+async def get_power_quality(
+    request: Request,
+    controller: Optional[str] = Query(None, description="Controller unique_id (default: all)"),
+    channel: Optional[int] = Query(None, description="Scopemeter channel (default: all)")
+):
+    """RMS, crest factor, THD and harmonic spectrum of the latest waveform per controller and channel"""
+    snapshot = await power_quality_cache.get()
+    version = power_quality_cache.version
+
+    def render():
+        controllers = snapshot.get("controllers", {})
+        if controller is not None:
+            controllers = {controller: controllers[controller]} if controller in controllers else {}
+        if channel is not None:
+            controllers = {name: {str(channel): channels[str(channel)]}
+                           for name, channels in controllers.items() if str(channel) in channels}
+        return render_json({
+            "success": True,
+            "controllers": controllers,
+            "spectrum_orders": snapshot.get("spectrum_orders"),
+            "units": snapshot.get("units"),
+        })
+
+    return cached_response(request, ("power_quality", controller, channel), version, render)
+
+
+def parse_time(value: str) -> float:
+    """Unix seconds from a unix timestamp or ISO 8601 string"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+frame_reader = FrameArchiveReader()
+
+
+@app.get("/api/raw/latest")
+async def get_raw_latest():
+    """Latest raw telemetry frame as a length-prefixed record (no decoding)"""
+    if not await run_blocking(os.path.exists, LATEST_FRAME):
+        return JSONResponse({"success": False, "error": "No telemetry frame received yet"}, status_code=404)
+    return FileResponse(LATEST_FRAME, media_type=RAW_MEDIA_TYPE)
+
+
+@app.get("/api/raw/range")
+async def get_raw_range(
+    start: str = Query(..., description="Start time: ISO 8601 or unix seconds"),
+    end: Optional[str] = Query(None, description="End time: ISO 8601 or unix seconds (default: now)")
+):
+    """Archived raw telemetry frames between start and end as length-prefixed records"""
+    try:
+        start_ts = parse_time(start)
+        end_ts = parse_time(end) if end else time.time()
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": f"Invalid time: {e}"}, status_code=400)
+    
+    ranges = await run_blocking(frame_reader.ranges, start_ts, end_ts)
+    total = sum(stop - first for _, first, stop in ranges)
+    
+    # A whole closed segment goes out as a file (sendfile where the server supports it). Today's segment
+    # is still growing: FileResponse would send frames appended after the index was read, past Content-Length
+    if len(ranges) == 1 and ranges[0][1] == 0:
+        path, _, stop = ranges[0]
+        day = segment_day(os.path.basename(path))
+        if day is not None and day.date() < datetime.now().date() and await run_blocking(os.path.getsize, path) == stop:
+            return FileResponse(path, media_type=RAW_MEDIA_TYPE)
+    
+    def stream():
+        for path, first, stop in ranges:
+            yield from iter_file_range(path, first, stop)
+    
+    return StreamingResponse(stream(), media_type=RAW_MEDIA_TYPE, headers={"Content-Length": str(total)})
+
+
+# Reads each new archive record once for every consumer below (follow_archive polls it)
+archive_fanout = ArchiveFanout()
+
+
+# Scopemeter history, filled from the frame archive (imports numpy on first use)
+waveform_follower = None
+WAVEFORM_POLL_INTERVAL = 1.0
+WAVEFORM_SEED_SECONDS = 600.0  # archive history read on the first poll, and the most caught up on
+waveform_polled = 0.0
+waveform_lock = threading.RLock()
+
+
+def poll_waveforms():
+    """WaveformBuffer with the archive records appended since the last poll"""
+    global waveform_follower, waveform_polled
+    with waveform_lock:
+        if waveform_follower is None:
+            from waveform_buffer import WaveformBuffer
+            waveform_follower = archive_fanout.add(
+                ArchiveFollower(WaveformBuffer(), seed_seconds=WAVEFORM_SEED_SECONDS, max_lag=WAVEFORM_SEED_SECONDS),
+                waveform_lock)
+        now = time.monotonic()
+        if now - waveform_polled >= WAVEFORM_POLL_INTERVAL:
+            waveform_follower.poll()
+            waveform_polled = now
+        return waveform_follower.buffer
+
+
+def recent_waveforms(controller: str, channel: int, n: int) -> tuple:
+    """
+    (controller, (version, times, samples, channels) or None if the id is invalid), serialized
+    with the archive polls; controller defaults to the newest waveform's
+    """
+    with waveform_lock:
+        buffer = poll_waveforms()
+        controller = (controller or buffer.latest or "").upper()
+        try:
+            valid = len(bytes.fromhex(controller)) == 12
+        except ValueError:
+            valid = False
+        if not valid:
+            return controller, None
+        return controller, (buffer.version, *buffer.recent(controller, channel, n), buffer.channels(controller))
+
+
+@app.get("/api/waveform")
+async def get_waveform(
+    request: Request,
+    channel: int = Query(..., ge=0, le=255, description="Scopemeter channel (selector value)"),
+    n: int = Query(10, ge=1, description="Number of recent waveforms"),
+    controller: Optional[str] = Query(None, description="Controller unique_id (default: newest waveform's)"),
+    response_format: Optional[str] = Query(None, alias="format", description="Response format: json (default) or bin")
+):
+    """Recent scopemeter waveforms of one channel, oldest first, as JSON arrays or packed binary"""
+    import waveform_buffer
+
+    controller, found = await run_blocking(recent_waveforms, controller, channel, n)
+    if found is None:
+        return JSONResponse({"success": False, "error": "No waveform received yet" if not controller
+                             else f"Invalid controller id: {controller}"}, status_code=404 if not controller else 400)
+    version, times, samples, channels = found
+
+    if response_format and response_format.lower() in ("bin", "binary"):
+        return cached_response(
+            request, ("waveform", "bin", controller, channel, n), version,
+            lambda: waveform_buffer.encode_waveforms(controller, channel, times, samples),
+            media_type=waveform_buffer.MEDIA_TYPE,
+        )
+
+    def render():
+        return render_json({
+            "success": True,
+            "controller": controller,
+            "channel": channel,
+            "points": waveform_buffer.SCOPE_POINTS,
+            "channels": channels,
+            "times": times.tolist(),
+            "samples": samples.tolist(),
+        })
+
+    return cached_response(request, ("waveform", "json", controller, channel, n), version, render)
+
+
+# Last value of every numeric parameter per controller, filled from the frame archive
+fleet_follower = None
+FLEET_POLL_INTERVAL = 1.0
+FLEET_SEED_SECONDS = 3600.0  # archive history read on the first poll, and the most caught up on
+fleet_polled = 0.0
+fleet_lock = threading.RLock()
+
+
+def poll_fleet():
+    """FleetMatrix with the archive records appended since the last poll decoded into their rows"""
+    global fleet_follower, fleet_polled
+    with fleet_lock:
+        if fleet_follower is None:
+            from fleet_matrix import FleetMatrix
+            from rule_engine import RuleEngine
+            fleet = FleetMatrix(rules=RuleEngine(ALERT_RULES_FILE))
+            fleet_follower = archive_fanout.add(
+                ArchiveFollower(fleet, seed_seconds=FLEET_SEED_SECONDS, max_lag=FLEET_SEED_SECONDS), fleet_lock)
+        now = time.monotonic()
+        if now - fleet_polled >= FLEET_POLL_INTERVAL:
+            fleet_follower.poll()
+            fleet_follower.buffer.flush()
+            fleet_polled = now
+        return fleet_follower.buffer
+
+
+def query_fleet(where: str, sort: str, fields: str, limit: int) -> tuple:
+    """(version, result, columns the query reads) of a fleet query, serialized with the archive polls"""
+    from fleet_matrix import column_name
+
+    with fleet_lock:
+        fleet = poll_fleet()
+        started = time.perf_counter()
+        result = fleet.query(where, sort, fields, limit)
+        result["query_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        names = set(fleet.compiled(where)[1]) if where else set()
+        names.update(column_name(item.strip().lstrip("+-")) for item in f"{sort or ''},{fields or ''}".split(",")
+                     if item.strip())
+        return fleet.version, result, names
+
+
+@app.get("/api/fleet/query")
+async def get_fleet_query(
+    request: Request,
+    where: Optional[str] = Query(None, description="Filter, e.g. fuel_level_percent < 20 and mode == MODE_AUTO"),
+    sort: Optional[str] = Query(None, description="Comma-separated columns, - for descending"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns (default: those in where/sort)"),
+    limit: int = Query(100, ge=1, le=100000, description="Maximum controllers returned")
+):
+    """Vectorized filter/sort over the last values of the whole fleet"""
+    try:
+        version, result, names = await run_blocking(query_fleet, where, sort, fields, limit)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    if "age" in names:
+        version = (version, int(time.time()))
+
+    return cached_response(request, ("fleet_query", where, sort, fields, limit), version,
+                           lambda: render_json({"success": True, **result}))
+
+
+# Interval energy and materialized day / month reports, booked from the frame archive
+energy_accounting = None
+ENERGY_POLL_INTERVAL = 10.0
+ENERGY_PERIODS = ("15min", "hour", "day", "month")
+energy_polled = 0.0
+energy_lock = threading.Lock()
+
+
+def poll_energy():
+    """EnergyAccounting with the archive records appended since the last poll"""
+    global energy_accounting, energy_polled
+    with energy_lock:
+        if energy_accounting is None:
+            from energy_accounting import EnergyAccounting
+            energy_accounting = EnergyAccounting().follow()
+            archive_fanout.add(energy_accounting.follower, energy_accounting.lock)
+        now = time.monotonic()
+        if now - energy_polled >= ENERGY_POLL_INTERVAL:
+            energy_accounting.poll()
+            energy_polled = now
+        return energy_accounting
+
+
+@app.get("/api/energy")
+async def get_energy(
+    request: Request,
+    period: str = Query("day", description="15min, hour, day or month"),
+    controller: Optional[str] = Query(None, description="Controller unique_id (default: all)"),
+    month: Optional[str] = Query(None, description="YYYY-MM for period=day (default: current month)")
+):
+    """Energy per interval from the cumulative kWh / kVArh counters; open intervals are marked partial"""
+    if period not in ENERGY_PERIODS:
+        return JSONResponse({"success": False, "error": f"Invalid period: {period} (one of {', '.join(ENERGY_PERIODS)})"},
+                            status_code=400)
+    month = month or datetime.now().strftime("%Y-%m")
+    try:
+        parsed = datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        return JSONResponse({"success": False, "error": f"Invalid month: {month} (YYYY-MM)"}, status_code=400)
+    month = f"{parsed.year:04d}-{parsed.month:02d}"  # 2025-1 and 2025-01 are one report and one cache key
+    if controller is not None:
+        controller = controller.upper()
+
+    accounting = await run_blocking(poll_energy)
+    version = accounting.version
+
+    def render():
+        from energy_accounting import UNITS
+        content = {"success": True, "period": period, "units": UNITS}
+        if period == "month":
+            content["months"] = accounting.month_totals(controller)
+        elif period == "day":
+            content["month"] = month
+            content["days"] = accounting.days(month, controller)
+        else:
+            content["controllers"] = accounting.intervals(period, controller)
+        return render_json(content)
+
+    return cached_response(request, ("energy", period, controller, month), version, render)
+
+
+# Positions, tracks and movement / geofence events, from the frame archive
+gps_follower = None
+GPS_POLL_INTERVAL = 1.0
+GPS_SEED_SECONDS = 3600.0  # archive history read on the first poll
+gps_polled = 0.0
+gps_lock = threading.RLock()
+
+
+def poll_gps():
+    """GpsTracker with the archive records appended since the last poll"""
+    global gps_follower, gps_polled
+    with gps_lock:
+        if gps_follower is None:
+            from gps_tracker import GpsTracker
+            gps_follower = archive_fanout.add(ArchiveFollower(GpsTracker(), seed_seconds=GPS_SEED_SECONDS), gps_lock)
+        now = time.monotonic()
+        if now - gps_polled >= GPS_POLL_INTERVAL:
+            gps_follower.poll()
+            gps_polled = now
+        return gps_follower.buffer
+
+
+def gps_call(method: str, *args) -> tuple:
+    """(version, result) of a GpsTracker query, serialized with the archive polls"""
+    with gps_lock:
+        tracker = poll_gps()
+        version = tracker.events_version if method == "recent_events" else tracker.version
+        return version, getattr(tracker, method)(*args)
+
+
+def parse_bbox(value: str) -> tuple:
+    """(min_lat, min_lon, max_lat, max_lon) from a "min_lat,min_lon,max_lat,max_lon" string"""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4 or not (-90 <= parts[0] <= parts[2] <= 90) or not all(-180 <= v <= 180 for v in parts[1::2]):
+        raise ValueError("bbox is min_lat,min_lon,max_lat,max_lon")
+    return tuple(parts)
+
+
+@app.get("/api/gps/positions")
+async def get_gps_positions(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="min_lat,min_lon,max_lat,max_lon (default: whole fleet)")
+):
+    """Latest position of every controller inside a bounding box"""
+    try:
+        box = parse_bbox(bbox) if bbox else (-90.0, -180.0, 90.0, 180.0)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    version, controllers = await run_blocking(gps_call, "bbox", *box)
+    return cached_response(request, ("gps_positions", box), version,
+                           lambda: render_json({"success": True, "count": len(controllers), "controllers": controllers}))
+
+
+@app.get("/api/gps/nearest")
+async def get_gps_nearest(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    n: int = Query(10, ge=1, le=1000, description="Number of controllers"),
+    max_distance_m: Optional[float] = Query(None, gt=0, description="Search radius in meters")
+):
+    """The n controllers closest to a point, nearest first"""
+    version, controllers = await run_blocking(gps_call, "nearest", lat, lon, n, max_distance_m)
+    return cached_response(request, ("gps_nearest", lat, lon, n, max_distance_m), version,
+                           lambda: render_json({"success": True, "controllers": controllers}))
+
+
+@app.get("/api/gps/track")
+async def get_gps_track(
+    request: Request,
+    controller: str = Query(..., description="Controller unique_id"),
+    since: Optional[str] = Query(None, description="Unix timestamp or ISO 8601 (default: whole track)")
+):
+    """Recent track of a controller, oldest first"""
+    try:
+        start = parse_time(since) if since else None
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": f"Invalid time: {e}"}, status_code=400)
+    controller = controller.upper()
+    version, points = await run_blocking(gps_call, "track", controller, start)
+    return cached_response(request, ("gps_track", controller, start), version,
+                           lambda: render_json({"success": True, "controller": controller, "points": points}))
+
+
+@app.get("/api/gps/events")
+async def get_gps_events(
+    request: Request,
+    controller: Optional[str] = Query(None, description="Controller unique_id (default: all)"),
+    kind: Optional[str] = Query(None, description="moving, stopped, geofence_exit or geofence_enter")
+):
+    """Recent movement and geofence events"""
+    controller = controller.upper() if controller else None
+    version, events = await run_blocking(gps_call, "recent_events", controller, kind)
+    return cached_response(request, ("gps_events", controller, kind), version,
+                           lambda: render_json({"success": True, "events": events}))
+
+
+# Service due-date forecasts and the fleet-wide due-soon heap, from the frame archive
+service_forecaster = None
+SERVICE_POLL_INTERVAL = 10.0
+service_polled = 0.0
+service_lock = threading.RLock()
+
+
+def poll_service():
+    """ServiceForecaster with the archive records appended since the last poll"""
+    global service_forecaster, service_polled
+    with service_lock:
+        if service_forecaster is None:
+            from service_forecast import ServiceForecaster
+            service_forecaster = ServiceForecaster().follow()
+            archive_fanout.add(service_forecaster.follower, service_lock)
+        now = time.monotonic()
+        if now - service_polled >= SERVICE_POLL_INTERVAL:
+            service_forecaster.poll()
+            service_polled = now
+        return service_forecaster
+
+
+def service_call(method: str, *args) -> tuple:
+    """(version, result) of a ServiceForecaster query, serialized with the archive polls"""
+    with service_lock:
+        forecaster = poll_service()
+        return forecaster.version, getattr(forecaster, method)(*args)
+
+
+@app.get("/api/service/due")
+async def get_service_due(
+    request: Request,
+    within_days: float = Query(30.0, ge=0, le=3650, description="Forecast horizon in days"),
+    limit: int = Query(100, ge=1, le=10000, description="Maximum intervals returned"),
+    controller: Optional[str] = Query(None, description="Controller unique_id: its forecast for every interval")
+):
+    """Service intervals due soonest across the fleet (overdue first), or one controller's forecast"""
+    # due_in_days moves with the clock
+    minute = int(time.time() // 60)
+    if controller is not None:
+        controller = controller.upper()
+        version, forecast = await run_blocking(service_call, "forecast", controller)
+        if forecast is None:
+            return JSONResponse({"success": False, "error": f"Unknown controller: {controller}"}, status_code=404)
+        return cached_response(request, ("service_forecast", controller), (version, minute),
+                               lambda: render_json({"success": True, **forecast}))
+
+    version, due = await run_blocking(service_call, "due_soon", within_days, limit)
+    return cached_response(request, ("service_due", within_days, limit), (version, minute),
+                           lambda: render_json({"success": True, "count": len(due), "due": due}))
+
+
+# Unbalance, loading and power factor histograms (load-duration curves), from the frame archive
+electrical_health = None
+ELECTRICAL_POLL_INTERVAL = 10.0
+electrical_polled = 0.0
+electrical_lock = threading.RLock()
+
+
+def poll_electrical():
+    """ElectricalHealth with the archive records appended since the last poll"""
+    global electrical_health, electrical_polled
+    with electrical_lock:
+        if electrical_health is None:
+            from electrical_health import ElectricalHealth
+            electrical_health = ElectricalHealth().follow()
+            archive_fanout.add(electrical_health.follower, electrical_lock)
+        now = time.monotonic()
+        if now - electrical_polled >= ELECTRICAL_POLL_INTERVAL:
+            electrical_health.poll()
+            electrical_polled = now
+        return electrical_health
+
+
+def electrical_call(method: str, *args) -> tuple:
+    """(version, result) of an ElectricalHealth report, serialized with the archive polls"""
+    with electrical_lock:
+        health = poll_electrical()
+        return health.version, getattr(health, method)(*args)
+
+
+@app.get("/api/load_profile")
+async def get_load_profile(
+    request: Request,
+    controller: Optional[str] = Query(None, description="Controller unique_id: its full histograms"),
+    days: int = Query(7, ge=1, le=7, description="Days covered, including today")
+):
+    """Load-duration curve, unbalance and power factor hours per controller (default: a summary of every one)"""
+    # the window moves with the day
+    day = int(time.time() // 86400)
+    if controller is not None:
+        controller = controller.upper()
+        version, profile = await run_blocking(electrical_call, "profile", controller, days)
+        if profile is None:
+            return JSONResponse({"success": False, "error": f"Unknown controller: {controller}"}, status_code=404)
+        return cached_response(request, ("load_profile", controller, days), (version, day),
+                               lambda: render_json({"success": True, "days": days, **profile}))
+
+    version, controllers = await run_blocking(electrical_call, "summary", days)
+    return cached_response(request, ("load_profile", None, days), (version, day),
+                           lambda: render_json({"success": True, "days": days, "controllers": controllers}))
+
+
+# Archive consumers that must keep up without requests (reports, events)
+archive_task: Optional[asyncio.Task] = None
+ARCHIVE_POLL_INTERVAL = 1.0
+
+
+async def follow_archive():
+    """Book new archive records into the energy reports, GPS tracker, service forecasts, load profiles, waveforms
+    and the fleet matrix; the consumers are created on the first pass and fed from the next one"""
+    while True:
+        for poll in (archive_fanout.poll, poll_energy, poll_gps, poll_service, poll_electrical, poll_waveforms,
+                     poll_fleet):
+            try:
+                await run_blocking(poll)
+            except Exception as e:
+                print(f"Archive follower: {e}")
+        await asyncio.sleep(ARCHIVE_POLL_INTERVAL)
 
 
 @app.on_event("startup")
 async def startup_event():
     """Ensure data directory exists on startup"""
+    global archive_task
     DATA_DIR.mkdir(exist_ok=True)
+    archive_task = asyncio.create_task(follow_archive())
+    
+    if ingest_engine is not None:
+        await run_blocking(ingest_engine.warm_up)
+        await ingest_engine.start_async()
+        return
     
     # Start listener if not running
-    if not is_listener_running():
-        start_listener()
+    if not await is_listener_running():
+        await start_listener()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     global listener_process
+    if archive_task is not None:
+        archive_task.cancel()
+    if energy_accounting is not None:
+        await run_blocking(energy_accounting.flush)
+    if service_forecaster is not None:
+        await run_blocking(service_forecaster.flush)
+    if electrical_health is not None:
+        await run_blocking(electrical_health.flush)
+    if ingest_engine is not None:
+        await ingest_engine.stop_async()
     if listener_process and listener_process.poll() is None:
         listener_process.terminate()
-        listener_process.wait(timeout=5)
+        await run_blocking(listener_process.wait, 5)
+    io_executor.shutdown(wait=False)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=API_HOST, port=API_PORT, log_level="info")
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Datakom D500 MK3 REST API")
+    parser.add_argument("--combined", action="store_true",
+                        help="Run the TCP listener in this process, on the API event loop")
+    args = parser.parse_args()
+    
+    profiler = None
+    if args.combined:
+        import profiling
+        from datakom_listener import IngestEngine
+        
+        use_ingest_engine(IngestEngine().start().load_snapshots())
+        # Opt-in profiling: DATAKOM_PROFILE env var or SIGUSR1, reports in logs/
+        profiler = profiling.install()
+    try:
+        uvicorn.run(app, host=API_HOST, port=API_PORT, log_level="info")
+    finally:
+        if profiler:
+            profiler.stop()
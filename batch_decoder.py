@@ -0,0 +1,356 @@
+"""
+Columnar batch decoder for offline analytics
+Decodes a stack of equal-length telemetry frames - a 2-D uint8 array, one
+frame per row - into one NumPy column per decode_telemetry key. Every field is
+a strided view over the frame rows (no per-frame Python work), scaled in one
+vectorized operation:
+
+    frames = stack_frames([frame_1, frame_2, ...])     # or archive_frames(path)
+    columns = decode_frames(frames)
+    columns["genset_L1_V"]          # float64, one value per frame
+    columns["generator_name"]       # bytes (S32) per frame
+
+Conventions against decode_telemetry:
+    "N/A" / None              -> NaN
+    integer fields (scale 1)  -> unsigned integer views into the frames
+    text / hex fields         -> fixed-width bytes (.hex() / .decode() per value);
+                                 omitted when the frame is too short for them
+    alarm bit words           -> 2-D column (frames x words)
+Alerts, mode/state names and the structure-template fields are left to
+decode_telemetry, datakom_constants and decode_template respectively.
+"""
+
+import os
+
+import numpy as np
+
+from frame_archive import RECORD_HEADER, SegmentIndex
+
+NAN = float("nan")
+
+# Fields read by decode_telemetry for every frame
+# key, offset, width, scale, na_below (frames shorter than this read as N/A)
+FIELDS = (
+    ("gps_altitude", 10598, 4, 1, 10601),
+    ("multi_genset_total_active_power", 11175, 2, 1, 11178),
+    ("multi_genset_total_reactive_power", 11177, 2, 1, 11180),
+    ("multi_genset_avg_active_power_load_percent", 11374, 2, 1, 11377),
+    ("multi_genset_avg_reactive_power_load_percent", 11375, 2, 1, 11378),
+    ("multi_genset_avg_power_factor", 11376, 2, 1, 11379),
+    ("multi_genset_speed_correction_percent", 11377, 2, 1, 11380),
+    ("multi_genset_voltage_correction_percent", 11378, 2, 1, 11381),
+    ("battery_charge_current_1", 11173, 2, 1, 11176),
+    ("battery_charge_current_2", 11175, 2, 1, 11178),
+    ("min_battery_voltage", 11172, 2, 100, 11175),
+    ("flowmeter", 11680, 2, 10, 11683),
+    ("selected_channel_harmonic_scopemeter", 10403, 2, 1, 10406),
+    ("magnetic_pickup_input_rpm", 10375, 2, 1, 10378),
+    ("engine_operation_timer", 10606, 2, 1, 10609),
+    ("gov_control_output_percent", 10607, 2, 1, 10611),
+    ("avr_control_output_percent", 10609, 2, 1, 10611),
+    ("device_hw_version", 10610, 2, 1, 10613),
+    ("device_sw_version", 10612, 2, 1, 10615),
+    ("latitude", 45, 4, 1000000, 53),
+    ("longitude", 49, 4, 1000000, 53),
+    ("mode", 103, 1, 1, 0),
+    ("state", 105, 1, 1, 0),
+    ("runtime_counter_minutes", 99, 2, 1, 0),
+    ("genset_L1_V", 181, 2, 10, 0),
+    ("genset_L2_V", 185, 2, 10, 0),
+    ("genset_L3_V", 189, 2, 10, 0),
+    ("genset_I1_A", 193, 2, 10, 0),
+    ("genset_I2_A", 197, 2, 10, 0),
+    ("genset_I3_A", 201, 2, 10, 0),
+    ("genset_L1_L2_V", 205, 2, 10, 0),
+    ("genset_L2_L3_V", 209, 2, 10, 0),
+    ("genset_L3_L1_V", 213, 2, 10, 0),
+    ("genset_P_total_kW", 217, 2, 10, 0),
+    ("genset_S_total_kVA", 225, 2, 10, 0),
+    ("genset_freq_Hz", 231, 2, 100, 0),
+    ("mains_L1_V", 125, 2, 10, 136),
+    ("mains_L2_V", 129, 2, 10, 136),
+    ("mains_L3_V", 133, 2, 10, 136),
+    ("mains_I1_A", 137, 2, 10, 148),
+    ("mains_I2_A", 141, 2, 10, 148),
+    ("mains_I3_A", 145, 2, 10, 148),
+    ("mains_L1_L2_V", 149, 2, 10, 160),
+    ("mains_L2_L3_V", 153, 2, 10, 160),
+    ("mains_L3_L1_V", 157, 2, 10, 160),
+    ("mains_P_total_kW", 161, 2, 10, 172),
+    ("mains_Q_total_kVAr", 165, 2, 10, 172),
+    ("mains_S_total_kVA", 169, 2, 10, 172),
+    ("mains_freq_Hz", 175, 2, 100, 178),
+    ("engine_rpm", 237, 2, 1, 0),
+    ("battery_voltage_Vdc", 239, 2, 100, 0),
+    ("charge_voltage", 241, 2, 100, 244),
+    ("oil_pressure_bar", 243, 2, 10, 0),
+    ("coolant_temp_C", 245, 2, 10, 0),
+    ("fuel_level_percent", 247, 2, 10, 0),
+    ("oil_temp", 249, 2, 10, 252),
+    ("canopy_temp", 251, 2, 10, 254),
+)
+
+# Fields decode_telemetry only reads from frames longer than present_above
+# key, offset, width, scale, present_above (later entries override earlier keys)
+OPTIONAL_FIELDS = (
+    ("latitude", 10002, 4, 1000000, 10006),
+    ("longitude", 10006, 4, 1000000, 10010),
+    ("genset_starts_count", 503, 2, 1, 504),
+    ("reactive_energy_inductive", 507, 4, 10, 510),
+    ("engine_run_hours_total", 511, 2, 100, 512),
+    ("hours_to_service_1", 515, 2, 100, 516),
+    ("days_to_service_1", 519, 4, 100, 522),
+    ("hours_to_service_2", 523, 2, 100, 524),
+    ("days_to_service_2", 527, 4, 100, 528),
+    ("hours_to_service_3", 531, 2, 100, 532),
+    ("days_to_service_3", 535, 4, 100, 536),
+    ("total_kWh", 539, 4, 10, 542),
+    ("genset_cranks_count", 543, 2, 1, 544),
+    ("reactive_energy_capacitive", 547, 2, 10, 548),
+    ("engine_power_rate_percent", 553, 2, 1, 554),
+    ("battery_voltage_2_Vdc", 555, 2, 100, 557),
+    ("mains_total_kWh", 561, 4, 10, 565),
+    ("mains_total_kVArh_ind", 565, 4, 10, 569),
+    ("mains_total_kVArh_cap", 569, 4, 10, 573),
+    ("mains_total_export_kWh", 573, 4, 10, 577),
+    ("fuel_consumption_flowm", 577, 4, 10, 581),
+    ("fuel_tank_capacity_liters", 585, 2, 1, 587),
+    ("fuel_percent", 587, 2, 1, 589),
+    ("satellites", 589, 1, 1, 590),
+    ("fuel_consumption_ecu", 598, 4, 10, 602),
+    ("min_battery_voltage", 602, 2, 100, 604),
+    ("battery_group_voltage", 604, 2, 100, 606),
+    ("battery_group_current", 606, 2, 10, 608),
+    ("discharge_current_counter", 608, 4, 1, 612),
+    ("fuel_rate_flowm", 612, 2, 10, 614),
+    ("fuel_rate_ecu", 614, 2, 10, 616),
+    ("alternator_voltage", 616, 2, 100, 618),
+    ("load_battery_voltage", 618, 2, 100, 620),
+    ("dc_actual_current", 620, 2, 10, 622),
+    ("dc_battery_temp", 622, 2, 10, 624),
+    ("dc_charge_state", 624, 2, 1, 626),
+)
+
+# 4-byte service counters, 0xFFFFFFFF / 0xFFFFFFFE (or anything scaling past 42949651) = empty
+# key, offset, scale
+SERVICE_COUNTERS = (
+    ("engine_hours_run", 10622, 100),
+    ("engine_hours_since_last_service", 10624, 100),
+    ("engine_days_since_last_service", 10626, 100),
+    ("genset_total_active_energy", 10628, 10),
+    ("genset_total_inductive_reactive_energy", 10630, 10),
+    ("genset_total_capacitive_reactive_energy", 10632, 10),
+    ("remaining_engine_hours_to_service_1", 10634, 100),
+    ("remaining_engine_days_to_service_1", 10636, 100),
+    ("remaining_engine_hours_to_service_2", 10638, 100),
+    ("remaining_engine_days_to_service_2", 10640, 100),
+    ("remaining_engine_hours_to_service_3", 10642, 100),
+    ("remaining_engine_days_to_service_3", 10644, 100),
+)
+SERVICE_COUNTER_EMPTY = 42949651
+
+# Raw bytes of text/hex/IP fields
+# key, start, end, na_below
+BYTE_FIELDS = (
+    ("ethernet_mac", 11684, 11687, 11687),
+    ("controller_unique_id", 11687, 11693, 11693),
+    ("modem_imei", 11693, 11701, 11701),
+    ("gprs_ip", 10646, 10650, 10651),
+    ("extension_digital_input_status", 11167, 11169, 11170),
+    ("extension_digital_output_status", 11164, 11167, 11168),
+    ("function_flags", 11555, 11559, 11560),
+    ("header", 0, 8, 0),
+    ("protocol_info", 8, 16, 0),
+    ("unique_id", 21, 33, 0),
+    ("lan_ip", 37, 41, 0),
+    ("wan_ip", 33, 37, 37),
+    ("generator_name", 56, 88, 0),
+    ("mac_address", 592, 598, 598),
+)
+
+# Temperatures reading 0x7FFF are not connected
+DISCONNECTED_TEMPERATURE = 32767
+
+# Repeated 2-byte fields of extended frames: key template, offset, first number, count, scale
+HARMONICS = ("harmonic_{:02}_level", 10386, 3, 29, 100)
+SCOPEMETER = ("scopemeter_point_{}", 10404, 1, 100, 1)
+ALARM_WORDS = (("shutdown_bits", 10504), ("loaddump_bits", 10520), ("warning_bits", 10536))
+ALARM_WORD_COUNT = 16
+
+
+def stack_frames(frames) -> np.ndarray:
+    """2-D uint8 array from a sequence of equal-length frames (bytes)"""
+    frames = list(frames)
+    if not frames:
+        return np.zeros((0, 0), dtype=np.uint8)
+    size = len(frames[0])
+    if any(len(frame) != size for frame in frames):
+        raise ValueError("Frames must have equal length (group them by length first)")
+    return np.frombuffer(b"".join(frames), dtype=np.uint8).reshape(len(frames), size)
+
+
+def field_view(frames: np.ndarray, offset: int, width: int, signed: bool = False,
+               big_endian: bool = False) -> np.ndarray:
+    """Integer field of every frame as a strided view (no copy)"""
+    if width == 1:
+        column = frames[:, offset]
+        return column.view(np.int8) if signed else column
+    dtype = np.dtype(f"{'>' if big_endian else '<'}{'i' if signed else 'u'}{width}")
+    return frames[:, offset:offset + width].view(dtype)[:, 0]
+
+
+def _scaled(raw: np.ndarray, scale: int) -> np.ndarray:
+    return raw if scale == 1 else raw / scale
+
+
+def _na(count: int) -> np.ndarray:
+    return np.full(count, NAN)
+
+
+def decode_frames(frames: np.ndarray) -> dict:
+    """
+    Decode a (frames x frame_size) uint8 array into {key: column}
+
+    Args:
+        frames: Equal-length telemetry frames, one per row; rows may be strided
+                (e.g. records of a memory-mapped archive segment)
+
+    Returns:
+        Column per decode_telemetry key; integer columns are views into frames
+    """
+    frames = np.asarray(frames, dtype=np.uint8)
+    if frames.ndim != 2:
+        raise ValueError("frames must be a 2-D uint8 array")
+    count, size = frames.shape
+    if size < 300:
+        raise ValueError(f"Packet too short: {size} bytes")
+
+    columns = {}
+
+    # Extended frames: harmonic levels, scopemeter, alarm words
+    for template, offset, first, total, scale in (HARMONICS, SCOPEMETER):
+        present = min(total, max(0, (size - offset - 1) // 2))
+        if present:
+            block = frames[:, offset:offset + present * 2].view("<u2")
+            block = _scaled(block, scale)
+            for i in range(present):
+                columns[template.format(first + i)] = block[:, i]
+    for key, offset in ALARM_WORDS:
+        present = min(ALARM_WORD_COUNT, max(0, (size - offset - 1) // 2))
+        columns[key] = frames[:, offset:offset + present * 2].view("<u2")
+
+    for key, offset, width, scale, na_below in FIELDS:
+        if size < na_below or offset + width > size:
+            columns[key] = _na(count)
+        else:
+            columns[key] = _scaled(field_view(frames, offset, width), scale)
+
+    for key, offset, scale in SERVICE_COUNTERS:
+        if size > offset + 4:
+            value = field_view(frames, offset, 4) / scale
+            columns[key] = np.where(value >= SERVICE_COUNTER_EMPTY, NAN, value)
+
+    for key, start, end, na_below in BYTE_FIELDS:
+        if size >= max(na_below, end):
+            columns[key] = frames[:, start:end].view(f"S{end - start}")[:, 0]
+
+    columns["modbus_port"] = field_view(frames, 18, 2, big_endian=True)
+    columns["runtime_hours"] = np.round(columns["runtime_counter_minutes"] / 60, 2)
+    for key, offset in (("oil_temp", 249), ("canopy_temp", 251)):
+        raw = field_view(frames, offset, 2)
+        columns[key] = np.where(raw == DISCONNECTED_TEMPERATURE, NAN, columns[key])
+
+    for key, offset, width, scale, present_above in OPTIONAL_FIELDS:
+        if size > present_above:
+            columns[key] = _scaled(field_view(frames, offset, width), scale)
+
+    if "fuel_tank_capacity_liters" in columns:
+        # Current liters from tank capacity and level, as decode_telemetry does
+        columns["fuel_status_liters"] = np.round(
+            columns["fuel_tank_capacity_liters"] * (columns["fuel_level_percent"] / 100.0), 1)
+
+    return columns
+
+
+def decode_template(frames: np.ndarray, layout: dict = None) -> dict:
+    """
+    Decode every numeric register of structure/DK0ED500.json into {bus_adr: column}
+
+    Args:
+        frames: As for decode_frames
+        layout: {bus_adr: (width, divisor, signed)} (default: simulator.load_layout())
+    """
+    if layout is None:
+        from simulator import load_layout
+        _, layout = load_layout()
+    frames = np.asarray(frames, dtype=np.uint8)
+    size = frames.shape[1]
+    return {
+        bus_adr: _scaled(field_view(frames, bus_adr, width, signed), divisor)
+        for bus_adr, (width, divisor, signed) in layout.items()
+        if bus_adr + width <= size
+    }
+
+
+def _segment_groups(path: str) -> tuple:
+    """
+    (data, {frame_size: (timestamps, record data starts or None, frames or None)}) of one segment
+
+    A segment whose records all have the same length comes back as strided views over
+    the memory-mapped file (frames set); otherwise only where each group's frames start.
+    """
+    if os.path.getsize(path) < RECORD_HEADER.size:
+        return None, {}
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    size = int(data[:4].view("<u4")[0])
+    record = RECORD_HEADER.size + size
+    count = len(data) // record
+    if count:
+        records = data[:count * record].reshape(count, record)
+        lengths = records[:, :4].view("<u4")[:, 0]
+        if (lengths == size).all() and len(data) - count * record < RECORD_HEADER.size:
+            return data, {size: (records[:, 4:12].view("<f8")[:, 0], None, records[:, RECORD_HEADER.size:])}
+
+    index = SegmentIndex(path)
+    index.update()
+    offsets = np.frombuffer(index.offsets, dtype=np.uint64).astype(np.int64)
+    headers = np.ascontiguousarray(data[offsets[:, None] + np.arange(RECORD_HEADER.size)])
+    lengths = headers[:, :4].view("<u4")[:, 0]
+    timestamps = headers[:, 4:12].view("<f8")[:, 0]
+    return data, {int(length): (timestamps[lengths == length], offsets[lengths == length] + RECORD_HEADER.size, None)
+                  for length in np.unique(lengths)}
+
+
+def _gather(data: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+    return data[starts[:, None] + np.arange(size)]
+
+
+def archive_frames(path: str) -> dict:
+    """
+    Frames of one archive segment grouped by length: {frame_size: (timestamps, frames)}
+
+    A segment whose records all have the same length is memory-mapped and
+    returned as strided views (no copy); mixed lengths are gathered per length
+    (see iter_archive_frames to bound memory).
+    """
+    data, groups = _segment_groups(path)
+    return {size: (timestamps, frames if starts is None else _gather(data, starts, size))
+            for size, (timestamps, starts, frames) in groups.items()}
+
+
+def iter_archive_frames(path: str, chunk_frames: int):
+    """
+    Frames of one archive segment in chunks: yields (frame_size, timestamps, frames)
+    of at most chunk_frames frames, in archive order per frame size. Mixed-length
+    segments are gathered one chunk at a time.
+    """
+    data, groups = _segment_groups(path)
+    for size, (timestamps, starts, frames) in groups.items():
+        for first in range(0, len(timestamps), chunk_frames):
+            chunk = slice(first, first + chunk_frames)
+            yield size, timestamps[chunk], frames[chunk] if starts is None else _gather(data, starts[chunk], size)
+
+
+def segment_sizes(path: str) -> dict:
+    """{frame_size: frames} of one archive segment, from the record headers only"""
+    return {size: len(timestamps) for size, (timestamps, _, _) in _segment_groups(path)[1].items()}
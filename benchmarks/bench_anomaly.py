@@ -0,0 +1,90 @@
+"""
+Anomaly detector cost relative to decoding, across fleet sizes
+Frames of N simulated controllers (round robin, SAMPLES_PER_CONTROLLER frames
+each) are decoded once; then decode_telemetry and AnomalyDetector.update are
+timed over the same frames. The detector's state size is measured with
+tracemalloc in a separate, untimed pass.
+
+    overhead = detector time / decode time
+
+Usage:
+    python benchmarks/bench_anomaly.py --controllers 10 100 1000
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from common import ROOT_DIR  # noqa: F401  (puts the project on sys.path)
+
+
+def fleet_frames(controllers: int, samples: int, interval: float = 10.0) -> list:
+    """(timestamp, frame) of every controller in turn"""
+    from simulator import ControllerModel, FrameSynthesizer
+
+    synthesizer = FrameSynthesizer()
+    models = [ControllerModel(i, random.Random(i)) for i in range(controllers)]
+    frames = []
+    for sample in range(samples):
+        for model in models:
+            model.step(interval)
+            frames.append((sample * interval, synthesizer.frame(model)))
+    return frames
+
+
+def run_fleet(controllers: int, samples: int) -> dict:
+    from anomaly_detector import AnomalyDetector
+    from decoder import decode_telemetry
+
+    frames = fleet_frames(controllers, samples)
+
+    started = time.perf_counter()
+    decoded = [(ts, decode_telemetry(frame)) for ts, frame in frames]
+    decode_s = time.perf_counter() - started
+
+    detector = AnomalyDetector()
+    events = 0
+    started = time.perf_counter()
+    for ts, telemetry in decoded:
+        events += len(detector.update(telemetry["unique_id"]["value"], telemetry, ts))
+    detect_s = time.perf_counter() - started
+
+    # Same run again under tracemalloc (which slows it down) for the state size
+    tracemalloc.start()
+    detector = AnomalyDetector()
+    for ts, telemetry in decoded:
+        detector.update(telemetry["unique_id"]["value"], telemetry, ts)
+    state_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        "controllers": controllers,
+        "frames": len(frames),
+        "decode_us_per_frame": round(decode_s / len(frames) * 1e6, 1),
+        "detect_us_per_frame": round(detect_s / len(frames) * 1e6, 1),
+        "detect_frames_per_s": round(len(frames) / detect_s),
+        "overhead_percent": round(detect_s / decode_s * 100, 1),
+        "state_bytes_per_controller": round(state_bytes / controllers),
+        "events": events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anomaly detector throughput benchmark")
+    parser.add_argument("--controllers", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--samples", type=int, default=50, help="Frames per controller")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [run_fleet(controllers, args.samples) for controllers in args.controllers]
+    result = {"runs": runs}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Concurrency benchmark for the REST API
+Starts api_server under uvicorn in a child process and runs N concurrent HTTP
+clients against an endpoint. The server measures its own event loop lag, so a
+handler that blocks on disk or sockets shows up as lag. With --disk-delay
+every telemetry file read is slowed down and the file keeps changing, to show
+that slow disk I/O no longer stalls concurrent requests.
+
+Usage:
+    python benchmarks/bench_api_concurrency.py --clients 500 --requests 10
+    python benchmarks/bench_api_concurrency.py --disk-delay 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+from common import percentile, touch, write_data_dir
+
+
+def free_port() -> int:
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# -----------------------------------------------------------------------------
+# Server side (child process)
+# -----------------------------------------------------------------------------
+async def monitor_loop_lag(interval: float, lags: list):
+    """Record how late the event loop wakes up a periodic timer"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def keep_touching(path: Path, interval: float):
+    """Make the file look new so the API keeps reloading it"""
+    while True:
+        touch(path)
+        await asyncio.sleep(interval)
+
+
+def serve(args):
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    import uvicorn
+    import api_server
+
+    os.chdir(args.data_root)
+    lags = []
+    tasks = []
+
+    if args.disk_delay:
+        slow_loader = api_server.telemetry_cache.loader
+
+        def delayed_loader():
+            time.sleep(args.disk_delay)
+            return slow_loader()
+
+        api_server.telemetry_cache.loader = delayed_loader
+
+    @api_server.app.on_event("startup")
+    async def start_monitors():
+        tasks.append(asyncio.create_task(monitor_loop_lag(0.005, lags)))
+        if args.disk_delay:
+            tasks.append(asyncio.create_task(
+                keep_touching(Path("data") / "telemetry.json", api_server.CACHE_TTL / 2)))
+
+    @api_server.app.on_event("shutdown")
+    async def write_lag_report():
+        for task in tasks:
+            task.cancel()
+        with open(args.lag_output, "w", encoding="utf-8") as f:
+            json.dump(lags, f)
+
+    uvicorn.run(api_server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# -----------------------------------------------------------------------------
+# Client side
+# -----------------------------------------------------------------------------
+async def wait_ready(client, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API server did not start")
+
+
+async def load(args, base_url: str) -> dict:
+    import httpx
+
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_ready(client)
+        await client.get(args.endpoint)  # warm up caches
+
+        async def client_task():
+            nonlocal errors
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                response = await client.get(args.endpoint)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_task() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+
+    total = args.clients * args.requests
+    return {
+        "endpoint": args.endpoint,
+        "clients": args.clients,
+        "requests": total,
+        "errors": errors,
+        "disk_delay_s": args.disk_delay,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+    }
+
+
+def run_client(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        write_data_dir(Path(tmp))
+        port = free_port()
+        lag_output = Path(tmp) / "loop_lag.json"
+        command = [
+            sys.executable, os.path.abspath(__file__), "--serve",
+            "--port", str(port), "--data-root", tmp,
+            "--lag-output", str(lag_output), "--disk-delay", str(args.disk_delay),
+        ]
+        server = subprocess.Popen(command)
+        try:
+            result = asyncio.run(load(args, f"http://127.0.0.1:{port}"))
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=30)
+
+        lags = json.loads(lag_output.read_text()) if lag_output.exists() else []
+        result["loop_lag_ms"] = {
+            "p50": round(percentile(lags, 50) * 1000, 2),
+            "p99": round(percentile(lags, 99) * 1000, 2),
+            "max": round(max(lags, default=0.0) * 1000, 2),
+        }
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API concurrency benchmark")
+    parser.add_argument("--endpoint", default="/api/dump_devm?language=uk")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=10, help="Requests per client")
+    parser.add_argument("--disk-delay", type=float, default=0.0, help="Seconds added to every telemetry file read")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    # Internal: child server process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--data-root", help=argparse.SUPPRESS)
+    parser.add_argument("--lag-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    result = run_client(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Listener cold-start time
+Each round runs in a fresh interpreter and measures:
+    import_ms          - import datakom_listener
+    start_ms           - IngestEngine(...).start(): directories, blocklist, health, bind
+    first_ack_ms       - start -> ack of the first telemetry frame
+    first_persist_ms   - start -> first frame decoded and persisted (lazy decoder import)
+    process_ready_ms   - spawn `python datakom_listener.py` -> port accepts connections
+                         (what api_server.start_listener waits for)
+
+Usage:
+    python benchmarks/bench_cold_start.py --rounds 10
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT_DIR
+
+CHILD = r"""
+import json, socket, sys, threading, time
+started = time.perf_counter()
+import datakom_listener
+imported = time.perf_counter()
+engine = datakom_listener.IngestEngine(host="127.0.0.1", port=0).start()
+ready = time.perf_counter()
+thread = threading.Thread(target=engine.serve_forever, daemon=True)
+thread.start()
+
+frame = bytes.fromhex(sys.argv[1])
+client = socket.create_connection(engine.address)
+client.sendall(frame)
+client.recv(8)
+acked = time.perf_counter()
+while engine.telemetry_counter == 0:
+    time.sleep(0.0005)
+persisted = time.perf_counter()
+client.close()
+engine.stop()
+thread.join()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "start_ms": (ready - imported) * 1000,
+    "first_ack_ms": (acked - imported) * 1000,
+    "first_persist_ms": (persisted - imported) * 1000,
+}))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def in_process_round(frame: bytes, env: dict) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        output = subprocess.run([sys.executable, "-c", CHILD, frame.hex()], cwd=tmp, env=env,
+                                capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def process_round(env: dict) -> float:
+    """Spawn the standalone listener and wait until its port accepts connections"""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Own port, so a running listener is not disturbed
+        child_env = dict(env, DATAKOM_LISTENER_PORT=str(port))
+
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "datakom_listener.py")], cwd=tmp,
+                                   env=child_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                    break
+                except OSError:
+                    if process.poll() is not None:
+                        raise RuntimeError("listener exited during startup")
+                    time.sleep(0.001)
+            return (time.perf_counter() - started) * 1000
+        finally:
+            process.terminate()
+            process.wait(5)
+
+
+def summarize(values: list) -> dict:
+    return {
+        "median": round(statistics.median(values), 2),
+        "min": round(min(values), 2),
+        "max": round(max(values), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Listener cold-start benchmark")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import random
+    from simulator import ControllerModel, FrameSynthesizer
+    frame = FrameSynthesizer().frame(ControllerModel(1, random.Random(1)))
+
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    rounds = [in_process_round(frame, env) for _ in range(args.rounds)]
+    result = {key: summarize([r[key] for r in rounds]) for key in rounds[0]}
+    result["process_ready_ms"] = summarize([process_round(env) for _ in range(args.rounds)])
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+CPU cost per request: pre-compressed cache vs on-the-fly compression
+Compares api_server (body rendered and gzip-compressed once per snapshot
+version) with the same payload rendered per request and compressed by
+Starlette's GZipMiddleware, both driven in-process through an ASGI client.
+
+Usage:
+    python benchmarks/bench_compression.py --requests 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from common import write_data_dir
+
+
+def middleware_app():
+    """Baseline: render per request, compress per request"""
+    from fastapi import FastAPI
+    from fastapi.middleware.gzip import GZipMiddleware
+    import api_server
+
+    app = FastAPI()
+    app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=6)
+
+    @app.get("/api/dump_devm")
+    async def get_parameters(language: str = None):
+        telemetry = await api_server.telemetry_cache.get()
+        return {
+            "success": True,
+            "result": api_server.telemetry_to_params(telemetry, language),
+            "cached": True,
+            "timestamp": telemetry.get("timestamp"),
+        }
+
+    return app
+
+
+async def measure(app, path: str, requests: int, encoding: str) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Accept-Encoding": encoding}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get(path, headers=headers)  # warm up
+        wire_size = int(response.headers["content-length"])
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for _ in range(requests):
+            await client.get(path, headers=headers)
+        cpu = time.process_time() - cpu_started
+        elapsed = time.perf_counter() - started
+    return {
+        "cpu_us_per_request": round(cpu / requests * 1e6, 1),
+        "wall_us_per_request": round(elapsed / requests * 1e6, 1),
+        "wire_bytes": wire_size,
+        "content_encoding": response.headers.get("content-encoding", "identity"),
+    }
+
+
+async def run(args) -> dict:
+    import api_server
+
+    path = f"/api/dump_devm?language={args.language}"
+    results = {}
+    for encoding in ("gzip", "identity"):
+        results[f"middleware_{encoding}"] = await measure(middleware_app(), path, args.requests, encoding)
+        results[f"precompressed_{encoding}"] = await measure(api_server.app, path, args.requests, encoding)
+    results["cache"] = {"hits": api_server.response_cache.hits, "misses": api_server.response_cache.misses}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response compression benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--language", default="uk")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_data_dir(Path(tmp))
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            result = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
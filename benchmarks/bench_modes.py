@@ -0,0 +1,191 @@
+"""
+Two-process vs combined deployment
+Runs the same workload against both ways of deploying the service:
+    two-process - datakom_listener.py + api_server.py, API re-reads the JSON files
+    combined    - api_server.py --combined, listener on the API event loop and
+                  handlers reading its in-memory state
+
+and reports per mode:
+    staleness_ms    - frame acknowledged -> API returns its timestamp (idle system)
+    api_latency_ms  - /api/dump_devm latency while the simulator fleet streams frames
+    ack_latency_ms  - simulator ack latency under the same load
+    rss_mb          - resident memory of all service processes after the load
+
+Usage:
+    python benchmarks/bench_modes.py --sessions 50 --duration 20 --clients 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT_DIR, percentile
+
+ENDPOINT = "/api/dump_devm?id=1"
+MODES = ("two-process", "combined")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def latency_summary(values: list) -> dict:
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "max": round(max(values, default=0.0) * 1000, 2),
+    }
+
+
+def spawn_services(mode: str, cwd: str, listener_port: int, api_port: int) -> list:
+    env = dict(os.environ, DATAKOM_LISTENER_PORT=str(listener_port), DATAKOM_API_PORT=str(api_port))
+    api_command = [sys.executable, os.path.join(ROOT_DIR, "api_server.py")]
+    processes = []
+    if mode == "combined":
+        api_command.append("--combined")
+    else:
+        # PM2 layout: the listener runs on its own, the API finds it via health.json
+        processes.append(subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "datakom_listener.py")],
+                                          cwd=cwd, env=env, stdout=subprocess.DEVNULL))
+        wait_port(listener_port)
+    processes.append(subprocess.Popen(api_command, cwd=cwd, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    wait_port(api_port)
+    wait_port(listener_port)
+    return processes
+
+
+def wait_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"port {port} did not open")
+
+
+def rss_mb(processes: list) -> float:
+    import psutil
+
+    total = 0
+    for process in processes:
+        total += psutil.Process(process.pid).memory_info().rss
+    return round(total / 1e6, 1)
+
+
+async def measure_staleness(client, listener_port: int, frames: list) -> list:
+    """Send frames one by one; time from ack until the API shows the new snapshot"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", listener_port)
+    previous = (await client.get(ENDPOINT)).json().get("timestamp")
+    samples = []
+    try:
+        for frame in frames:
+            writer.write(frame)
+            await writer.drain()
+            await reader.readexactly(8)
+            acked = time.perf_counter()
+            while True:
+                timestamp = (await client.get(ENDPOINT)).json().get("timestamp")
+                if timestamp != previous:
+                    break
+                await asyncio.sleep(0.002)
+            samples.append(time.perf_counter() - acked)
+            previous = timestamp
+    finally:
+        writer.close()
+    return samples
+
+
+async def api_load(client, clients: int, deadline: float) -> tuple:
+    latencies = []
+    errors = 0
+
+    async def client_task():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = await client.get(ENDPOINT)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    await asyncio.gather(*(client_task() for _ in range(clients)))
+    return latencies, errors
+
+
+async def run_mode(mode: str, args, frames: list) -> dict:
+    import httpx
+    import simulator
+
+    listener_port, api_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        processes = spawn_services(mode, tmp, listener_port, api_port)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{api_port}", timeout=30) as client:
+                staleness = await measure_staleness(client, listener_port, frames)
+
+                sim_args = argparse.Namespace(
+                    host="127.0.0.1", port=listener_port, sessions=args.sessions, duration=args.duration,
+                    telemetry_interval=args.telemetry_interval, keepalive_interval=1.0, event_rate=0.0,
+                    time_scale=1.0, frame_size=None, ramp=1.0, ack_timeout=10.0, reconnect=True, seed=1,
+                )
+                deadline = time.monotonic() + args.duration
+                fleet, (latencies, errors) = await asyncio.gather(
+                    simulator.run(sim_args), api_load(client, args.clients, deadline))
+            memory = rss_mb(processes)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(10)
+
+    return {
+        "staleness_ms": latency_summary(staleness),
+        "api_requests": len(latencies),
+        "api_errors": errors,
+        "api_latency_ms": latency_summary(latencies),
+        "acks_ok": fleet["acks_ok"],
+        "acks_bad": fleet["acks_bad"],
+        "ack_latency_ms": fleet["ack_latency_ms"],
+        "rss_mb": memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Two-process vs combined deployment benchmark")
+    parser.add_argument("--sessions", type=int, default=20, help="Simulated controllers during the load phase")
+    parser.add_argument("--duration", type=float, default=10.0, help="Load phase, seconds")
+    parser.add_argument("--telemetry-interval", type=float, default=1.0)
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent API clients during the load phase")
+    parser.add_argument("--probes", type=int, default=20, help="Frames sent for the staleness measurement")
+    parser.add_argument("--mode", choices=MODES, action="append", help="Only run this mode (repeatable)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    from simulator import ControllerModel, FrameSynthesizer
+    synthesizer = FrameSynthesizer()
+    model = ControllerModel(0, random.Random(1))
+    frames = []
+    for _ in range(args.probes):
+        model.step(5.0)
+        frames.append(synthesizer.frame(model))
+
+    result = {mode: asyncio.run(run_mode(mode, args, frames)) for mode in args.mode or MODES}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Ingest scaling from 1 to N worker processes
+For every worker count the listener (`datakom_listener.py --workers N`, N=1 is
+the single-process engine) is saturated by simulator processes sending
+telemetry back to back. Frames persisted per second are counted from the frame
+archive after a clean stop, so they include the coordinator's writes.
+
+    efficiency = frames_per_s(N) / (N * frames_per_s(1))
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 15
+"""
+
+import argparse
+import glob
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT_DIR
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"port {port} did not open")
+
+
+def count_archived(base_dir: str) -> int:
+    from frame_archive import iter_records
+    return sum(1 for path in glob.glob(os.path.join(base_dir, "packets", "archive", "*"))
+               for _ in iter_records(path))
+
+
+def run_workers(workers: int, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATAKOM_LISTENER_PORT=str(port))
+        listener = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "datakom_listener.py"),
+                                     "--workers", str(workers)],
+                                    cwd=tmp, env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_port(port)
+            time.sleep(1.0)  # every worker bound and warmed up
+
+            reports = [os.path.join(tmp, f"sim_{i}.json") for i in range(args.sim_processes)]
+            simulators = [
+                subprocess.Popen([
+                    sys.executable, os.path.join(ROOT_DIR, "simulator.py"), "--port", str(port),
+                    "--sessions", str(args.sessions), "--duration", str(args.duration),
+                    "--telemetry-interval", "0", "--keepalive-interval", "3600",
+                    "--ramp", "0.5", "--seed", str(i + 1), "--output", report,
+                ], stdout=subprocess.DEVNULL)
+                for i, report in enumerate(reports)
+            ]
+            for simulator in simulators:
+                simulator.wait()
+        finally:
+            listener.send_signal(signal.SIGINT)
+            listener.wait(60)
+
+        sims = []
+        for report in reports:
+            with open(report, encoding="utf-8") as f:
+                sims.append(json.load(f))
+        frames = count_archived(tmp)
+
+    duration = max(sim["duration_s"] for sim in sims)
+    return {
+        "workers": workers,
+        "frames": frames,
+        "frames_per_s": round(frames / duration, 1),
+        "acks_bad": sum(sim["acks_bad"] for sim in sims),
+        "ack_latency_p95_ms": max(sim["ack_latency_ms"]["p95"] for sim in sims),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process ingest scaling benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--sessions", type=int, default=16, help="Controller sessions per simulator process")
+    parser.add_argument("--sim-processes", type=int, default=2, help="Simulator processes generating load")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [run_workers(workers, args) for workers in args.workers]
+    baseline = next((run["frames_per_s"] for run in runs if run["workers"] == 1), None)
+    for run in runs:
+        if baseline:
+            run["speedup"] = round(run["frames_per_s"] / baseline, 2)
+            run["efficiency"] = round(run["speedup"] / run["workers"], 2)
+
+    result = {"cpu_count": os.cpu_count(), "runs": runs}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Shared helpers for benchmark scripts
+"""
+
+import json
+import os
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def sample_frame(size: int = 700, seed: int = 1) -> bytes:
+    """Telemetry-shaped frame with a valid header and plausible readings"""
+    rnd = random.Random(seed)
+    data = bytearray(rnd.getrandbits(8) for _ in range(size))
+    data[0:8] = b"DY0DD500"
+    data[103] = 1    # AUTO
+    data[105] = 13   # Master genset on load
+    for offset, value in ((181, 2301), (185, 2298), (189, 2305), (237, 1500),
+                          (239, 2710), (245, 823), (247, 640)):
+        data[offset:offset + 2] = value.to_bytes(2, "little")
+    return bytes(data)
+
+
+def write_data_dir(base_dir: Path, frame: bytes = None) -> Path:
+    """Populate base_dir/data with listener-style JSON files for the API"""
+    from decoder import decode_telemetry
+
+    data_dir = base_dir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    decoded = decode_telemetry(frame or sample_frame())
+    alerts = decoded.pop("_alerts_internal", {"shutDown": [], "warning": [], "loadDump": []})
+    decoded["timestamp"] = datetime.now().isoformat()
+    decoded["raw_packet_file"] = "pkt_benchmark.txt"
+    files = {
+        "telemetry.json": decoded,
+        "alerts.json": alerts,
+        "health.json": {"status": "ok", "connect_state": "Connected", "last_error": None},
+    }
+    for name, content in files.items():
+        with open(data_dir / name, "w", encoding="utf-8") as f:
+            json.dump(content, f, indent=2, ensure_ascii=False)
+    return data_dir
+
+
+def touch(path: Path):
+    """Bump mtime so file caches see a new version"""
+    os.utime(path, None)
@@ -0,0 +1,681 @@
+"""
+Micro- and macro-benchmark suite for the ingest/serve path
+Times packet classification, decoding, formatting, parameter conversion, the
+alarm helpers and the API endpoints (in-process ASGI client), stores the results
+as JSON and compares two result files or two git revisions.
+
+Usage:
+    python benchmarks/run_benchmarks.py run --output results.json
+    python benchmarks/run_benchmarks.py run --filter decode --repeats 9
+    python benchmarks/run_benchmarks.py compare base.json results.json --threshold 10
+    python benchmarks/run_benchmarks.py compare-revs HEAD~1 HEAD
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+from common import ROOT_DIR, write_data_dir
+
+BENCHMARKS = []
+
+
+def benchmark(name: str, ops: int = 1):
+    """
+    Register a benchmark setup function
+
+    The setup function returns the callable to time; ops is the number of
+    operations one call performs (results are reported per operation).
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup, ops))
+        return setup
+    return register
+
+
+_frames = {}
+
+# Long enough to carry harmonics and the scopemeter block
+EXTENDED_FRAME_SIZE = 11800
+
+
+def frame(frame_size: int = None) -> bytes:
+    """Simulated telemetry frame, built on first use (after --root is on sys.path)"""
+    if frame_size not in _frames:
+        import random
+        from simulator import ControllerModel, FrameSynthesizer
+
+        model = ControllerModel(1, random.Random(1))
+        model.running = True
+        model.step(60)
+        _frames[frame_size] = FrameSynthesizer(frame_size=frame_size).frame(model)
+    return _frames[frame_size]
+
+
+@benchmark("classify_packet.telemetry")
+def bench_classify_telemetry():
+    from packet_pipeline import classify_packet
+    data = frame()
+    return lambda: classify_packet(data)
+
+
+@benchmark("classify_packet.keepalive")
+def bench_classify_keepalive():
+    from packet_pipeline import classify_packet
+    data = frame()[:8]
+    return lambda: classify_packet(data)
+
+
+@benchmark("decode_telemetry")
+def bench_decode():
+    from decoder import decode_telemetry
+    data = frame()
+    return lambda: decode_telemetry(data)
+
+
+@benchmark("decode_telemetry.extended")
+def bench_decode_extended():
+    from decoder import decode_telemetry
+    data = frame(EXTENDED_FRAME_SIZE)
+    return lambda: decode_telemetry(data)
+
+
+BATCH_FRAMES = 1000
+
+
+def frame_batch(frame_size: int = None) -> list:
+    """BATCH_FRAMES frames of a few controllers over time"""
+    import random
+    from simulator import ControllerModel, FrameSynthesizer
+
+    synthesizer = FrameSynthesizer(frame_size=frame_size)
+    models = [ControllerModel(i, random.Random(i)) for i in range(10)]
+    batch = []
+    for i in range(BATCH_FRAMES):
+        model = models[i % len(models)]
+        model.step(60)
+        batch.append(synthesizer.frame(model))
+    return batch
+
+
+@benchmark("decode_batch.loop", ops=BATCH_FRAMES)
+def bench_decode_loop():
+    from decoder import decode_telemetry
+    batch = frame_batch()
+
+    def run():
+        for data in batch:
+            decode_telemetry(data)
+    return run
+
+
+@benchmark("decode_batch.numpy", ops=BATCH_FRAMES)
+def bench_decode_numpy():
+    from batch_decoder import decode_frames, stack_frames
+    frames = stack_frames(frame_batch())
+    return lambda: decode_frames(frames)
+
+
+@benchmark("decode_batch.loop.extended", ops=BATCH_FRAMES)
+def bench_decode_loop_extended():
+    from decoder import decode_telemetry
+    batch = frame_batch(EXTENDED_FRAME_SIZE)
+
+    def run():
+        for data in batch:
+            decode_telemetry(data)
+    return run
+
+
+@benchmark("decode_batch.numpy.extended", ops=BATCH_FRAMES)
+def bench_decode_numpy_extended():
+    from batch_decoder import decode_frames, stack_frames
+    frames = stack_frames(frame_batch(EXTENDED_FRAME_SIZE))
+    return lambda: decode_frames(frames)
+
+
+@benchmark("anomaly_detector.update", ops=BATCH_FRAMES)
+def bench_anomaly_update():
+    from anomaly_detector import AnomalyDetector
+    from decoder import decode_telemetry
+    decoded = [decode_telemetry(data) for data in frame_batch()]
+    detector = AnomalyDetector()
+    clock = [0.0]
+
+    def run():
+        for telemetry in decoded:
+            clock[0] += 1.0
+            detector.update(telemetry["unique_id"]["value"], telemetry, clock[0])
+    return run
+
+
+@benchmark("fuel_monitor.update", ops=BATCH_FRAMES)
+def bench_fuel_update():
+    from decoder import decode_telemetry
+    from fuel_monitor import FuelMonitor
+    decoded = [decode_telemetry(data) for data in frame_batch()]
+    monitor = FuelMonitor()
+    clock = [0.0]
+
+    def run():
+        for telemetry in decoded:
+            clock[0] += 1.0
+            monitor.update(telemetry["unique_id"]["value"], telemetry, clock[0])
+    return run
+
+
+@benchmark("power_quality.update", ops=BATCH_FRAMES)
+def bench_power_quality_update():
+    from decoder import decode_telemetry
+    from power_quality import PowerQualityMonitor
+    decoded = [decode_telemetry(data) for data in frame_batch(EXTENDED_FRAME_SIZE)]
+    monitor = PowerQualityMonitor()
+    clock = [0.0]
+
+    def run():
+        for telemetry in decoded:
+            clock[0] += 1.0
+            monitor.update(telemetry["unique_id"]["value"], telemetry, clock[0])
+    return run
+
+
+@benchmark("power_quality.waveform_metrics", ops=BATCH_FRAMES)
+def bench_waveform_metrics():
+    import numpy as np
+    from power_quality import waveform_metrics
+    samples = np.random.default_rng(0).integers(0, 65536, (BATCH_FRAMES, 100), dtype=np.uint16)
+    return lambda: waveform_metrics(samples)
+
+
+@benchmark("waveform_buffer.add_frame", ops=BATCH_FRAMES)
+def bench_waveform_add_frame():
+    from waveform_buffer import WaveformBuffer
+    batch = frame_batch(EXTENDED_FRAME_SIZE)
+    buffer = WaveformBuffer()
+
+    def run():
+        for i, data in enumerate(batch):
+            buffer.add_frame(float(i), data)
+    return run
+
+
+@benchmark("energy_accounting.add_frame", ops=BATCH_FRAMES)
+def bench_energy_add_frame():
+    from energy_accounting import EnergyAccounting
+    batch = frame_batch()
+    accounting = EnergyAccounting(report_dir=tempfile.mkdtemp())
+    clock = [0.0]
+
+    def run():
+        # 10 controllers, 60 s between frames of each: runs cross quarter, hour and day boundaries
+        for data in batch:
+            clock[0] += 6.0
+            accounting.add_frame(clock[0], data)
+    return run
+
+
+FLEET_CONTROLLERS = 5000
+
+
+@benchmark("gps_tracker.add_frame", ops=BATCH_FRAMES)
+def bench_gps_add_frame():
+    from gps_tracker import GpsTracker
+    batch = frame_batch()
+    tracker = GpsTracker(geofences_path=None)
+    clock = [0.0]
+
+    def run():
+        for data in batch:
+            clock[0] += 6.0
+            tracker.add_frame(clock[0], data)
+    return run
+
+
+@benchmark("gps_tracker.nearest")
+def bench_gps_nearest():
+    import random
+    from gps_tracker import GpsTracker
+    tracker = GpsTracker(geofences_path=None)
+    rnd = random.Random(0)
+    for i in range(FLEET_CONTROLLERS):
+        tracker.update(f"C{i}", rnd.uniform(44.0, 52.0), rnd.uniform(22.0, 40.0), 0.0)
+    return lambda: tracker.nearest(48.0, 30.0, 10)
+
+
+@benchmark("service_forecast.add_frame", ops=BATCH_FRAMES)
+def bench_service_add_frame():
+    from service_forecast import ServiceForecaster
+    batch = frame_batch()
+    forecaster = ServiceForecaster(state_path=os.devnull)
+    clock = [0.0]
+
+    def run():
+        for data in batch:
+            clock[0] += 6.0
+            forecaster.add_frame(clock[0], data)
+    return run
+
+
+@benchmark("service_forecast.due_soon")
+def bench_service_due_soon():
+    import random
+    from service_forecast import ServiceForecaster
+    forecaster = ServiceForecaster(state_path=os.devnull)
+    rnd = random.Random(0)
+    for i in range(FLEET_CONTROLLERS):
+        counters = {interval: (rnd.uniform(0, 250 * interval), rnd.uniform(0, 180 * interval))
+                    for interval in (1, 2, 3)}
+        forecaster.update(f"C{i}", None, counters, 0.0)
+    return lambda: forecaster.due_soon(30, 100, now=0.0)
+
+
+@benchmark("electrical_health.add_frame", ops=BATCH_FRAMES)
+def bench_electrical_add_frame():
+    from electrical_health import ElectricalHealth
+    batch = frame_batch()
+    health = ElectricalHealth(ratings_path=None, state_path=os.devnull)
+    clock = [0.0]
+
+    def run():
+        for data in batch:
+            clock[0] += 6.0
+            health.add_frame(clock[0], data)
+        health.process()
+    return run
+
+
+@benchmark("electrical_health.profile")
+def bench_electrical_profile():
+    import numpy as np
+    from electrical_health import BIN_COUNT, ElectricalHealth, WINDOW_DAYS
+    health = ElectricalHealth(ratings_path=None, state_path=os.devnull)
+    for i in range(FLEET_CONTROLLERS):
+        health._row(i.to_bytes(12, "big"))
+    count = len(health.controllers)
+    health.hist[:count] = np.random.default_rng(0).random((count, WINDOW_DAYS, BIN_COUNT)) * 3600
+    health.slot_day[:count] = np.arange(WINDOW_DAYS)
+    controller = health.controllers[FLEET_CONTROLLERS // 2]
+    return lambda: health.profile(controller, now=WINDOW_DAYS * 86400.0)
+
+
+@benchmark("fleet_matrix.flush", ops=BATCH_FRAMES)
+def bench_fleet_flush():
+    from fleet_matrix import FleetMatrix
+    batch = frame_batch()
+    fleet = FleetMatrix()
+    clock = [0.0]
+
+    def run():
+        for data in batch:
+            clock[0] += 1.0
+            fleet.add_frame(clock[0], data)
+        fleet.flush()
+    return run
+
+
+@benchmark("fleet_matrix.query")
+def bench_fleet_query():
+    import numpy as np
+    from fleet_matrix import COLUMNS, FleetMatrix
+    fleet = FleetMatrix()
+    rng = np.random.default_rng(0)
+    for i in range(FLEET_CONTROLLERS):
+        fleet._row(i.to_bytes(12, "big"))
+    for key in COLUMNS:
+        fleet.matrix[key][:FLEET_CONTROLLERS] = rng.uniform(0, 100, FLEET_CONTROLLERS)
+    fleet.matrix["mode"][:FLEET_CONTROLLERS] = rng.integers(0, 3, FLEET_CONTROLLERS)
+    fleet.times[:FLEET_CONTROLLERS] = 0.0
+    return lambda: fleet.query("fuel_level_percent < 20 and mode == MODE_AUTO", sort="fuel_level_percent")
+
+
+def example_rules():
+    import json
+    from rule_engine import RuleEngine, RuleSet
+
+    with open(os.path.join(ROOT_DIR, "rules.example.json"), encoding="utf-8") as f:
+        engine = RuleEngine()
+        engine.use(RuleSet(json.load(f)["rules"]))
+    return engine
+
+
+@benchmark("rule_engine.evaluate")
+def bench_rules():
+    from decoder import decode_telemetry
+    engine = example_rules()
+    decoded = decode_telemetry(frame())
+    clock = [0.0]
+
+    def run():
+        clock[0] += 1.0
+        engine.evaluate("D50000000000000000000001", decoded, clock[0])
+    return run
+
+
+@benchmark("rule_engine.evaluate_fleet", ops=BATCH_FRAMES)
+def bench_rules_fleet():
+    from batch_decoder import decode_frames, stack_frames
+    engine = example_rules()
+    columns = decode_frames(stack_frames(frame_batch()))
+    controllers = [f"controller-{i}" for i in range(BATCH_FRAMES)]
+    clock = [0.0]
+
+    def run():
+        clock[0] += 1.0
+        engine.evaluate_fleet(controllers, columns, [clock[0]] * BATCH_FRAMES)
+    return run
+
+
+@benchmark("decode_unknown_offsets")
+def bench_unknown_offsets():
+    from decoder import decode_unknown_offsets
+    data = frame()
+    return lambda: decode_unknown_offsets(data)
+
+
+@benchmark("format_telemetry")
+def bench_format():
+    from decoder import decode_telemetry, format_telemetry
+    decoded = decode_telemetry(frame())
+    return lambda: format_telemetry(decoded)
+
+
+@benchmark("persist_telemetry")
+def bench_persist():
+    from packet_pipeline import persist_telemetry
+    data_dir = tempfile.mkdtemp(prefix="bench_persist_")
+    data = frame()
+    return lambda: persist_telemetry(data, "pkt_benchmark.txt", data_dir)
+
+
+@benchmark("telemetry_to_params")
+def bench_to_params():
+    import api_server
+    from decoder import decode_telemetry
+    decoded = decode_telemetry(frame())
+    return lambda: api_server.telemetry_to_params(decoded)
+
+
+@benchmark("telemetry_to_params.en")
+def bench_to_params_en():
+    import api_server
+    from decoder import decode_telemetry
+    decoded = decode_telemetry(frame())
+    return lambda: api_server.telemetry_to_params(decoded, "en")
+
+
+@benchmark("get_alarm_name", ops=256)
+def bench_alarm_name():
+    from datakom_constants import get_alarm_name
+
+    def run():
+        for index in range(256):
+            get_alarm_name(index)
+    return run
+
+
+@benchmark("get_alarm_index_by_message", ops=256)
+def bench_alarm_index():
+    from datakom_constants import get_alarm_index_by_message
+    from lang.en import ALARM_MESSAGES
+    messages = [ALARM_MESSAGES.get(index, f"Alarm #{index}") for index in range(256)]
+
+    def run():
+        for message in messages:
+            get_alarm_index_by_message(message)
+    return run
+
+
+@benchmark("get_alert_category_by_index", ops=256)
+def bench_alert_category():
+    from datakom_constants import get_alert_category_by_index
+
+    def run():
+        for index in range(256):
+            get_alert_category_by_index(index)
+    return run
+
+
+@benchmark("get_state_name", ops=64)
+def bench_state_name():
+    from datakom_constants import get_state_name
+
+    def run():
+        for code in range(64):
+            get_state_name(code)
+    return run
+
+
+API_PATHS = {
+    "api.health": ("/api/health", {}),
+    "api.dump_devm": ("/api/dump_devm", {}),
+    "api.dump_devm.en": ("/api/dump_devm?language=en", {}),
+    "api.dump_devm.ids": ("/api/dump_devm?id=1,2,3,4,5", {}),
+    "api.dump_devm.gzip": ("/api/dump_devm", {"Accept-Encoding": "gzip"}),
+    "api.dump_devm.bin": ("/api/dump_devm?format=bin", {}),
+    "api.dump_devm_param_names": ("/api/dump_devm_param_names", {}),
+    "api.dump_devm_alarm": ("/api/dump_devm_alarm", {}),
+}
+
+_api_client = None
+
+
+def api_client():
+    """One event loop + ASGI client shared by all API benchmarks"""
+    global _api_client
+    if _api_client is None:
+        import httpx
+        import api_server
+
+        loop = asyncio.new_event_loop()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://bench")
+        loop.run_until_complete(client.__aenter__())
+        _api_client = (loop, client)
+    return _api_client
+
+
+def make_api_benchmark(path: str, headers: dict):
+    def setup():
+        loop, client = api_client()
+        response = loop.run_until_complete(client.get(path, headers=headers))
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return lambda: loop.run_until_complete(client.get(path, headers=headers))
+    return setup
+
+
+for _name, (_path, _headers) in API_PATHS.items():
+    benchmark(_name)(make_api_benchmark(_path, _headers))
+
+
+def measure(func, ops: int, repeats: int, min_time: float) -> dict:
+    """Per-operation timings in microseconds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    per_op = [t / number / ops * 1e6 for t in timer.repeat(repeats, number)]
+    return {
+        "number": number,
+        "repeats": repeats,
+        "min_us": round(min(per_op), 3),
+        "median_us": round(statistics.median(per_op), 3),
+        "mean_us": round(statistics.fmean(per_op), 3),
+        "stdev_us": round(statistics.stdev(per_op), 3) if len(per_op) > 1 else 0.0,
+    }
+
+
+def git_revision(root: Path) -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(root: Path, patterns: list, repeats: int, min_time: float) -> dict:
+    results = {}
+    for name, setup, ops in BENCHMARKS:
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        try:
+            func = setup()
+            func()  # warm up caches before timing
+        except Exception as e:
+            # Code under test may not exist at older revisions
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            print(f"{name:32s} skipped ({type(e).__name__}: {e})")
+            continue
+        results[name] = measure(func, ops, repeats, min_time)
+        print(f"{name:32s} {results[name]['median_us']:12.3f} us")
+
+    return {
+        "revision": git_revision(root),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(base: dict, current: dict, threshold: float) -> list:
+    """Rows of (name, base_us, current_us, change_pct, status)"""
+    rows = []
+    for name in sorted(base["results"].keys() | current["results"].keys()):
+        old = base["results"].get(name, {})
+        new = current["results"].get(name, {})
+        if "median_us" not in old or "median_us" not in new:
+            rows.append((name, old.get("median_us"), new.get("median_us"), None, "n/a"))
+            continue
+        change = (new["median_us"] - old["median_us"]) / old["median_us"] * 100
+        if change > threshold:
+            status = "REGRESSION"
+        elif change < -threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, old["median_us"], new["median_us"], round(change, 1), status))
+    return rows
+
+
+def print_comparison(base: dict, current: dict, threshold: float) -> bool:
+    """Print a comparison table; True if any benchmark regressed"""
+    print(f"base {base['revision']} -> current {current['revision']} (threshold {threshold}%)")
+    print(f"{'benchmark':32s} {'base us':>12s} {'current us':>12s} {'change':>9s}  status")
+    regressed = False
+    for name, old, new, change, status in compare(base, current, threshold):
+        old_text = f"{old:12.3f}" if old is not None else f"{'-':>12s}"
+        new_text = f"{new:12.3f}" if new is not None else f"{'-':>12s}"
+        change_text = f"{change:+8.1f}%" if change is not None else f"{'-':>9s}"
+        print(f"{name:32s} {old_text} {new_text} {change_text}  {status}")
+        regressed = regressed or status == "REGRESSION"
+    return regressed
+
+
+def save_frames(path: str):
+    """Write the input frames so every revision decodes the same bytes"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"default": frame().hex(), "extended": frame(EXTENDED_FRAME_SIZE).hex()}, f)
+
+
+def load_frames(path: str):
+    frames = load_json(path)
+    _frames[None] = bytes.fromhex(frames["default"])
+    _frames[EXTENDED_FRAME_SIZE] = bytes.fromhex(frames["extended"])
+
+
+def run_at_revision(revision: str, args, output: str, frames_path: str):
+    """Run this suite against the code of another revision in a temporary worktree"""
+    worktree = tempfile.mkdtemp(prefix="bench_worktree_")
+    subprocess.run(["git", "worktree", "add", "--detach", worktree, revision], cwd=ROOT_DIR, check=True,
+                   capture_output=True)
+    try:
+        command = [sys.executable, os.path.abspath(__file__), "run", "--root", worktree, "--output", output,
+                   "--frames", frames_path, "--repeats", str(args.repeats), "--min-time", str(args.min_time)]
+        for pattern in args.filter or []:
+            command += ["--filter", pattern]
+        subprocess.run(command, check=True)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=ROOT_DIR, capture_output=True)
+
+
+def load_json(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datakom benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run benchmarks and store results")
+    run_parser.add_argument("--output", help="Write results as JSON to this file")
+    run_parser.add_argument("--root", help="Source tree to benchmark (default: this repository)")
+    run_parser.add_argument("--frames", help="Input frames written by compare-revs (default: simulator)")
+
+    revs_parser = sub.add_parser("compare-revs", help="Run at two git revisions and compare")
+    revs_parser.add_argument("base")
+    revs_parser.add_argument("current")
+    revs_parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold, percent")
+
+    for p in (run_parser, revs_parser):
+        p.add_argument("--filter", action="append", help="Glob of benchmark names (repeatable)")
+        p.add_argument("--repeats", type=int, default=5)
+        p.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing round")
+
+    compare_parser = sub.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold, percent")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(1 if print_comparison(load_json(args.base), load_json(args.current), args.threshold) else 0)
+
+    if args.command == "compare-revs":
+        with tempfile.TemporaryDirectory() as tmp:
+            frames_path = os.path.join(tmp, "frames.json")
+            save_frames(frames_path)
+            outputs = []
+            for revision in (args.base, args.current):
+                output = os.path.join(tmp, f"{len(outputs)}.json")
+                run_at_revision(revision, args, output, frames_path)
+                outputs.append(load_json(output))
+        sys.exit(1 if print_comparison(outputs[0], outputs[1], args.threshold) else 0)
+
+    if args.frames:
+        load_frames(args.frames)
+    root = Path(args.root).resolve() if args.root else ROOT_DIR
+    if root != ROOT_DIR:
+        # Only the tree under test may provide the benchmarked modules
+        sys.path.remove(str(ROOT_DIR))
+    sys.path.insert(0, str(root))
+    output = os.path.abspath(args.output) if args.output else None
+
+    # The API reads data/ relative to the working directory
+    with tempfile.TemporaryDirectory() as tmp:
+        write_data_dir(Path(tmp), frame())
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            result = run_suite(root, args.filter, args.repeats, args.min_time)
+        finally:
+            os.chdir(cwd)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Compact binary encoding of device parameters for bandwidth-constrained clients
+Per-poll payloads carry only (param_id, type, value) records; labels, units and
+value hints are served once by the cacheable schema endpoint.
+
+Layout (little-endian):
+    header  : magic "DKB1" | version u8 | reserved u8 | count u16 |
+              timestamp f64 (unix seconds) | schema_version u32
+    record  : param_id u16 | type u8 | payload
+    payload : TYPE_NULL    -> nothing
+              TYPE_INT32   -> i32
+              TYPE_DECIMAL -> i32 mantissa, u8 decimals (value = mantissa / 10**decimals)
+              TYPE_STRING  -> u8 length, UTF-8 bytes
+              TYPE_INT64   -> i64
+              TYPE_FLOAT64 -> f64
+"""
+
+import json
+import struct
+import zlib
+from datetime import datetime
+
+from decoder import decode_telemetry
+from param_mapping import PARAM_MAPPING
+from translations import get_table
+
+MEDIA_TYPE = "application/x-datakom-params"
+MAGIC = b"DKB1"
+VERSION = 1
+
+TYPE_NULL = 0
+TYPE_INT32 = 1
+TYPE_DECIMAL = 2
+TYPE_STRING = 3
+TYPE_INT64 = 4
+TYPE_FLOAT64 = 5
+
+HEADER = struct.Struct("<4sBBHdI")
+RECORD = struct.Struct("<HB")
+PARAM_ID = struct.Struct("<H")
+INT32 = struct.Struct("<i")
+DECIMAL = struct.Struct("<iB")
+INT64 = struct.Struct("<q")
+FLOAT64 = struct.Struct("<d")
+
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+MAX_DECIMALS = 6
+
+
+def _decoder_units() -> dict:
+    """Unit of every telemetry key, taken from the decoder itself"""
+    sample = decode_telemetry(b"DY0DD500" + bytes(11800))
+    return {
+        key: item.get("unit", "")
+        for key, item in sample.items()
+        if isinstance(item, dict) and "value" in item
+    }
+
+
+def _build_schema() -> tuple:
+    """Language-independent schema: one entry per parameter ID"""
+    units = _decoder_units()
+    params = {}
+    for key, (param_id, label) in PARAM_MAPPING.items():
+        if param_id not in params:
+            params[param_id] = {"id": param_id, "label": label, "unit": units.get(key, "")}
+    return tuple(params[param_id] for param_id in sorted(params))
+
+
+SCHEMA = _build_schema()
+SCHEMA_VERSION = zlib.crc32(json.dumps(SCHEMA, sort_keys=True).encode("utf-8"))
+
+
+def schema_document(lang_code: str = None) -> dict:
+    """Schema with translated titles and value hints for one language"""
+    table = get_table(lang_code)
+    params = []
+    for entry in SCHEMA:
+        param = dict(entry, title=table.title(entry["id"]))
+        hints = table.value_hints[entry["id"]]
+        if hints:
+            param["valueHints"] = {str(code): text for code, text in enumerate(hints) if text}
+        params.append(param)
+    return {
+        "success": True,
+        "schema_version": SCHEMA_VERSION,
+        "media_type": MEDIA_TYPE,
+        "params": params,
+    }
+
+
+def _encode_value(value) -> bytes:
+    """Type byte + payload for one parameter value"""
+    if value is None:
+        return bytes((TYPE_NULL,))
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        if INT32_MIN <= value <= INT32_MAX:
+            return bytes((TYPE_INT32,)) + INT32.pack(value)
+        return bytes((TYPE_INT64,)) + INT64.pack(value)
+    if isinstance(value, float):
+        # Decoder values are rounded to a few decimals - store them exactly as scaled ints
+        for decimals in range(MAX_DECIMALS + 1):
+            mantissa = round(value * 10 ** decimals)
+            if INT32_MIN <= mantissa <= INT32_MAX and mantissa / 10 ** decimals == value:
+                return bytes((TYPE_DECIMAL,)) + DECIMAL.pack(mantissa, decimals)
+        return bytes((TYPE_FLOAT64,)) + FLOAT64.pack(value)
+    # Cut to 255 bytes without splitting a UTF-8 sequence
+    raw = str(value).encode("utf-8")[:255].decode("utf-8", errors="ignore").encode("utf-8")
+    return bytes((TYPE_STRING, len(raw))) + raw
+
+
+def telemetry_records(telemetry: dict) -> list:
+    """(param_id, value) pairs for every mapped telemetry key, sorted by ID"""
+    records = []
+    for key, value_obj in telemetry.items():
+        if isinstance(value_obj, dict) and 'value' in value_obj:
+            param_id = PARAM_MAPPING.get(key, (0, key))[0]
+            if param_id != 0:
+                records.append((param_id, value_obj['value']))
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def _timestamp_seconds(timestamp) -> float:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return datetime.now().timestamp()
+
+
+def encode_telemetry(telemetry: dict, ids: set = None) -> bytes:
+    """Encode telemetry snapshot (optionally only the given IDs) as binary records"""
+    records = telemetry_records(telemetry)
+    if ids:
+        records = [record for record in records if record[0] in ids]
+
+    parts = [HEADER.pack(MAGIC, VERSION, 0, len(records),
+                         _timestamp_seconds(telemetry.get('timestamp')), SCHEMA_VERSION)]
+    for param_id, value in records:
+        parts.append(PARAM_ID.pack(param_id))
+        parts.append(_encode_value(value))
+    return b"".join(parts)
+
+
+def decode_payload(payload: bytes) -> dict:
+    """Reference decoder for the binary layout (for clients and tooling)"""
+    magic, version, _, count, timestamp, schema_version = HEADER.unpack_from(payload, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Bad magic: {magic!r}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported version: {version}")
+
+    pos = HEADER.size
+    records = []
+    for _ in range(count):
+        param_id, value_type = RECORD.unpack_from(payload, pos)
+        pos += RECORD.size
+        if value_type == TYPE_NULL:
+            value = None
+        elif value_type == TYPE_INT32:
+            value = INT32.unpack_from(payload, pos)[0]
+            pos += INT32.size
+        elif value_type == TYPE_DECIMAL:
+            mantissa, decimals = DECIMAL.unpack_from(payload, pos)
+            value = mantissa / 10 ** decimals
+            pos += DECIMAL.size
+        elif value_type == TYPE_STRING:
+            length = payload[pos]
+            value = payload[pos + 1:pos + 1 + length].decode("utf-8")
+            pos += 1 + length
+        elif value_type == TYPE_INT64:
+            value = INT64.unpack_from(payload, pos)[0]
+            pos += INT64.size
+        elif value_type == TYPE_FLOAT64:
+            value = FLOAT64.unpack_from(payload, pos)[0]
+            pos += FLOAT64.size
+        else:
+            raise ValueError(f"Unknown value type {value_type} for param {param_id}")
+        records.append((param_id, value))
+
+    return {
+        "timestamp": timestamp,
+        "schema_version": schema_version,
+        "records": records,
+    }
+
+
+def wants_binary(format_param: str = None, accept: str = None) -> bool:
+    """True if the client asked for the binary encoding"""
+    if format_param:
+        return format_param.lower() in ("bin", "binary")
+    return bool(accept) and MEDIA_TYPE in accept
@@ -5,11 +5,28 @@ import os
 
 # TCP Listener configuration
 LISTENER_HOST = "0.0.0.0"
-LISTENER_PORT = 8760
+LISTENER_PORT = int(os.environ.get('DATAKOM_LISTENER_PORT', 8760))
+# Ingest worker processes sharing LISTENER_PORT (SO_REUSEPORT, Linux); 1 = single process
+LISTENER_WORKERS = int(os.environ.get('DATAKOM_LISTENER_WORKERS', 1))
+
+# Raw frame archive (packets/archive), days of segments to keep
+ARCHIVE_RETENTION_DAYS = 30
+# Also write unknown_offsets.json per telemetry frame (slow; offset_analyzer.py covers the archive)
+UNKNOWN_OFFSETS_SNAPSHOT = os.environ.get('DATAKOM_UNKNOWN_OFFSETS', '0') == '1'
+
+# User alert rules (see rules.example.json), re-read when the file changes
+ALERT_RULES_FILE = os.environ.get('DATAKOM_RULES', 'rules.json')
+
+# Geofences for GPS exit/enter events (see geofences.example.json), re-read when the file changes
+GEOFENCES_FILE = os.environ.get('DATAKOM_GEOFENCES', 'geofences.json')
+
+# Genset ratings (kVA) for load percentages (see ratings.example.json), re-read when the file changes
+GENSET_RATINGS_FILE = os.environ.get('DATAKOM_RATINGS', 'ratings.json')
 
 # API Server configuration
 API_HOST = "0.0.0.0"
-API_PORT = 8765
+API_PORT = int(os.environ.get('DATAKOM_API_PORT', 8765))
+API_IO_WORKERS = 4  # Thread pool size for blocking file/process calls
 
 # Language settings
 # Read from environment variable DATAKOM_LANG or default to 'uk'
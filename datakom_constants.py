@@ -4,39 +4,46 @@ Datakom D500 MK3 Protocol Constants
 
 import os
 from config import DEFAULT_LANGUAGE
+import translations
 
 # =============================================================================
 # LANGUAGE SUPPORT
 # =============================================================================
 LANGUAGE = os.environ.get('DATAKOM_LANG', DEFAULT_LANGUAGE)
 
-def _load_translations():
-    """Load language-specific translations"""
-    try:
-        if LANGUAGE == 'ru':
-            from lang import ru as translations
-        elif LANGUAGE == 'en':
-            from lang import en as translations
-        else:
-            from lang import uk as translations
-        return translations
-    except ImportError:
-        # Fallback to Ukrainian if language file not found
-        from lang import uk as translations
-        return translations
-
-_translations = _load_translations()
-
-MODE_NAMES = _translations.MODE_NAMES
-STATE_NAMES = _translations.STATE_NAMES
-ENGINE_STATE_NAMES = _translations.ENGINE_STATE_NAMES
-BREAKER_STATE_NAMES = _translations.BREAKER_STATE_NAMES
-MAINS_STATE_NAMES = _translations.MAINS_STATE_NAMES
-BATTERY_STATE_NAMES = _translations.BATTERY_STATE_NAMES
-START_SOURCE_NAMES = _translations.START_SOURCE_NAMES
-RUNNING_TYPE_NAMES = _translations.RUNNING_TYPE_NAMES
-ALARM_MESSAGES = _translations.ALARM_MESSAGES
-OUTPUT_FUNCTIONS = _translations.OUTPUT_FUNCTIONS
+# Default-language dictionaries, resolved on first access (see __getattr__)
+_LANGUAGE_DICTS = (
+    "MODE_NAMES",
+    "STATE_NAMES",
+    "ENGINE_STATE_NAMES",
+    "BREAKER_STATE_NAMES",
+    "MAINS_STATE_NAMES",
+    "BATTERY_STATE_NAMES",
+    "START_SOURCE_NAMES",
+    "RUNNING_TYPE_NAMES",
+    "ALARM_MESSAGES",
+    "OUTPUT_FUNCTIONS",
+)
+
+_table = None
+
+
+def _lang_table(lang_code: str = None) -> translations.LanguageTable:
+    """Translation table for lang_code, or the DATAKOM_LANG default"""
+    global _table
+    if lang_code:
+        return translations.get_table(lang_code)
+    if _table is None:
+        _table = translations.get_table(LANGUAGE)
+    return _table
+
+
+def __getattr__(name: str):
+    if name in _LANGUAGE_DICTS:
+        value = _lang_table().dicts[name]
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # =============================================================================
 # UNIT MODES (offset 103)
@@ -245,44 +252,44 @@ class Offsets:
 # =============================================================================
 # HELPER FUNCTIONS
 # =============================================================================
-def get_mode_name(mode_code: int) -> str:
+def get_mode_name(mode_code: int, lang_code: str = None) -> str:
     """Get human-readable mode name"""
-    return MODE_NAMES.get(mode_code, f"Unknown Mode ({mode_code})")
+    return _lang_table(lang_code).code_name("MODE_NAMES", mode_code, f"Unknown Mode ({mode_code})")
 
 
-def get_state_name(state_code: int) -> str:
+def get_state_name(state_code: int, lang_code: str = None) -> str:
     """Get human-readable genset state name"""
-    return STATE_NAMES.get(state_code, f"Unknown State ({state_code})")
+    return _lang_table(lang_code).code_name("STATE_NAMES", state_code, f"Unknown State ({state_code})")
 
 
-def get_engine_state_name(engine_state_code: int) -> str:
+def get_engine_state_name(engine_state_code: int, lang_code: str = None) -> str:
     """Get human-readable engine state name"""
-    return ENGINE_STATE_NAMES.get(engine_state_code, f"Unknown Engine State ({engine_state_code})")
+    return _lang_table(lang_code).code_name("ENGINE_STATE_NAMES", engine_state_code, f"Unknown Engine State ({engine_state_code})")
 
 
-def get_breaker_state_name(breaker_state_code: int) -> str:
+def get_breaker_state_name(breaker_state_code: int, lang_code: str = None) -> str:
     """Get human-readable breaker state name"""
-    return BREAKER_STATE_NAMES.get(breaker_state_code, f"Unknown Breaker State ({breaker_state_code})")
+    return _lang_table(lang_code).code_name("BREAKER_STATE_NAMES", breaker_state_code, f"Unknown Breaker State ({breaker_state_code})")
 
 
-def get_mains_state_name(mains_state_code: int) -> str:
+def get_mains_state_name(mains_state_code: int, lang_code: str = None) -> str:
     """Get human-readable mains state name"""
-    return MAINS_STATE_NAMES.get(mains_state_code, f"Unknown Mains State ({mains_state_code})")
+    return _lang_table(lang_code).code_name("MAINS_STATE_NAMES", mains_state_code, f"Unknown Mains State ({mains_state_code})")
 
 
-def get_battery_state_name(battery_state_code: int) -> str:
+def get_battery_state_name(battery_state_code: int, lang_code: str = None) -> str:
     """Get human-readable battery state name"""
-    return BATTERY_STATE_NAMES.get(battery_state_code, f"Unknown Battery State ({battery_state_code})")
+    return _lang_table(lang_code).code_name("BATTERY_STATE_NAMES", battery_state_code, f"Unknown Battery State ({battery_state_code})")
 
 
-def get_start_source_name(start_source_code: int) -> str:
+def get_start_source_name(start_source_code: int, lang_code: str = None) -> str:
     """Get human-readable start source name"""
-    return START_SOURCE_NAMES.get(start_source_code, f"Unknown Start Source ({start_source_code})")
+    return _lang_table(lang_code).code_name("START_SOURCE_NAMES", start_source_code, f"Unknown Start Source ({start_source_code})")
 
 
-def get_running_type_name(running_type_code: int) -> str:
+def get_running_type_name(running_type_code: int, lang_code: str = None) -> str:
     """Get human-readable running type name"""
-    return RUNNING_TYPE_NAMES.get(running_type_code, f"Unknown Running Type ({running_type_code})")
+    return _lang_table(lang_code).code_name("RUNNING_TYPE_NAMES", running_type_code, f"Unknown Running Type ({running_type_code})")
 
 
 def get_alert_category(flag2_value: int) -> str:
@@ -364,20 +371,9 @@ def get_alert_category_by_index(alarm_index: int) -> str:
 
 def get_alarm_index_by_message(message: str) -> int:
     """Get alarm index by message text (always use English for lookup)"""
-    # Load English translations for lookup
-    try:
-        from lang import en as en_translations
-        en_alarm_messages = en_translations.ALARM_MESSAGES
-    except ImportError:
-        en_alarm_messages = {}
-    
-    # Create reverse mapping: message -> index from English
-    for idx, msg in en_alarm_messages.items():
-        if msg == message:
-            return idx
-    return -1  # Not found
+    return translations.alarm_index_by_message().get(message, -1)
 
 
-def get_alarm_name(alarm_index: int) -> str:
+def get_alarm_name(alarm_index: int, lang_code: str = None) -> str:
     """Get alarm message name by index"""
-    return ALARM_MESSAGES.get(alarm_index, f"Alarm #{alarm_index}")
+    return _lang_table(lang_code).alarm_message(alarm_index)
@@ -1,113 +1,110 @@
-import socket
+"""
+Datakom D500 MK3 TCP listener
+Accepts controller connections, acknowledges every packet and persists
+telemetry for the API.
+
+The ingest path is an importable engine; importing this module binds no
+socket, touches no files and loads no decoder or language tables:
+
+    engine = IngestEngine(port=0).start()   # bind, load blocklist, write health
+    engine.serve_forever()                  # blocks; engine.stop() from any thread
+    await engine.start_async()              # or serve on an existing event loop
+
+Standalone (PM2) listener:
+    python3 datakom_listener.py
+    python3 datakom_listener.py --workers 4   # multi-process, see ingest_workers.py
+"""
+
 import os
 import json
+import socket
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from decoder import decode_telemetry, decode_unknown_offsets, format_telemetry
-from config import LISTENER_HOST, LISTENER_PORT
+
+from config import LISTENER_HOST, LISTENER_PORT, LISTENER_WORKERS, ALERT_RULES_FILE
 
 HOST = LISTENER_HOST
 PORT = LISTENER_PORT
 
 BASE_DIR = "packets"
 DATA_DIR = "data"
-TELEMETRY_JSON = os.path.join(DATA_DIR, "telemetry.json")
-ALERTS_JSON = os.path.join(DATA_DIR, "alerts.json")
-UNKNOWN_JSON = os.path.join(DATA_DIR, "unknown_offsets.json")
-BLOCKED_IPS_JSON = os.path.join(DATA_DIR, "blocked_ips.json")
-HEALTH_JSON = os.path.join(DATA_DIR, "health.json")
-
-DIR_TELEMETRY = os.path.join(BASE_DIR, "telemetry")
-DIR_EVENT = os.path.join(BASE_DIR, "event")
-
-for d in (DIR_TELEMETRY, DIR_EVENT, DATA_DIR):
-    os.makedirs(d, exist_ok=True)
-
-keepalive_counter = 0
-
-# Health tracking
-health_state = {
-    "status": "ok",
-    "connect_state": "Disconnected",
-    "date_time_change_state": None,
-    "last_error": None
-}
-
-def update_health(state: str, error: dict = None):
-    """Update health status"""
-    global health_state
-    if health_state["connect_state"] != state:
-        health_state["connect_state"] = state
-        health_state["date_time_change_state"] = datetime.now().isoformat()
-    
-    if error:
-        health_state["last_error"] = error
-    
-    health_state["time"] = datetime.now().isoformat()
-    
-    with open(HEALTH_JSON, "w", encoding="utf-8") as f:
-        json.dump(health_state, f, indent=2, ensure_ascii=False)
-
-# Load blocked IPs database
-def load_blocked_ips():
-    if os.path.exists(BLOCKED_IPS_JSON):
-        with open(BLOCKED_IPS_JSON, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_blocked_ips(blocked_ips):
-    with open(BLOCKED_IPS_JSON, "w", encoding="utf-8") as f:
-        json.dump(blocked_ips, f, indent=2, ensure_ascii=False)
-
-def block_ip(ip, reason, first_packet_hex):
-    blocked_ips = load_blocked_ips()
-    
-    if ip not in blocked_ips:
-        blocked_ips[ip] = {
-            "first_seen": datetime.now().isoformat(),
-            "reason": reason,
-            "first_packet": first_packet_hex,
-            "attempts": 1,
-            "last_attempt": datetime.now().isoformat()
-        }
-        print(f"[BLOCK] Added to blacklist: {ip} - {reason}")
-    else:
-        blocked_ips[ip]["attempts"] += 1
-        blocked_ips[ip]["last_attempt"] = datetime.now().isoformat()
-        print(f"[BLOCK] Repeat attempt from {ip} (attempt #{blocked_ips[ip]['attempts']})")
-    
-    save_blocked_ips(blocked_ips)
-    return blocked_ips[ip]["attempts"]
-
-def is_ip_blocked(ip):
-    blocked_ips = load_blocked_ips()
-    return ip in blocked_ips
-
-# Print blocked IPs summary on startup
-blocked_ips = load_blocked_ips()
-if blocked_ips:
-    print(f"[INFO] Loaded {len(blocked_ips)} blocked IP addresses")
-    for ip, info in list(blocked_ips.items())[:5]:
-        print(f"    {ip}: {info['reason']} (attempts: {info['attempts']})")
-    if len(blocked_ips) > 5:
-        print(f"    ... and {len(blocked_ips) - 5} more")
-
-# Initialize health status on startup
-update_health("Listening")
-
-
-def classify_packet(data: bytes) -> str:
-    if len(data) <= 8:
-        return "keepalive"
-    if data.startswith(b"DY0DD500") or data.startswith(b"DKV0"):
-        if len(data) >= 600:
-            return "telemetry"
-        return "keepalive"
-    return "event"
-
-
-def save_packet(directory: str, data: bytes):
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    path = os.path.join(directory, f"pkt_{ts}.txt")
+
+FIRST_PACKET_TIMEOUT = 10   # increased for slow controllers
+SESSION_TIMEOUT = 300       # 5 minutes for established Datakom connection
+READ_SIZE = 64 * 1024
+FRAME_GAP = 0.05            # idle seconds that end a frame past its minimum length
+STALL_GAP = 0.5             # idle seconds tolerated inside a frame that is still incomplete
+BASE_FRAME_SIZE = 1024      # template frames are ~700 bytes; a longer telemetry frame is extended
+EXTENDED_FRAME_SIZE = 10604  # extended frames run at least through the scopemeter block
+MAX_PACKET_SIZE = 1 << 20
+LISTEN_BACKLOG = 100
+
+# First bytes of HTTP/TLS bot traffic -> block reason
+BOT_SIGNATURES = (
+    (b"\x16\x03", "TLS handshake"),
+    (b"GET ", "HTTP GET"),
+    (b"POST ", "HTTP POST"),
+    (b"HEAD ", "HTTP HEAD"),
+    (b"OPTIONS ", "HTTP OPTIONS"),
+)
+
+
+def detect_bot(data: bytes):
+    """Block reason if data looks like HTTP/TLS bot traffic, else None"""
+    for prefix, reason in BOT_SIGNATURES:
+        if data.startswith(prefix):
+            return reason
+    return None
+
+
+def is_datakom_handshake(data: bytes) -> bool:
+    return data.startswith(b"DY0DD500") or data.startswith(b"DKV0") or len(data) <= 8
+
+
+async def read_packet(reader: asyncio.StreamReader, timeout: float, frame_size: int = None) -> tuple:
+    """
+    Read one packet, returns (data, complete)
+
+    The header carries no length, so a telemetry frame longer than one TCP read
+    is reassembled before it is acknowledged (the controller waits for the ack,
+    so nothing of the next packet can be in the stream yet). A frame is never
+    ended below the length it implies: TELEMETRY_MIN_SIZE, or EXTENDED_FRAME_SIZE
+    once it is longer than a template frame; pauses inside it may last STALL_GAP.
+    Past that, it ends when it reaches frame_size exactly (the session's last
+    complete frame length, only a hint) or after FRAME_GAP of silence; a frame
+    still short of frame_size gets STALL_GAP too. complete is False when a stall
+    ended the frame early; such a length must not become the next hint.
+    """
+    from packet_pipeline import TELEMETRY_MIN_SIZE
+
+    data = await asyncio.wait_for(reader.read(READ_SIZE), timeout)
+    if len(data) <= 8 or not (data.startswith(b"DY0DD500") or data.startswith(b"DKV0")):
+        return data, True
+    parts = [data]
+    size = len(data)
+    while size < MAX_PACKET_SIZE:
+        minimum = EXTENDED_FRAME_SIZE if size > BASE_FRAME_SIZE else TELEMETRY_MIN_SIZE
+        if size >= minimum and size == frame_size:
+            return b"".join(parts), True
+        settled = size >= minimum and (frame_size is None or size > frame_size)
+        try:
+            more = await asyncio.wait_for(reader.read(READ_SIZE), FRAME_GAP if settled else STALL_GAP)
+        except TimeoutError:
+            more = b""
+        if not more:
+            return b"".join(parts), settled
+        parts.append(more)
+        size += len(more)
+    return b"".join(parts), False
+
+
+def packet_filename() -> str:
+    return f"pkt_{datetime.now():%Y%m%d_%H%M%S_%f}.txt"
+
+
+def save_packet(directory: str, data: bytes, filename: str = None):
+    path = os.path.join(directory, filename or packet_filename())
     with open(path, "w", encoding="ascii") as f:
         f.write(data.hex())
     return path
@@ -121,267 +118,486 @@ def cleanup_old_packets(directory: str, keep_count: int):
             if filename.startswith("pkt_") and filename.endswith(".txt"):
                 filepath = os.path.join(directory, filename)
                 files.append((filepath, os.path.getmtime(filepath)))
-        
+
         # Sort by modification time (newest first)
         files.sort(key=lambda x: x[1], reverse=True)
-        
+
         # Remove files beyond keep_count
         for filepath, _ in files[keep_count:]:
             os.remove(filepath)
-            
+
     except Exception as e:
         print(f"[!] Error cleaning up {directory}: {e}")
 
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-sock.bind((HOST, PORT))
-sock.listen(5)
+class IngestEngine:
+    """
+    Controller ingest: accept, acknowledge, classify, persist
 
-print(f"[+] Listening on {HOST}:{PORT}")
+    Sessions run concurrently on an asyncio loop; all file I/O (health,
+    blocklist, packets, snapshots) runs in order on one worker thread so the
+    loop - and an API sharing it - never blocks on disk.
 
-while True:
-    try:
-        conn, addr = sock.accept()
-        
+    Args:
+        host: Bind address
+        port: TCP port (0 = ephemeral, see `address` after start)
+        base_dir: Packet directory (telemetry/, event/, archive/)
+        data_dir: Directory of the JSON snapshots read by the API
+        archive: Append telemetry frames to the raw frame archive
+        reuse_port: Bind with SO_REUSEPORT so several worker processes share the port
+    """
+
+    def __init__(self, host: str = HOST, port: int = PORT, base_dir: str = BASE_DIR,
+                 data_dir: str = DATA_DIR, archive: bool = True, reuse_port: bool = False):
+        self.host = host
+        self.port = port
+        self.base_dir = base_dir
+        self.data_dir = data_dir
+        self.dir_telemetry = os.path.join(base_dir, "telemetry")
+        self.dir_event = os.path.join(base_dir, "event")
+        self.blocked_ips_json = os.path.join(data_dir, "blocked_ips.json")
+        self.health_json = os.path.join(data_dir, "health.json")
+        self.archive = archive
+        self.reuse_port = reuse_port
+
+        self.frame_archive = None
+        self.keepalive_counter = 0
+        self.telemetry_counter = 0
+        self.health_state = {
+            "status": "ok",
+            "connect_state": "Disconnected",
+            "date_time_change_state": None,
+            "last_error": None
+        }
+
+        # Live state for an in-process API: (version, data), replaced atomically
+        self.telemetry = (0, {})
+        self.alerts = (0, {"shutDown": [], "warning": [], "loadDump": []})
+        self.health = (0, dict(self.health_state))
+
+        # EWMA baselines per controller/parameter (created on first use); events go to alerts["anomaly"]
+        self.anomaly_detector = None
+        # User alert rules, hot-reloaded from ALERT_RULES_FILE; results go to alerts["rules"]
+        self.rule_engine = None
+        self.anomalies = (0, {"active": {}, "events": [], "controllers": 0, "parameters": 0})
+        # Analytics stages (refuel/theft, power quality), created on first use; their
+        # snapshots by file name as (version, data), rendered on the ingest thread
+        self.analytics = None
+        self.snapshots = {}
+
+        self.sock = None
+        self.is_serving = False
+        self._loop = None
+        self._task = None
+        self._stop_requested = None
+        self._stopping = False
+        self._io_executor = None
+        self._writers = set()
+        # profiling.Profiler of the standalone listener: cprofile covers the ingest I/O thread too
+        self.profiler = None
+
+    @property
+    def address(self):
+        """(host, port) actually bound, None before start()"""
+        return self.sock.getsockname() if self.sock else None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def prepare(self):
+        """Create directories, open the frame archive, load the blocklist and write health"""
+        for d in (self.dir_telemetry, self.dir_event, self.data_dir):
+            os.makedirs(d, exist_ok=True)
+
+        if self.archive:
+            # Raw telemetry frames for /api/raw/* and offline tools
+            from frame_archive import FrameArchiveWriter
+            self.frame_archive = FrameArchiveWriter(
+                os.path.join(self.base_dir, "archive"),
+                os.path.join(self.data_dir, "latest_frame.bin"),
+            )
+
+        # Print blocked IPs summary on startup
+        blocked_ips = self.load_blocked_ips()
+        if blocked_ips:
+            print(f"[INFO] Loaded {len(blocked_ips)} blocked IP addresses")
+            for ip, info in list(blocked_ips.items())[:5]:
+                print(f"    {ip}: {info['reason']} (attempts: {info['attempts']})")
+            if len(blocked_ips) > 5:
+                print(f"    ... and {len(blocked_ips) - 5} more")
+
+        self.update_health("Listening")
+        return self
+
+    def start(self):
+        """prepare() and bind the socket"""
+        self.prepare()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(LISTEN_BACKLOG)
+        self.sock = sock
+        self._stopping = False
+
+        print(f"[+] Listening on {self.host}:{self.address[1]}")
+        return self
+
+    def warm_up(self):
+        """Import the decoder and default language now instead of on the first telemetry packet"""
+        import packet_pipeline
+        from datakom_constants import get_mode_name
+        get_mode_name(0)  # resolves the DATAKOM_LANG table
+        self.detector()
+        self.rules()
+        self.stages()
+        return self
+
+    def detector(self):
+        """The engine's AnomalyDetector, created on first use (imports numpy)"""
+        if self.anomaly_detector is None:
+            from anomaly_detector import AnomalyDetector
+            self.anomaly_detector = AnomalyDetector()
+        return self.anomaly_detector
+
+    def rules(self):
+        """The engine's RuleEngine, created on first use"""
+        if self.rule_engine is None:
+            from rule_engine import RuleEngine
+            self.rule_engine = RuleEngine(ALERT_RULES_FILE)
+        return self.rule_engine
+
+    def stages(self) -> list:
+        """The engine's analytics stages (see packet_pipeline.render_snapshot), created on first use"""
+        if self.analytics is None:
+            from fuel_monitor import FuelMonitor
+            from power_quality import PowerQualityMonitor
+            self.analytics = [FuelMonitor(), PowerQualityMonitor()]
+        return self.analytics
+
+    def snapshot(self, name: str, empty: dict) -> tuple:
+        """(version, data) of the stage snapshot file `name`; `empty` before its first change"""
+        return self.snapshots.get(name, (0, empty))
+
+    def load_snapshots(self):
+        """Seed live state from the last persisted snapshots (API answers before the first packet)"""
+        for name, attr in (("telemetry.json", "telemetry"), ("alerts.json", "alerts")):
+            path = os.path.join(self.data_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    setattr(self, attr, (1, json.load(f)))
+            except (OSError, ValueError):
+                pass
+        return self
+
+    async def serve_async(self, started: asyncio.Future = None):
+        """Serve on the running event loop until stop()"""
+        if self._stopping:
+            return
+        if self.sock is None:
+            self.start()
+        self._loop = asyncio.get_running_loop()
+        self._stop_requested = asyncio.Event()
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-io")
+        if self.profiler is not None:
+            self.profiler.attach(self._io_executor)
+        server = await asyncio.start_server(self._handle_stream, sock=self.sock)
+        self.is_serving = True
+        if started is not None:
+            started.set_result(None)
+        try:
+            await self._stop_requested.wait()
+        finally:
+            self.is_serving = False
+            server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await server.wait_closed()
+            if self.profiler is not None:
+                await self._loop.run_in_executor(None, self.profiler.detach, self._io_executor)
+            # Let queued persistence finish before closing the archive
+            await self._loop.run_in_executor(None, self._io_executor.shutdown)
+            self._io_executor = None
+            self._loop = None
+            self._close()
+
+    async def start_async(self):
+        """Start serving as a task on the running loop (combined mode), returns once listening"""
+        if self.sock is None:
+            self.start()
+        started = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self.serve_async(started))
+        await asyncio.wait((started, self._task), return_when=asyncio.FIRST_COMPLETED)
+        if self._task.done():
+            self._task.result()
+
+    async def stop_async(self):
+        self.stop()
+        if self._task:
+            await self._task
+            self._task = None
+
+    def serve_forever(self):
+        """Blocking serve on a private event loop (standalone listener)"""
+        asyncio.run(self.serve_async())
+
+    def serve(self):
+        """start() + serve_forever(), Ctrl+C stops"""
+        if self.sock is None:
+            self.start()
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            self._close()
+
+    def stop(self):
+        """Stop serving; safe to call from any thread"""
+        self._stopping = True
+        loop = self._loop
+        if loop is not None and self._stop_requested is not None:
+            loop.call_soon_threadsafe(self._stop_requested.set)
+        elif not self.is_serving:
+            self._close()
+
+    def _close(self):
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+        if self.frame_archive:
+            self.frame_archive.close()
+        self.update_health("Stopped")
+
+    async def _run_io(self, func, *args):
+        """Run blocking file work on the ingest I/O thread"""
+        return await self._loop.run_in_executor(self._io_executor, func, *args)
+
+    # ------------------------------------------------------------------
+    # Health and blocklist
+    # ------------------------------------------------------------------
+    def update_health(self, state: str, error: dict = None):
+        """Update health status"""
+        if self.health_state["connect_state"] != state:
+            self.health_state["connect_state"] = state
+            self.health_state["date_time_change_state"] = datetime.now().isoformat()
+
+        if error:
+            self.health_state["last_error"] = error
+
+        self.health_state["time"] = datetime.now().isoformat()
+        self.health = (self.health[0] + 1, dict(self.health_state))
+
+        with open(self.health_json, "w", encoding="utf-8") as f:
+            json.dump(self.health_state, f, indent=2, ensure_ascii=False)
+
+    def load_blocked_ips(self) -> dict:
+        if os.path.exists(self.blocked_ips_json):
+            with open(self.blocked_ips_json, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def save_blocked_ips(self, blocked_ips: dict):
+        with open(self.blocked_ips_json, "w", encoding="utf-8") as f:
+            json.dump(blocked_ips, f, indent=2, ensure_ascii=False)
+
+    def block_ip(self, ip: str, reason: str, first_packet_hex: str) -> int:
+        blocked_ips = self.load_blocked_ips()
+
+        if ip not in blocked_ips:
+            blocked_ips[ip] = {
+                "first_seen": datetime.now().isoformat(),
+                "reason": reason,
+                "first_packet": first_packet_hex,
+                "attempts": 1,
+                "last_attempt": datetime.now().isoformat()
+            }
+            print(f"[BLOCK] Added to blacklist: {ip} - {reason}")
+        else:
+            blocked_ips[ip]["attempts"] += 1
+            blocked_ips[ip]["last_attempt"] = datetime.now().isoformat()
+            print(f"[BLOCK] Repeat attempt from {ip} (attempt #{blocked_ips[ip]['attempts']})")
+
+        self.save_blocked_ips(blocked_ips)
+        return blocked_ips[ip]["attempts"]
+
+    # ------------------------------------------------------------------
+    # Packets
+    # ------------------------------------------------------------------
+    def save_event(self, data: bytes):
+        save_packet(self.dir_event, data)
+        cleanup_old_packets(self.dir_event, 10)
+
+    def handle_packet(self, data: bytes) -> str:
+        """Classify and persist one acknowledged packet, returns its type"""
+        from packet_pipeline import classify_packet
+
+        pkt_type = classify_packet(data)
+        if pkt_type == "keepalive":
+            self.keepalive_counter += 1
+        elif pkt_type == "telemetry":
+            self.handle_telemetry(data)
+            self.telemetry_counter += 1
+        elif pkt_type == "event":
+            self.save_event(data)
+        return pkt_type
+
+    def handle_telemetry(self, data: bytes):
+        from packet_pipeline import persist_telemetry
+
+        path = save_packet(self.dir_telemetry, data)
+        cleanup_old_packets(self.dir_telemetry, 20)
+        if self.frame_archive:
+            self.frame_archive.append(data)
+        # Decode and save telemetry, alerts, anomalies, rule results and analytics
+        detector = self.detector()
+        events = detector.version
+        snapshots = {}
+        telemetry, alerts = persist_telemetry(data, os.path.basename(path), self.data_dir, detector=detector,
+                                              rules=self.rules(), stages=self.stages(), snapshots=snapshots)
+        self.telemetry = (self.telemetry[0] + 1, telemetry)
+        self.alerts = (self.alerts[0] + 1, alerts)
+        if detector.version != events:
+            self.anomalies = (self.anomalies[0] + 1, detector.snapshot())
+        # Stage state is only read here, on the ingest thread; the API gets the rendered copy
+        for name, snapshot in snapshots.items():
+            self.snapshots[name] = (self.snapshots.get(name, (0,))[0] + 1, snapshot)
+
+    def check_first_packet(self, client_ip: str, first_data: bytes) -> bool:
+        """Accept a Datakom handshake; block bots and unknown protocols"""
+        reason = detect_bot(first_data)
+        if reason is None and not is_datakom_handshake(first_data):
+            reason = f"Unknown protocol: {first_data[:20].hex()}"
+        if reason is None:
+            return True
+
+        self.save_event(first_data)
+        self.block_ip(client_ip, reason, first_data[:64].hex())
+        return False
+
+    def check_blocked(self, client_ip: str) -> bool:
+        """True (and attempt counted) if client_ip is on the blocklist"""
+        blocked_ips = self.load_blocked_ips()
+        if client_ip not in blocked_ips:
+            return False
+        attempts = blocked_ips[client_ip]["attempts"]
+        reason = blocked_ips[client_ip]["reason"]
+        print(f"[BLOCKED] IP {client_ip} attempting connection (attempt #{attempts}, reason: {reason})")
+
+        # Update attempts counter
+        self.block_ip(client_ip, reason, "")
+        return True
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+    async def _handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Run one controller session, recording its outcome in health.json"""
+        self._writers.add(writer)
+        try:
+            await self._session(reader, writer, writer.get_extra_info("peername"))
+        except TimeoutError as e:
+            await self._run_io(self.update_health, "Timeout", {
+                "timestamp": datetime.now().isoformat(),
+                "message": str(e),
+                "code": "TIMEOUT"
+            })
+        except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as e:
+            await self._run_io(self.update_health, "Disconnected", {
+                "timestamp": datetime.now().isoformat(),
+                "message": str(e),
+                "code": "CONNECTION_LOST"
+            })
+        except Exception as e:
+            import traceback
+            await self._run_io(self.update_health, "Error", {
+                "timestamp": datetime.now().isoformat(),
+                "message": str(e),
+                "code": "UNKNOWN_ERROR",
+                "stack": traceback.format_exc()
+            })
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, addr):
         client_ip = addr[0]
-        
+
         # CHECK IF IP IS ALREADY BLOCKED
-        if is_ip_blocked(client_ip):
-            blocked_ips = load_blocked_ips()
-            attempts = blocked_ips[client_ip]["attempts"]
-            reason = blocked_ips[client_ip]["reason"]
-            print(f"[BLOCKED] IP {client_ip} attempting connection (attempt #{attempts}, reason: {reason})")
-            
-            # Update attempts counter
-            block_ip(client_ip, reason, "")
-            
-            conn.close()
-            continue
-        
+        if await self._run_io(self.check_blocked, client_ip):
+            return
+
         # Enable TCP keepalive to detect dead connections
-        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        
-        # Timeout for first packet - increased for slow controllers
-        conn.settimeout(10)
-        
-        # print(f"[+] Connection from {addr}")
-        
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
         # Read first packet to identify connection type
         try:
-            # print(f"[DEBUG] Waiting for data from {client_ip} (timeout 10s)...")
-            first_data = conn.recv(4096)
-            
-            if not first_data:
-                print(f"[!] Empty connection from {addr}, closing")
-                conn.close()
-                continue
-            
-            # print(f"[DEBUG] Received {len(first_data)} bytes from {client_ip}")
-            # print(f"[DEBUG] First 32 bytes (hex): {first_data[:32].hex()}")
-            # print(f"[DEBUG] First 32 bytes (ascii): {''.join(chr(b) if 32 <= b <= 126 else '.' for b in first_data[:32])}")
-                
-            # Check if it's HTTP/TLS bot traffic
-            if first_data.startswith(b'GET ') or first_data.startswith(b'POST ') or \
-               first_data.startswith(b'HEAD ') or first_data.startswith(b'OPTIONS ') or \
-               first_data.startswith(b'\x16\x03'):  # TLS handshake
-                
-                # Determine bot type
-                if first_data.startswith(b'\x16\x03'):
-                    reason = "TLS handshake"
-                elif first_data.startswith(b'GET '):
-                    reason = "HTTP GET"
-                elif first_data.startswith(b'POST '):
-                    reason = "HTTP POST"
-                elif first_data.startswith(b'HEAD '):
-                    reason = "HTTP HEAD"
-                elif first_data.startswith(b'OPTIONS '):
-                    reason = "HTTP OPTIONS"
-                else:
-                    reason = "HTTP/TLS bot"
-                
-                # print(f"[!] Bot detected from {client_ip}: {reason}")
-                save_packet(DIR_EVENT, first_data)
-                cleanup_old_packets(DIR_EVENT, 10)
-                
-                # Add to blocked list
-                first_packet_hex = first_data[:64].hex()
-                block_ip(client_ip, reason, first_packet_hex)
-                
-                conn.close()
-                continue
-            
-            # Check if it's Datakom protocol
-            if not (first_data.startswith(b"DY0DD500") or first_data.startswith(b"DKV0") or len(first_data) <= 8):
-                # print(f"[!] Unknown protocol from {client_ip}, dropping connection")
-                # print(f"    First bytes: {first_data[:20].hex()}")
-                save_packet(DIR_EVENT, first_data)
-                cleanup_old_packets(DIR_EVENT, 10)
-                
-                # Add to blocked list
-                reason = f"Unknown protocol: {first_data[:20].hex()}"
-                first_packet_hex = first_data[:64].hex()
-                block_ip(client_ip, reason, first_packet_hex)
-                
-                conn.close()
-                continue
-                
-            # Valid Datakom connection - extend timeout
-            conn.settimeout(300)  # 5 minutes for established Datakom connection
-            print(f"[OK] Valid Datakom connection from {addr}")
-            
-        except socket.timeout:
-            print(f"[!] Timeout after 10s from {client_ip} (could be slow router/controller)")
-            conn.close()
-            continue
+            first_data, complete = await read_packet(reader, FIRST_PACKET_TIMEOUT)
+        except TimeoutError:
+            print(f"[!] Timeout after {FIRST_PACKET_TIMEOUT}s from {client_ip} (could be slow router/controller)")
+            return
         except Exception as e:
             print(f"[!] Error reading first packet from {client_ip}: {e}")
-            conn.close()
-            continue
-        
-        # Update health status
-        update_health("Connected")
-
-        # Process first packet
-        conn.sendall(first_data[:8])
-        pkt_type = classify_packet(first_data)
-        
-        if pkt_type == "keepalive":
-            keepalive_counter += 1
-        elif pkt_type == "telemetry":
-            hex_preview = first_data[:16].hex()
-            ascii_preview = ''.join(chr(b) if 32 <= b <= 126 else '.' for b in first_data[:40])
-            # print(f"\n{'='*60}")
-            # print(f"Packet: {pkt_type.upper()} | Size: {len(first_data)} bytes | From: {addr[0]}")
-            # print(f"  Hex: {hex_preview}")
-            # print(f"  ASCII: {ascii_preview}")
-            # print(f"{'='*60}\n")
-            
-            path = save_packet(DIR_TELEMETRY, first_data)
-            cleanup_old_packets(DIR_TELEMETRY, 20)
-            
-            decoded = decode_telemetry(first_data)
-            # print(format_telemetry(decoded))
-            
-            alerts = decoded.pop("_alerts_internal", {"shutDown": [], "warning": [], "loadDump": []})
-            decoded["timestamp"] = datetime.now().isoformat()
-            decoded["raw_packet_file"] = os.path.basename(path)
-            
-            with open(TELEMETRY_JSON, "w", encoding="utf-8") as f:
-                json.dump(decoded, f, indent=2, ensure_ascii=False)
-            with open(ALERTS_JSON, "w", encoding="utf-8") as f:
-                json.dump(alerts, f, indent=2, ensure_ascii=False)
-            
-            unknown = decode_unknown_offsets(first_data)
-            unknown["timestamp"] = datetime.now().isoformat()
-            unknown["raw_packet_file"] = os.path.basename(path)
-            with open(UNKNOWN_JSON, "w", encoding="utf-8") as f:
-                json.dump(unknown, f, indent=2, ensure_ascii=False)
-            
-            # print(f"Packet: {pkt_type.upper()} | Size: {len(first_data)} bytes")
+            return
+
+        if not first_data:
+            print(f"[!] Empty connection from {addr}, closing")
+            return
+        if not await self._run_io(self.check_first_packet, client_ip, first_data):
+            return
+
+        print(f"[OK] Valid Datakom connection from {addr}")
+        await self._run_io(self.update_health, "Connected")
+
+        writer.write(first_data[:8])
+        await writer.drain()
+        pkt_type = await self._run_io(self.handle_packet, first_data)
+        frame_size = len(first_data) if complete and pkt_type == "telemetry" else None
 
         # Continue reading subsequent packets from this connection
         while True:
-            data = conn.recv(4096)
+            data, complete = await read_packet(reader, SESSION_TIMEOUT, frame_size)
             if not data:
                 break
-            
+
             # Filter HTTP requests in main loop
-            if data.startswith(b"GET ") or data.startswith(b"POST ") or \
-               data.startswith(b"HEAD ") or data.startswith(b"OPTIONS ") or \
-               data.startswith(b"\x16\x03"):
+            if detect_bot(data):
                 print(f"[http] request ignored from {client_ip}")
-                save_packet(DIR_EVENT, data)
-                cleanup_old_packets(DIR_EVENT, 10)
+                await self._run_io(self.save_event, data)
                 break
 
-            conn.sendall(data[:8])
-
-            pkt_type = classify_packet(data)
-            
-            if pkt_type == "keepalive":
-                keepalive_counter += 1
-                #if keepalive_counter % 100 == 0:
-                #    print(f"[keepalive] {keepalive_counter} (waiting for telemetry...)")
-                continue
-            
-            # Show details only for important packets
-            hex_preview = data[:16].hex()
-            ascii_preview = ''.join(chr(b) if 32 <= b <= 126 else '.' for b in data[:40])
-            # print(f"\n{'='*60}")
-            # print(f"Packet: {pkt_type.upper()} | Size: {len(data)} bytes | From: {addr[0]}")
-            # print(f"  Hex: {hex_preview}")
-            # print(f"  ASCII: {ascii_preview}")
-            # print(f"{'='*60}\n")
-
-            if pkt_type == "telemetry":
-                path = save_packet(DIR_TELEMETRY, data)
-                cleanup_old_packets(DIR_TELEMETRY, 20)
-                
-                # Decode and display telemetry
-                decoded = decode_telemetry(data)
-                # print(format_telemetry(decoded))
-                
-                # Extract alerts before saving telemetry
-                alerts = decoded.pop("_alerts_internal", {"shutDown": [], "warning": [], "loadDump": []})
-                
-                # Save decoded data to single JSON file
-                decoded["timestamp"] = datetime.now().isoformat()
-                decoded["raw_packet_file"] = os.path.basename(path)
-                with open(TELEMETRY_JSON, "w", encoding="utf-8") as f:
-                    json.dump(decoded, f, indent=2, ensure_ascii=False)
-                
-                # Save alerts to separate JSON file
-                with open(ALERTS_JSON, "w", encoding="utf-8") as f:
-                    json.dump(alerts, f, indent=2, ensure_ascii=False)
-                
-                # Decode and save unknown offsets
-                unknown = decode_unknown_offsets(data)
-                unknown["timestamp"] = datetime.now().isoformat()
-                unknown["raw_packet_file"] = os.path.basename(path)
-                with open(UNKNOWN_JSON, "w", encoding="utf-8") as f:
-                    json.dump(unknown, f, indent=2, ensure_ascii=False)
-            elif pkt_type == "event":
-                save_packet(DIR_EVENT, data)
-                cleanup_old_packets(DIR_EVENT, 10)
-
-            # print(f"Packet: {pkt_type.upper()} | Size: {len(data)} bytes")
-
-    except TimeoutError as e:
-        # print(f"[!] Connection timeout: {e}")
-        # print(f"[*] Closing connection, waiting for reconnect...")
-        update_health("Timeout", {
-            "timestamp": datetime.now().isoformat(),
-            "message": str(e),
-            "code": "TIMEOUT"
-        })
-        try:
-            conn.close()
-        except:
-            pass
-        continue
-    except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as e:
-        # print(f"[!] Connection lost: {e}")
-        # print(f"[*] Waiting for new connection...")
-        update_health("Disconnected", {
-            "timestamp": datetime.now().isoformat(),
-            "message": str(e),
-            "code": "CONNECTION_LOST"
-        })
-        continue
-    except KeyboardInterrupt:
-        # print("\n[*] Shutting down...")
-        update_health("Stopped")
-        break
-    except Exception as e:
-        # print(f"[!] Error: {e}")
-        import traceback
-        # traceback.print_exc()
-        # print(f"[*] Waiting for new connection...")
-        update_health("Error", {
-            "timestamp": datetime.now().isoformat(),
-            "message": str(e),
-            "code": "UNKNOWN_ERROR",
-            "stack": traceback.format_exc()
-        })
-        continue
+            writer.write(data[:8])
+            await writer.drain()
+            if await self._run_io(self.handle_packet, data) == "telemetry" and complete:
+                frame_size = len(data)
+
+
+def main():
+    import argparse
+    import profiling
+
+    parser = argparse.ArgumentParser(description="Datakom D500 MK3 TCP listener")
+    parser.add_argument("--workers", type=int, default=LISTENER_WORKERS,
+                        help="Ingest worker processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        from ingest_workers import Coordinator
+        engine = Coordinator(args.workers).start()
+    else:
+        engine = IngestEngine().start()
+        engine.warm_up()
+
+    # Opt-in profiling: DATAKOM_PROFILE env var or SIGUSR1, reports in logs/
+    profiler = profiling.install()
+    if isinstance(engine, IngestEngine):
+        engine.profiler = profiler
+    try:
+        engine.serve()
+    finally:
+        profiler.stop()
+
+
+if __name__ == "__main__":
+    main()
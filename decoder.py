@@ -2,8 +2,9 @@
 Decoder for Datakom D500 MK3 telemetry packets
 """
 
+import datakom_constants
 from datakom_constants import (
-    MODE_NAMES, STATE_NAMES, get_alert_category,
+    get_alert_category,
     SENDER_FLAG_HAS_MESSAGE, ALERT_CATEGORY_NOT_USED,
     get_alert_category_by_index, get_alarm_name, get_alarm_index_by_message
 )
@@ -169,12 +170,12 @@ def decode_telemetry(data: bytes) -> dict:
     # Mode (offset 103)
     mode_code = data[103]
     result["mode"] = make_measurement(mode_code)
-    result["mode_name"] = make_measurement(MODE_NAMES.get(mode_code, f"Unknown ({mode_code})"))
+    result["mode_name"] = make_measurement(datakom_constants.MODE_NAMES.get(mode_code, f"Unknown ({mode_code})"))
     
     # State (offset 105)
     state_code = data[105]
     result["state"] = make_measurement(state_code)
-    result["state_name"] = make_measurement(STATE_NAMES.get(state_code, f"Unknown ({state_code})"))
+    result["state_name"] = make_measurement(datakom_constants.STATE_NAMES.get(state_code, f"Unknown ({state_code})"))
     
     # MAC Address (offset 592-597, if packet is long enough)
     result["mac_address"] = make_measurement((data[592:598].hex().upper(), data, 598, "N/A"), "")
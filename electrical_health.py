@@ -0,0 +1,434 @@
+"""
+Electrical health of the gensets: unbalance, loading and power factor profiles
+Derived from the phase voltages and currents, genset_P_total_kW and the power
+factor register in one vectorized step over a batch of frames:
+
+    voltage unbalance   max deviation of L1..L3 from their average, % of the average
+    current unbalance   the same over I1..I3
+    loading             apparent power sum(V * I) relative to the genset rating
+                        (config.GENSET_RATINGS_FILE, kVA), %
+    power factor        the controller's register, else P / S; banded, with
+                        negative values (leading) in their own band
+
+Each frame stands for the time since the controller's previous frame (at most
+MAX_GAP_SECONDS), and that time is added into per-controller histograms, one
+slot per UTC day over the last WINDOW_DAYS days (a rolling window: a slot is
+cleared when a new day claims it). The load histogram is the load-duration
+curve; reports only sum the slots, whatever the number of frames behind them.
+Histograms cover running time only (average phase voltage of at least
+RUNNING_VOLTS); current unbalance, loading and power factor also need
+MIN_CURRENT on average.
+
+The ratings file is re-read when it changes; a new rating applies to the
+frames that follow:
+
+    {"default_kva": 100, "controllers": {"D50000000000000000000007": 250}}
+
+add_frame keeps only the PHASE_BLOCK bytes of a frame, and process() runs once
+MAX_PENDING frames are queued or on poll(). The API runs this over the frame
+archive (frame_archive.ArchiveFollower) and checkpoints it in
+data/electrical_health.npz.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from batch_decoder import FIELDS, field_view
+from config import GENSET_RATINGS_FILE
+from frame_archive import ARCHIVE_DIR, ArchiveFollower, list_segments
+
+STATE_FILE = os.path.join("data", "electrical_health.npz")
+
+VOLTAGE_KEYS = ("genset_L1_V", "genset_L2_V", "genset_L3_V")
+CURRENT_KEYS = ("genset_I1_A", "genset_I2_A", "genset_I3_A")
+POWER_KEY = "genset_P_total_kW"
+# key -> (offset, width, scale) as decode_telemetry reads them
+REGISTERS = {key: (offset, width, scale) for key, offset, width, scale, _ in FIELDS
+             if key in VOLTAGE_KEYS + CURRENT_KEYS + (POWER_KEY,)}
+POWER_FACTOR = (229, 2, 1000)   # "Genset Pwr Factor" of the structure template, signed
+PHASE_BLOCK = slice(181, 231)   # bytes kept per frame: every register above
+UNIQUE_ID = slice(21, 33)       # decode_telemetry's unique_id
+
+RUNNING_VOLTS = 50.0        # average phase voltage of a running genset
+MIN_CURRENT = 1.0           # A, average; below it the genset is unloaded
+MAX_GAP_SECONDS = 300.0     # time a single frame can stand for
+WINDOW_DAYS = 7
+DAY = 86400
+MAX_PENDING = 4096          # queued frames that trigger process()
+INITIAL_ROWS = 256
+CHECKPOINT_INTERVAL = 60.0
+RELOAD_INTERVAL = 2.0       # seconds between ratings file checks
+
+# Histogram bins: values below the first edge go to bin 0, at or above the last to the last bin
+LOAD_EDGES = tuple(float(edge) for edge in range(5, 125, 5))    # % of rating
+UNBALANCE_EDGES = (0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0)     # %
+POWER_FACTOR_EDGES = (0.7, 0.8, 0.9, 0.95)
+POWER_FACTOR_BANDS = ("leading", "<0.7", "0.7-0.8", "0.8-0.9", "0.9-0.95", ">=0.95")
+
+# Summary thresholds (each one a bin edge)
+LIGHT_LOAD_PERCENT = 30.0
+OVERLOAD_PERCENT = 100.0
+VOLTAGE_UNBALANCE_LIMIT = 2.0
+CURRENT_UNBALANCE_LIMIT = 10.0
+LOW_POWER_FACTOR = 0.8
+
+
+def _layout() -> dict:
+    """Histogram name -> slice of the bin axis"""
+    sizes = {"running": 1, "load": len(LOAD_EDGES) + 1, "voltage_unbalance": len(UNBALANCE_EDGES) + 1,
+             "current_unbalance": len(UNBALANCE_EDGES) + 1, "power_factor": len(POWER_FACTOR_BANDS)}
+    layout, start = {}, 0
+    for name, size in sizes.items():
+        layout[name] = slice(start, start + size)
+        start += size
+    return layout
+
+
+BINS = _layout()
+BIN_COUNT = BINS["power_factor"].stop
+LATEST = ("voltage_unbalance", "current_unbalance", "load_percent", "power_factor", "kva")
+
+
+def derive(voltages: np.ndarray, currents: np.ndarray, power: np.ndarray, power_factor: np.ndarray,
+           rated_kva: np.ndarray) -> dict:
+    """
+    Per-frame metrics, vectorized over frames
+
+    Args:
+        voltages, currents: (frames x 3) phase values
+        power: genset_P_total_kW per frame
+        power_factor: Power factor register per frame (0: not reported)
+        rated_kva: Rating per frame (NaN: unknown)
+
+    Returns:
+        {"running", "loaded": bool arrays, LATEST...: float arrays (NaN where undefined)}
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        v_avg = voltages.mean(axis=1)
+        i_avg = currents.mean(axis=1)
+        running = v_avg >= RUNNING_VOLTS
+        loaded = running & (i_avg >= MIN_CURRENT)
+        kva = (voltages * currents).sum(axis=1) / 1000
+        pf = np.where(power_factor != 0, power_factor, power / kva)
+        return {
+            "running": running,
+            "loaded": loaded,
+            "voltage_unbalance": np.where(running, np.abs(voltages - v_avg[:, None]).max(axis=1) / v_avg * 100,
+                                          np.nan),
+            "current_unbalance": np.where(loaded, np.abs(currents - i_avg[:, None]).max(axis=1) / i_avg * 100,
+                                          np.nan),
+            "load_percent": np.where(loaded, kva / rated_kva * 100, np.nan),
+            "power_factor": np.where(loaded & (np.abs(pf) <= 1), pf, np.nan),
+            "kva": np.where(running, kva, np.nan),
+        }
+
+
+def _rows(matrix: np.ndarray) -> list:
+    """Rows of a 2-D array as lists, rounded, NaN as None"""
+    values = np.round(matrix, 3).astype(object)
+    values[np.isnan(matrix)] = None
+    return values.tolist()
+
+
+def _bin(values: np.ndarray, edges: tuple) -> np.ndarray:
+    return np.searchsorted(np.asarray(edges), values, side="right")
+
+
+class ElectricalHealth:
+    """
+    Rolling unbalance / load / power factor histograms per controller
+
+    Args:
+        ratings_path: Genset ratings file (None: loading is not computed)
+        state_path: Checkpoint file (archive position and histograms)
+    """
+
+    def __init__(self, ratings_path: str = GENSET_RATINGS_FILE, state_path: str = STATE_FILE):
+        self.ratings_path = ratings_path
+        self.state_path = state_path
+        self.controllers = []   # row -> controller id
+        self.rows = {}          # unique_id bytes -> row
+        self.hist = np.zeros((INITIAL_ROWS, WINDOW_DAYS, BIN_COUNT))    # seconds
+        self.slot_day = np.full((INITIAL_ROWS, WINDOW_DAYS), -1, dtype=np.int64)
+        self.last_time = np.full(INITIAL_ROWS, np.nan)
+        self.latest = np.full((INITIAL_ROWS, len(LATEST)), np.nan)
+        self.rated_kva = np.full(INITIAL_ROWS, np.nan)
+        self.ratings = {}
+        self.default_kva = None
+        self.pending_rows = []
+        self.pending_times = []
+        self.pending_blocks = []
+        self.version = 0        # increments with every process() that changed something
+        self.follower = None
+        self.saved = 0.0
+        self._signature = None
+        self._next_check = 0.0
+
+    # --- updates ---
+
+    def add_frame(self, timestamp: float, frame: bytes) -> bool:
+        """Queue the phase registers of a raw telemetry frame"""
+        if len(frame) < PHASE_BLOCK.stop:
+            return False
+        self.pending_rows.append(self._row(frame[UNIQUE_ID]))
+        self.pending_times.append(timestamp)
+        self.pending_blocks.append(frame[PHASE_BLOCK])
+        if len(self.pending_rows) >= MAX_PENDING:
+            self.process()
+        return True
+
+    def process(self) -> int:
+        """Derive the metrics of the queued frames and add them to the histograms, returns frames processed"""
+        if not self.pending_rows:
+            return 0
+        if self.ratings_path and time.monotonic() >= self._next_check:
+            self.reload()
+        rows = np.array(self.pending_rows)
+        times = np.array(self.pending_times)
+        blocks = np.frombuffer(b"".join(self.pending_blocks), dtype=np.uint8).reshape(len(rows), -1)
+        self.pending_rows, self.pending_times, self.pending_blocks = [], [], []
+
+        def column(offset, width, scale, signed=False):
+            return field_view(blocks, offset - PHASE_BLOCK.start, width, signed) / scale
+
+        order = np.lexsort((times, rows))
+        rows, times, blocks = rows[order], times[order], blocks[order]
+        metrics = derive(np.stack([column(*REGISTERS[key]) for key in VOLTAGE_KEYS], axis=1),
+                         np.stack([column(*REGISTERS[key]) for key in CURRENT_KEYS], axis=1),
+                         column(*REGISTERS[POWER_KEY]), column(*POWER_FACTOR, signed=True),
+                         self.rated_kva[rows])
+
+        # Time each frame stands for: since the previous frame of its controller
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        previous = np.empty(len(rows))
+        previous[first] = self.last_time[rows[first]]
+        previous[~first] = times[:-1][~first[1:]]
+        elapsed = times - previous
+        fresh = ~(elapsed <= 0)         # newer than anything seen (elapsed NaN: first frame ever)
+        np.fmax.at(self.last_time, rows, times)
+
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = first[1:]
+        latest = last & fresh
+        self.latest[rows[latest]] = np.stack([metrics[name][latest] for name in LATEST], axis=1)
+
+        # Claim the day slots; frames older than a slot's day are out of the window
+        days = (times // DAY).astype(np.int64)
+        slots = days % WINDOW_DAYS
+        claimed = self.slot_day.copy()
+        np.maximum.at(claimed, (rows, slots), days)
+        cleared = claimed > self.slot_day
+        self.hist[cleared] = 0.0
+        self.slot_day = claimed
+        counted = fresh & (elapsed > 0) & (days == claimed[rows, slots])
+
+        weight = np.minimum(elapsed, MAX_GAP_SECONDS)
+        running = counted & metrics["running"]
+        for name, values, edges in (("voltage_unbalance", metrics["voltage_unbalance"], UNBALANCE_EDGES),
+                                    ("current_unbalance", metrics["current_unbalance"], UNBALANCE_EDGES),
+                                    ("load", metrics["load_percent"], LOAD_EDGES)):
+            mask = running & ~np.isnan(values)
+            bins = BINS[name].start + _bin(values[mask], edges)
+            np.add.at(self.hist, (rows[mask], slots[mask], bins), weight[mask])
+        pf = metrics["power_factor"]
+        mask = running & ~np.isnan(pf)
+        bins = np.where(pf[mask] < 0, 0, 1 + _bin(pf[mask], POWER_FACTOR_EDGES)) + BINS["power_factor"].start
+        np.add.at(self.hist, (rows[mask], slots[mask], bins), weight[mask])
+        np.add.at(self.hist, (rows[running], slots[running], BINS["running"].start), weight[running])
+
+        self.version += 1
+        return len(rows)
+
+    def _row(self, key: bytes) -> int:
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.controllers)
+            controller = key.hex().upper()
+            self.controllers.append(controller)
+            if row == len(self.last_time):
+                self._grow(row)
+            self.rated_kva[row] = self.ratings.get(controller, self.default_kva or np.nan)
+        return row
+
+    def _grow(self, count: int):
+        self.hist = np.concatenate([self.hist, np.zeros((count, WINDOW_DAYS, BIN_COUNT))])
+        self.slot_day = np.concatenate([self.slot_day, np.full((count, WINDOW_DAYS), -1, dtype=np.int64)])
+        self.last_time = np.concatenate([self.last_time, np.full(count, np.nan)])
+        self.latest = np.concatenate([self.latest, np.full((count, len(LATEST)), np.nan)])
+        self.rated_kva = np.concatenate([self.rated_kva, np.full(count, np.nan)])
+
+    def reload(self) -> bool:
+        """Load the ratings file if it changed"""
+        self._next_check = time.monotonic() + RELOAD_INTERVAL
+        try:
+            st = os.stat(self.ratings_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            if signature:
+                with open(self.ratings_path, "r", encoding="utf-8") as f:
+                    spec = json.load(f)
+                default_kva = spec.get("default_kva")
+                ratings = {controller.upper(): float(kva) for controller, kva in spec.get("controllers", {}).items()}
+                default_kva = float(default_kva) if default_kva else None
+            else:
+                default_kva, ratings = None, {}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"[!] Ratings in {self.ratings_path} not loaded, keeping {len(self.ratings)}: {e}")
+            return False
+        self.default_kva, self.ratings = default_kva, ratings
+        self.rated_kva[:len(self.controllers)] = [ratings.get(controller, default_kva or np.nan)
+                                                  for controller in self.controllers]
+        print(f"[+] Loaded {len(ratings)} genset ratings from {self.ratings_path}")
+        return True
+
+    # --- reports ---
+
+    def window(self, days: int = WINDOW_DAYS, now: float = None, row: int = None) -> np.ndarray:
+        """Histograms summed over the last `days` days, (controllers x bins) seconds, or (bins,) of one row"""
+        rows = slice(0, len(self.controllers)) if row is None else row
+        today = int((time.time() if now is None else now) // DAY)
+        recent = self.slot_day[rows] > today - days
+        return (self.hist[rows] * recent[..., None]).sum(axis=-2)
+
+    def summary(self, days: int = WINDOW_DAYS, now: float = None) -> list:
+        """
+        Load profile summary line per controller
+
+        Args:
+            days: Days to cover, up to WINDOW_DAYS
+            now: End of the window (default: now)
+        """
+        self.process()
+        totals = self.window(days, now) / 3600
+
+        def hours(name, start=0, stop=None):
+            return totals[:, BINS[name]][:, start:stop].sum(axis=1)
+
+        load = totals[:, BINS["load"]]
+        centers = np.array([2.5] + [edge + 2.5 for edge in LOAD_EDGES])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_load = (load * centers).sum(axis=1) / load.sum(axis=1)
+        light = LOAD_EDGES.index(LIGHT_LOAD_PERCENT) + 1
+        overload = LOAD_EDGES.index(OVERLOAD_PERCENT) + 1
+        unbalance_v = UNBALANCE_EDGES.index(VOLTAGE_UNBALANCE_LIMIT) + 1
+        unbalance_i = UNBALANCE_EDGES.index(CURRENT_UNBALANCE_LIMIT) + 1
+        low_pf = POWER_FACTOR_EDGES.index(LOW_POWER_FACTOR) + 1
+        summary = {
+            "running_hours": hours("running"),
+            "mean_load_percent": mean_load,
+            "light_load_hours": hours("load", 0, light),
+            "overload_hours": hours("load", overload),
+            "voltage_unbalance_hours": hours("voltage_unbalance", unbalance_v),
+            "current_unbalance_hours": hours("current_unbalance", unbalance_i),
+            "low_power_factor_hours": hours("power_factor", 1, low_pf + 1),
+        }
+        count = len(self.controllers)
+        names = ("rated_kva",) + tuple(summary)
+        lines = _rows(np.column_stack([self.rated_kva[:count]] + list(summary.values())))
+        latest = _rows(np.column_stack([self.last_time[:count], self.latest[:count]]))
+        return [{"controller": controller, **dict(zip(names, line)), "latest": dict(zip(("time",) + LATEST, values))}
+                for controller, line, values in zip(self.controllers, lines, latest)]
+
+    def profile(self, controller: str, days: int = WINDOW_DAYS, now: float = None) -> dict:
+        """Load-duration curve, unbalance and power factor histograms of one controller (None if unknown)"""
+        self.process()
+        try:
+            row = self.rows.get(bytes.fromhex(controller))
+        except ValueError:
+            row = None
+        if row is None:
+            return None
+        totals = self.window(days, now, row) / 3600
+        load = totals[BINS["load"]]
+        lower = [0.0] + list(LOAD_EDGES)
+        return {
+            "controller": self.controllers[row],
+            "rated_kva": self._value(self.rated_kva[row]),
+            "running_hours": round(float(totals[BINS["running"]][0]), 3),
+            "load": {
+                "lower_edges_percent": lower,
+                "hours": [round(value, 3) for value in load.tolist()],
+                # hours at or above each lower edge
+                "duration_curve": [round(value, 3) for value in np.cumsum(load[::-1])[::-1].tolist()],
+            },
+            "voltage_unbalance": self._histogram(totals, "voltage_unbalance", [0.0] + list(UNBALANCE_EDGES)),
+            "current_unbalance": self._histogram(totals, "current_unbalance", [0.0] + list(UNBALANCE_EDGES)),
+            "power_factor": dict(zip(POWER_FACTOR_BANDS, (round(value, 3) for value in
+                                                          totals[BINS["power_factor"]].tolist()))),
+            "latest": self._latest(row),
+        }
+
+    @staticmethod
+    def _histogram(totals: np.ndarray, name: str, lower: list) -> dict:
+        return {"lower_edges_percent": lower, "hours": [round(value, 3) for value in totals[BINS[name]].tolist()]}
+
+    def _latest(self, row: int) -> dict:
+        return {"time": self._value(self.last_time[row]),
+                **{name: self._value(value) for name, value in zip(LATEST, self.latest[row])}}
+
+    @staticmethod
+    def _value(value):
+        value = float(value)
+        return None if value != value else round(value, 3)
+
+    # --- persistence ---
+
+    def flush(self):
+        """Write the checkpoint"""
+        self.process()
+        count = len(self.controllers)
+        follower = self.follower
+        position = {"path": follower.path, "offset": follower.offset} if follower else None
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path + ".tmp", "wb") as f:
+            np.savez(f, controllers=np.array(self.controllers, dtype=str), hist=self.hist[:count],
+                     slot_day=self.slot_day[:count], last_time=self.last_time[:count],
+                     latest=self.latest[:count], archive=np.array(json.dumps(position)))
+        os.replace(self.state_path + ".tmp", self.state_path)
+        self.saved = time.time()
+
+    def load(self) -> dict:
+        """Restore the histograms from the checkpoint, returns its archive position (None if there is none)"""
+        try:
+            state = np.load(self.state_path)
+        except FileNotFoundError:
+            return None
+        with state:
+            controllers = [str(controller) for controller in state["controllers"]]
+            count = len(controllers)
+            self._grow(max(count - len(self.last_time), 0))
+            for name in ("hist", "slot_day", "last_time", "latest"):
+                getattr(self, name)[:count] = state[name]
+            position = json.loads(str(state["archive"]))
+        self.controllers = controllers
+        self.rows = {bytes.fromhex(controller): row for row, controller in enumerate(controllers)}
+        return position
+
+    def follow(self, archive_dir: str = ARCHIVE_DIR) -> "ElectricalHealth":
+        """Read the frame archive from the checkpoint (or the start of the newest segment) on poll()"""
+        self.follower = ArchiveFollower(self, archive_dir)
+        position = self.load()
+        if position and position.get("path"):
+            path, offset = position["path"], position["offset"]
+            if not os.path.exists(path):
+                later = [segment for _, segment in list_segments(archive_dir) if segment > path]
+                path, offset = (later[0], 0) if later else (path, offset)
+            self.follower.path, self.follower.offset = path, offset
+        return self
+
+    def poll(self, checkpoint_interval: float = CHECKPOINT_INTERVAL) -> int:
+        """Process the frames appended to the archive; checkpoints every checkpoint_interval seconds"""
+        added = self.follower.poll()
+        self.process()
+        if added and time.time() - self.saved >= checkpoint_interval:
+            self.flush()
+        return added
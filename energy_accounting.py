@@ -0,0 +1,498 @@
+"""
+Incremental energy accounting from the cumulative energy registers
+The controller only reports lifetime counters (total_kWh, mains_total_kWh,
+mains_total_export_kWh and the kVArh counters). EnergyAccounting turns them
+into per-interval energy as frames arrive, in O(1) per frame:
+
+    delta       counter step since the controller's previous frame. A step
+                back within one register width of the previous value is a
+                rollover; any other step back is a counter reset (the new
+                reading counts from zero). A step no generator could make
+                (MAX_POWER over the elapsed time) is not booked: the meter
+                keeps the last good reading unless the next frame confirms
+                the jump (a counter preset)
+    quarters    each delta is spread linearly over the 15-minute buckets it
+                spans; closed quarters roll up into hours and local days.
+                Deltas over more than GAP_SECONDS of silence are marked
+                estimated, and spread over at most MAX_SPREAD_SECONDS
+    reports     closed days are materialized into data/energy/YYYY-MM.json
+                (days and month totals per controller), so monthly and daily
+                figures are lookups that outlive the archive retention
+
+Quarters and hours are aligned to UTC; days and months follow local dates,
+like the archive segments. The API runs the engine over the frame archive
+(frame_archive.ArchiveFollower), which holds every controller whatever the
+listener topology. data/energy/state.json checkpoints the archive position and
+the open intervals, so a restart resumes where the last checkpoint stopped.
+
+Rebuild the reports from the whole archive:
+    python energy_accounting.py rebuild
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from batch_decoder import OPTIONAL_FIELDS
+from frame_archive import ARCHIVE_DIR, ArchiveFollower, list_segments
+
+REPORT_DIR = os.path.join("data", "energy")
+STATE_JSON = "state.json"
+
+ENERGY_KEYS = (
+    "total_kWh",
+    "reactive_energy_inductive",
+    "reactive_energy_capacitive",
+    "mains_total_kWh",
+    "mains_total_kVArh_ind",
+    "mains_total_kVArh_cap",
+    "mains_total_export_kWh",
+)
+# key, offset, width, scale, present_above - as decode_telemetry reads them
+REGISTERS = tuple(field for key in ENERGY_KEYS for field in OPTIONAL_FIELDS if field[0] == key)
+ROLLOVER = tuple((1 << (8 * width)) / scale for _, _, width, scale, _ in REGISTERS)
+UNITS = {key: "kVArh" if "reactive" in key or "kVArh" in key else "kWh" for key in ENERGY_KEYS}
+UNIQUE_ID = slice(21, 33)  # decode_telemetry's unique_id
+
+QUARTER = 900
+HOUR = 3600
+MAX_POWER = 20000.0         # kW / kVAr; larger counter steps are not energy
+COUNTER_SLACK = 1.0         # kWh allowed on top of MAX_POWER (counter resolution, clock jitter)
+GAP_SECONDS = 300.0         # silence after which a delta is marked estimated
+MAX_SPREAD_SECONDS = 2 * 86400.0  # longer gaps book their delta into the last two days
+RECENT_QUARTERS = 192       # closed quarters kept per controller (2 days)
+RECENT_HOURS = 168          # closed hours kept per controller (7 days)
+CHECKPOINT_INTERVAL = 60.0  # seconds between state.json writes while frames arrive
+
+
+def local_date(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+
+def read_counters(frame: bytes) -> list:
+    """Energy register values of a raw frame (ENERGY_KEYS order), None where the frame is too short"""
+    size = len(frame)
+    return [int.from_bytes(frame[offset:offset + width], "little") / scale if size > present_above else None
+            for _, offset, width, scale, present_above in REGISTERS]
+
+
+def _interval(start, values: list, estimated: bool) -> dict:
+    entry = {"start": start}
+    entry.update((key, round(value, 3)) for key, value in zip(ENERGY_KEYS, values))
+    entry["estimated"] = estimated
+    return entry
+
+
+def _accumulate(entries: dict, controller: str, deltas: list, estimated: bool) -> dict:
+    """Add deltas to a controller's entry of a day or month"""
+    entry = entries.get(controller)
+    if entry is None:
+        entry = entries[controller] = dict.fromkeys(ENERGY_KEYS, 0.0)
+        entry["estimated"] = False
+    for key, delta in zip(ENERGY_KEYS, deltas):
+        entry[key] = round(entry[key] + delta, 3)
+    entry["estimated"] = entry["estimated"] or estimated
+    return entry
+
+
+def _bucket(start: float, period: str):
+    """Start of the period holding a quarter: unix time, or the local date for days"""
+    if period == "15min":
+        return start
+    if period == "hour":
+        return start - start % HOUR
+    return local_date(start)
+
+
+def _add(target: list, values: list):
+    for i, value in enumerate(values):
+        target[i] += value
+
+
+class Meter:
+    """Counter readings and open intervals of one controller"""
+
+    __slots__ = ("controller", "time", "values", "pending", "quarter", "hour", "day", "quarters", "hours",
+                 "rollovers", "resets", "rejected")
+
+    def __init__(self, controller: str):
+        self.controller = controller
+        self.time = None
+        self.values = None          # last good counter readings
+        self.pending = None         # implausible readings awaiting confirmation
+        # Open intervals: [start, deltas, estimated]; day starts are local dates
+        self.quarter = None
+        self.hour = None
+        self.day = None
+        self.quarters = deque(maxlen=RECENT_QUARTERS)   # closed: (start, deltas, estimated)
+        self.hours = deque(maxlen=RECENT_HOURS)
+        self.rollovers = 0
+        self.resets = 0
+        self.rejected = 0
+
+    def state(self) -> dict:
+        return {name: list(getattr(self, name)) if name in ("quarters", "hours") else getattr(self, name)
+                for name in self.__slots__}
+
+    @classmethod
+    def restore(cls, state: dict) -> "Meter":
+        meter = cls(state["controller"])
+        for name in cls.__slots__:
+            if name in ("quarters", "hours"):
+                getattr(meter, name).extend(tuple(item) for item in state.get(name, ()))
+            elif name in state:
+                setattr(meter, name, state[name])
+        return meter
+
+
+class EnergyAccounting:
+    """
+    Interval energy per controller and materialized daily / monthly reports
+
+    Args:
+        report_dir: Directory of the month reports and state.json
+        max_power: Largest plausible kW / kVAr per register
+    """
+
+    def __init__(self, report_dir: str = REPORT_DIR, max_power: float = MAX_POWER):
+        self.report_dir = report_dir
+        self.max_power = max_power
+        self.meters = {}        # controller id -> Meter
+        self.reports = {}       # "YYYY-MM" -> {"days": {date: {controller: {...}}}, "totals": {controller: {...}}}
+        self.dirty = set()      # months changed since the last flush
+        self.time = 0.0         # newest frame time seen
+        self.version = 0        # increments with every booked frame
+        self.follower = None
+        self.lock = threading.RLock()
+        self.saved = 0.0
+
+    # --- counters -> intervals ---
+
+    def add_frame(self, timestamp: float, frame: bytes) -> bool:
+        """Book the energy registers of a raw telemetry frame; False if it has none"""
+        values = read_counters(frame)
+        if values[0] is None:
+            return False
+        return self.update(frame[UNIQUE_ID].hex().upper(), values, timestamp)
+
+    def update(self, controller: str, values: list, timestamp: float) -> bool:
+        """Book one set of counter readings (ENERGY_KEYS order, None: not reported)"""
+        meter = self.meters.get(controller)
+        if meter is None:
+            meter = self.meters[controller] = Meter(controller)
+        if meter.time is not None and timestamp <= meter.time:
+            return False   # out of order or duplicate
+        self.time = max(self.time, timestamp)
+        self.version += 1
+        previous, meter.values = meter.values, list(values)
+        if previous is None:
+            meter.time = timestamp
+            meter.pending = [None] * len(values)
+            return True
+
+        dt = timestamp - meter.time
+        limit = self.max_power * dt / 3600 + COUNTER_SLACK
+        deltas = [0.0] * len(values)
+        for i, (value, last) in enumerate(zip(values, previous)):
+            if value is None or last is None:
+                continue
+            delta = value - last
+            if 0 <= delta <= limit:
+                pass
+            elif delta < 0 and delta + ROLLOVER[i] <= limit:
+                delta += ROLLOVER[i]
+                meter.rollovers += 1
+            else:
+                pending = meter.pending[i]
+                if pending is not None and 0 <= value - pending <= limit:
+                    delta = value - pending   # the jump held: counter preset
+                    meter.resets += 1
+                elif delta < 0 and value <= limit:
+                    delta = value             # counter cleared, counting from zero
+                    meter.resets += 1
+                else:
+                    # Keep the last good reading until a second one confirms the jump
+                    meter.values[i] = last
+                    meter.pending[i] = value
+                    meter.rejected += 1
+                    continue
+            meter.pending[i] = None
+            deltas[i] = delta
+
+        start = meter.time
+        meter.time = timestamp
+        self._spread(meter, max(start, timestamp - MAX_SPREAD_SECONDS), timestamp, deltas, dt > GAP_SECONDS)
+        return True
+
+    def _spread(self, meter: Meter, start: float, end: float, deltas: list, estimated: bool):
+        """Apportion deltas over the quarters between start and end"""
+        quarter = start - start % QUARTER
+        if end <= quarter + QUARTER:
+            self._book(meter, quarter, deltas, estimated)
+            return
+        span = end - start
+        t = start
+        while t < end:
+            stop = min(quarter + QUARTER, end)
+            share = (stop - t) / span
+            self._book(meter, quarter, [delta * share for delta in deltas], estimated)
+            t, quarter = stop, quarter + QUARTER
+
+    def _book(self, meter: Meter, quarter: float, deltas: list, estimated: bool):
+        open_quarter = meter.quarter
+        if open_quarter is None or open_quarter[0] != quarter:
+            if open_quarter is not None:
+                self._close_quarter(meter)
+            meter.quarter = open_quarter = [quarter, [0.0] * len(deltas), False]
+        _add(open_quarter[1], deltas)
+        open_quarter[2] = open_quarter[2] or estimated
+
+    def _close_quarter(self, meter: Meter):
+        start, deltas, estimated = meter.quarter
+        meter.quarter = None
+        recent = meter.quarters
+        if recent and recent[-1][0] == start:
+            # Reopened after close_idle
+            _, last, last_estimated = recent.pop()
+            _add(deltas, last)
+            estimated = estimated or last_estimated
+        recent.append((start, deltas, estimated))
+
+        hour = start - start % HOUR
+        if meter.hour is not None and meter.hour[0] != hour:
+            self._close_hour(meter)
+        if meter.hour is None:
+            meter.hour = [hour, [0.0] * len(deltas), False]
+        _add(meter.hour[1], deltas)
+        meter.hour[2] = meter.hour[2] or estimated
+
+        day = local_date(start)
+        if meter.day is not None and meter.day[0] != day:
+            self._close_day(meter)
+        if meter.day is None:
+            meter.day = [day, [0.0] * len(deltas), False]
+        _add(meter.day[1], deltas)
+        meter.day[2] = meter.day[2] or estimated
+
+    def _close_hour(self, meter: Meter):
+        start, deltas, estimated = meter.hour
+        meter.hour = None
+        recent = meter.hours
+        if recent and recent[-1][0] == start:
+            _, last, last_estimated = recent.pop()
+            _add(deltas, last)
+            estimated = estimated or last_estimated
+        recent.append((start, deltas, estimated))
+
+    def _close_day(self, meter: Meter):
+        """Materialize a closed day into its month report"""
+        day, deltas, estimated = meter.day
+        meter.day = None
+        month = day[:7]
+        report = self._report(month)
+        _accumulate(report["days"].setdefault(day, {}), meter.controller, deltas, estimated)
+        _accumulate(report["totals"], meter.controller, deltas, estimated)
+        self.dirty.add(month)
+
+    def close_idle(self):
+        """Close the intervals of controllers that stopped reporting, so their days reach the reports"""
+        horizon = self.time - GAP_SECONDS
+        for meter in self.meters.values():
+            if meter.quarter is not None and meter.quarter[0] + QUARTER <= horizon:
+                self._close_quarter(meter)
+            if meter.hour is not None and meter.hour[0] + HOUR <= horizon:
+                self._close_hour(meter)
+            if meter.day is not None and meter.day[0] < local_date(horizon):
+                self._close_day(meter)
+
+    # --- persistence ---
+
+    def _report(self, month: str, create: bool = True) -> dict:
+        """Month report, loaded on first use; a missing one is only kept when create (bookings, not queries)"""
+        report = self.reports.get(month)
+        if report is None:
+            path = os.path.join(self.report_dir, f"{month}.json")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    report = json.load(f)
+            except FileNotFoundError:
+                report = {"month": month, "days": {}, "totals": {}}
+                if not create:
+                    return report
+            self.reports[month] = report
+        return report
+
+    def months(self) -> list:
+        """Months with a report, on disk or in memory"""
+        names = set(self.reports)
+        if os.path.isdir(self.report_dir):
+            names.update(name[:-5] for name in os.listdir(self.report_dir)
+                         if name.endswith(".json") and name != STATE_JSON)
+        return sorted(names)
+
+    def flush(self):
+        """Write changed month reports, then the checkpoint"""
+        with self.lock:
+            os.makedirs(self.report_dir, exist_ok=True)
+            for month in sorted(self.dirty):
+                self._write(f"{month}.json", self.reports[month])
+            self.dirty.clear()
+            follower = self.follower
+            self._write(STATE_JSON, {
+                "archive": {"path": follower.path, "offset": follower.offset} if follower else None,
+                "time": self.time,
+                "meters": {name: meter.state() for name, meter in self.meters.items()},
+            })
+            self.saved = time.time()
+
+    def _write(self, name: str, content: dict):
+        path = os.path.join(self.report_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(content, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def load(self) -> dict:
+        """Restore the meters from state.json, returns its archive position (None if there is none)"""
+        try:
+            with open(os.path.join(self.report_dir, STATE_JSON), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        self.time = state.get("time", 0.0)
+        self.meters = {name: Meter.restore(meter) for name, meter in state.get("meters", {}).items()}
+        return state.get("archive")
+
+    def follow(self, archive_dir: str = ARCHIVE_DIR) -> "EnergyAccounting":
+        """Read the frame archive from the checkpoint (or the start of the newest segment) on poll()"""
+        self.follower = ArchiveFollower(self, archive_dir)
+        position = self.load()
+        if position and position.get("path"):
+            path, offset = position["path"], position["offset"]
+            if not os.path.exists(path):
+                # Segment removed by retention: continue with the next one
+                later = [segment for _, segment in list_segments(archive_dir) if segment > path]
+                path, offset = (later[0], 0) if later else (path, offset)
+            self.follower.path, self.follower.offset = path, offset
+        return self
+
+    def poll(self, checkpoint_interval: float = CHECKPOINT_INTERVAL) -> int:
+        """Book the frames appended to the archive; checkpoints every checkpoint_interval seconds"""
+        with self.lock:
+            added = self.follower.poll()
+            self.close_idle()
+            if self.dirty or (added and time.time() - self.saved >= checkpoint_interval):
+                self.flush()
+            return added
+
+    # --- reports ---
+
+    @staticmethod
+    def open_intervals(meter: Meter, period: str) -> dict:
+        """Open intervals of a period, {start: (deltas, estimated)}, with the open quarter folded in"""
+        intervals = {}
+        parent = {"hour": meter.hour, "day": meter.day}.get(period)
+        if parent is not None:
+            intervals[parent[0]] = (list(parent[1]), parent[2])
+        if meter.quarter is not None:
+            start, deltas, estimated = meter.quarter
+            key = _bucket(start, period)
+            merged, was_estimated = intervals.get(key, ([0.0] * len(deltas), False))
+            _add(merged, deltas)
+            intervals[key] = (merged, was_estimated or estimated)
+        return intervals
+
+    def intervals(self, period: str, controller: str = None) -> dict:
+        """Recent quarters ("15min") or hours per controller, oldest first; open ones are partial"""
+        with self.lock:
+            result = {}
+            for name, meter in self.meters.items():
+                if controller is not None and name != controller:
+                    continue
+                closed = meter.quarters if period == "15min" else meter.hours
+                entries = [_interval(start, deltas, estimated) for start, deltas, estimated in closed]
+                for start, (deltas, estimated) in sorted(self.open_intervals(meter, period).items()):
+                    if closed and closed[-1][0] == start:
+                        # Reopened after close_idle
+                        entries.pop()
+                        _add(deltas, closed[-1][1])
+                        estimated = estimated or closed[-1][2]
+                    entry = _interval(start, deltas, estimated)
+                    entry["partial"] = True
+                    entries.append(entry)
+                result[name] = entries
+            return result
+
+    def days(self, month: str, controller: str = None) -> dict:
+        """Daily energy of a month, {date: {controller: energy}}; open days are partial"""
+        with self.lock:
+            days = {day: {name: dict(entry) for name, entry in entries.items()
+                          if controller is None or name == controller}
+                    for day, entries in self._report(month, create=False)["days"].items()}
+            for name, meter in self.meters.items():
+                if controller is not None and name != controller:
+                    continue
+                for day, (deltas, estimated) in self.open_intervals(meter, "day").items():
+                    if day[:7] == month:
+                        _accumulate(days.setdefault(day, {}), name, deltas, estimated)["partial"] = True
+            return {day: entries for day, entries in sorted(days.items()) if entries}
+
+    def month_totals(self, controller: str = None) -> dict:
+        """Energy per month and controller, {month: {controller: energy}}; open days are included"""
+        with self.lock:
+            totals = {}
+            for month in self.months():
+                entries = {name: dict(entry) for name, entry in self._report(month, create=False)["totals"].items()
+                           if controller is None or name == controller}
+                if entries:
+                    totals[month] = entries
+            for name, meter in self.meters.items():
+                if controller is not None and name != controller:
+                    continue
+                for day, (deltas, estimated) in self.open_intervals(meter, "day").items():
+                    _accumulate(totals.setdefault(day[:7], {}), name, deltas, estimated)["partial"] = True
+            return dict(sorted(totals.items()))
+
+    def counters(self) -> dict:
+        """Counter anomalies per controller"""
+        with self.lock:
+            return {name: {"rollovers": meter.rollovers, "resets": meter.resets, "rejected": meter.rejected,
+                           "last_frame": meter.time}
+                    for name, meter in self.meters.items()}
+
+
+def rebuild(archive_dir: str = ARCHIVE_DIR, report_dir: str = REPORT_DIR) -> EnergyAccounting:
+    """Recompute every report from the oldest archive segment"""
+    segments = [path for _, path in list_segments(archive_dir)]
+    if os.path.isdir(report_dir):
+        for name in os.listdir(report_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(report_dir, name))
+    accounting = EnergyAccounting(report_dir)
+    accounting.follower = ArchiveFollower(accounting, archive_dir)
+    if segments:
+        accounting.follower.path = segments[0]
+    accounting.poll()
+    accounting.flush()
+    return accounting
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Energy reports from the frame archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = sub.add_parser("rebuild", help="Recompute data/energy from the whole archive")
+    rebuild_parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    rebuild_parser.add_argument("--report-dir", default=REPORT_DIR)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    accounting = rebuild(args.archive_dir, args.report_dir)
+    print(f"{len(accounting.meters)} controllers, months {', '.join(accounting.months()) or '-'} "
+          f"in {time.perf_counter() - started:.1f}s -> {args.report_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Fleet-wide last-value matrix with vectorized queries
+One row per controller, one float64 column per numeric param_mapping parameter
+(a NumPy structured array: field name = telemetry key, field title = "p<id>"),
+so a fleet question is a handful of array operations instead of a loop over
+telemetry dicts:
+
+    fleet.query(where="fuel_level_percent < 20 and mode == MODE_AUTO",
+                sort="fuel_level_percent", fields="fuel_level_percent,mode")
+
+Expressions use Python syntax over column names (or p<id>), numbers,
+datakom_constants names (MODE_AUTO, STATE_MASTER_GENSET_ON_LOAD, ...) and
+`age` (seconds since the controller's last frame): comparisons (chained too),
+and / or / not, + - * / %, abs() and isnan(). N/A values are NaN and fail
+every comparison. An expression is compiled once into closures over the
+columns and cached.
+
+The API fills the matrix from the frame archive (frame_archive.ArchiveFollower):
+add_frame keeps only the newest frame per controller, without decoding, and
+flush() decodes those with batch_decoder and writes them into their rows in
+place, grouped by frame length. With a rule_engine.RuleEngine, flush() also
+evaluates the alert rules on those columns (RuleEngine.evaluate_fleet) and
+queries list each controller's active rules.
+"""
+
+import ast
+import operator
+import time
+
+import numpy as np
+
+import datakom_constants
+from batch_decoder import FIELDS, OPTIONAL_FIELDS, SERVICE_COUNTERS, decode_frames, stack_frames
+from param_mapping import PARAM_MAPPING
+
+INITIAL_ROWS = 256
+MAX_COMPILED = 256      # cached query expressions
+DEFAULT_LIMIT = 100
+UNIQUE_ID = slice(21, 33)  # decode_telemetry's unique_id
+
+# Parameters batch_decoder reads as numbers, in parameter ID order
+_NUMERIC = {key for key, *_ in FIELDS} | {key for key, *_ in OPTIONAL_FIELDS} | \
+           {key for key, *_ in SERVICE_COUNTERS} | {"modbus_port"}
+COLUMNS = tuple(sorted((key for key in PARAM_MAPPING if key in _NUMERIC), key=lambda key: PARAM_MAPPING[key][0]))
+DTYPE = np.dtype([((f"p{PARAM_MAPPING[key][0]}", key), np.float64) for key in COLUMNS])
+ALIASES = {**{key: key for key in COLUMNS}, **{f"p{PARAM_MAPPING[key][0]}": key for key in COLUMNS}, "age": "age"}
+
+CONSTANTS = {name: value for name, value in vars(datakom_constants).items()
+             if name.isupper() and type(value) is int}
+
+_COMPARE = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+            ast.Gt: operator.gt, ast.GtE: operator.ge}
+_BINARY = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+           ast.Mod: operator.mod}
+_FUNCTIONS = {"abs": np.abs, "isnan": np.isnan}
+
+
+def column_name(name: str) -> str:
+    """Field name of a column given by telemetry key or p<id>"""
+    field = ALIASES.get(name)
+    if field is None:
+        raise ValueError(f"Unknown column: {name}")
+    return field
+
+
+def compile_expression(text: str) -> tuple:
+    """
+    Compile a filter or value expression into a closure over the columns
+
+    Returns:
+        (evaluate(columns) -> array or scalar, column names it reads); columns
+        maps field names (and "age") to arrays
+    """
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {e.msg}") from None
+    names = set()
+
+    def build(node):
+        if isinstance(node, ast.BoolOp):
+            parts = [build(value) for value in node.values]
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return lambda columns: combine.reduce([part(columns) for part in parts])
+        if isinstance(node, ast.UnaryOp):
+            operand = build(node.operand)
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return lambda columns: np.logical_not(operand(columns))
+            if isinstance(node.op, ast.USub):
+                return lambda columns: -operand(columns)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            left, right, op = build(node.left), build(node.right), _BINARY[type(node.op)]
+            return lambda columns: op(left(columns), right(columns))
+        elif isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+            operands = [build(node.left)] + [build(item) for item in node.comparators]
+            ops = [_COMPARE[type(op)] for op in node.ops]
+
+            def compare(columns):
+                values = [operand(columns) for operand in operands]
+                result = ops[0](values[0], values[1])
+                for i in range(1, len(ops)):
+                    result = np.logical_and(result, ops[i](values[i], values[i + 1]))
+                return result
+            return compare
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS \
+                and len(node.args) == 1 and not node.keywords:
+            function, argument = _FUNCTIONS[node.func.id], build(node.args[0])
+            return lambda columns: function(argument(columns))
+        elif isinstance(node, ast.Name):
+            if node.id in CONSTANTS:
+                value = CONSTANTS[node.id]
+                return lambda columns: value
+            name = column_name(node.id)
+            names.add(name)
+            return lambda columns: columns[name]
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float, bool):
+            value = node.value
+            return lambda columns: value
+        raise ValueError(f"Unsupported expression: {ast.unparse(node)}")
+
+    return build(tree.body), names
+
+
+class FleetMatrix:
+    """
+    Last value of every numeric parameter per controller
+
+    Args:
+        capacity: Initial number of rows (doubles as controllers appear)
+        rules: RuleEngine evaluated on every flushed batch (None: no rules)
+    """
+
+    def __init__(self, capacity: int = INITIAL_ROWS, rules=None):
+        self.matrix = np.full(capacity, np.nan, dtype=DTYPE)
+        self.times = np.full(capacity, np.nan)   # frame time per row
+        self.controllers = []   # row -> controller id
+        self.rows = {}          # unique_id bytes -> row
+        self.pending = {}       # unique_id bytes -> (timestamp, frame), newest per controller
+        self.version = 0        # increments with every flush that changed rows
+        self.rules = rules
+        self.alerts = {}        # controller id -> results of its active rules
+        self._compiled = {}
+
+    # --- updates ---
+
+    def add_frame(self, timestamp: float, frame: bytes) -> bool:
+        """Queue a raw telemetry frame; only the newest one per controller gets decoded"""
+        key = frame[UNIQUE_ID]
+        queued = self.pending.get(key)
+        if queued is not None and queued[0] > timestamp:
+            return False
+        self.pending[key] = (timestamp, frame)
+        return True
+
+    def flush(self) -> int:
+        """Decode the queued frames into their rows, returns the number of rows updated"""
+        pending, self.pending = self.pending, {}
+        by_size = {}
+        for key, (timestamp, frame) in pending.items():
+            row = self._row(key)
+            if timestamp >= self.times[row] or self.times[row] != self.times[row]:
+                by_size.setdefault(len(frame), []).append((row, timestamp, frame))
+        for group in by_size.values():
+            rows = np.array([row for row, _, _ in group])
+            columns = decode_frames(stack_frames([frame for _, _, frame in group]))
+            for key in COLUMNS:
+                column = columns.get(key)
+                self.matrix[key][rows] = np.nan if column is None else column
+            self.times[rows] = [timestamp for _, timestamp, _ in group]
+            if self.rules is not None:
+                self._evaluate(rows, columns)
+        updated = sum(len(group) for group in by_size.values())
+        if updated:
+            self.version += 1
+        return updated
+
+    def _evaluate(self, rows: np.ndarray, columns: dict):
+        names = [self.controllers[row] for row in rows]
+        active = self.rules.evaluate_fleet(names, columns, self.times[rows])
+        for name in names:
+            results = active.get(name)
+            if results:
+                self.alerts[name] = results
+            else:
+                self.alerts.pop(name, None)
+
+    def _row(self, key: bytes) -> int:
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.controllers)
+            self.controllers.append(key.hex().upper())
+            if row == len(self.matrix):
+                self.matrix = np.concatenate([self.matrix, np.full(row, np.nan, dtype=DTYPE)])
+                self.times = np.concatenate([self.times, np.full(row, np.nan)])
+        return row
+
+    # --- queries ---
+
+    def compiled(self, expression: str) -> tuple:
+        compiled = self._compiled.get(expression)
+        if compiled is None:
+            if len(self._compiled) >= MAX_COMPILED:
+                self._compiled.clear()
+            compiled = self._compiled[expression] = compile_expression(expression)
+        return compiled
+
+    def query(self, where: str = None, sort: str = None, fields: str = None, limit: int = DEFAULT_LIMIT,
+              now: float = None) -> dict:
+        """
+        Filter and sort the fleet
+
+        Args:
+            where: Filter expression (see module docstring), default: every controller
+            sort: Comma-separated columns, "-" prefix for descending; NaN sorts last
+            fields: Comma-separated columns returned per controller (default: the
+                columns the filter and sort read, or all of them)
+            limit: Maximum controllers returned
+            now: Reference time of `age` (default: now)
+
+        Returns:
+            {"count": matches, "controllers": [{"controller", "time", <fields>}, ...]}; with
+            rules, every controller also has "rules": names of its active rules
+        """
+        count = len(self.controllers)
+        matrix = self.matrix[:count]
+        times = self.times[:count]
+        columns = _Columns(matrix, times, now)
+        used = set()
+        selected = np.arange(count)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if where:
+                evaluate, names = self.compiled(where)
+                used |= names
+                mask = np.broadcast_to(np.asarray(evaluate(columns), dtype=bool), (count,))
+                selected = np.flatnonzero(mask)
+
+            if sort:
+                keys = []
+                for item in sort.split(","):
+                    item = item.strip()
+                    descending = item.startswith("-")
+                    name = column_name(item.lstrip("+-"))
+                    used.add(name)
+                    values = columns[name][selected]
+                    keys.append(-values if descending else values)
+                selected = selected[np.lexsort(keys[::-1])]
+
+        if fields:
+            names = [name.strip() for name in fields.split(",") if name.strip()]
+            names = [column_name(name) for name in names]
+        else:
+            names = sorted(used, key=lambda name: (name == "age", COLUMNS.index(name) if name in COLUMNS else 0)) \
+                or list(COLUMNS)
+        shown = selected[:limit] if limit is not None else selected
+        result = [{"controller": self.controllers[row], "time": times[row].item()} for row in shown]
+        if self.rules is not None:
+            for entry in result:
+                entry["rules"] = [alert["name"] for alert in self.alerts.get(entry["controller"], ())]
+        for name in names:
+            for entry, value in zip(result, columns[name][shown].tolist()):
+                entry[name] = None if value != value else value
+        return {"count": len(selected), "controllers": result}
+
+
+class _Columns:
+    """Column lookup for compiled expressions; age is computed on first use"""
+
+    __slots__ = ("matrix", "times", "now", "age")
+
+    def __init__(self, matrix: np.ndarray, times: np.ndarray, now: float = None):
+        self.matrix = matrix
+        self.times = times
+        self.now = now
+        self.age = None
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name == "age":
+            if self.age is None:
+                self.age = (time.time() if self.now is None else self.now) - self.times
+            return self.age
+        return self.matrix[name]
@@ -0,0 +1,423 @@
+"""
+Append-only archive of raw telemetry frames
+Frames are stored exactly as received, one daily segment file per day:
+
+    packets/archive/frames_YYYYMMDD.bin
+    record : length u32 | timestamp f64 (unix seconds) | frame bytes
+
+The same length-prefixed record layout is used on the wire by /api/raw/*,
+so archive byte ranges can be sent to clients without decoding.
+"""
+
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from config import ARCHIVE_RETENTION_DAYS
+
+ARCHIVE_DIR = os.path.join("packets", "archive")
+LATEST_FRAME = os.path.join("data", "latest_frame.bin")
+
+RECORD_HEADER = struct.Struct("<Id")
+SEGMENT_PREFIX = "frames_"
+SEGMENT_SUFFIX = ".bin"
+
+# Sanity limit when scanning: a record longer than this means a corrupt segment
+MAX_FRAME_SIZE = 1 << 20
+
+
+def pack_record(frame: bytes, timestamp: float) -> bytes:
+    """Length-prefixed record for one frame"""
+    return RECORD_HEADER.pack(len(frame), timestamp) + frame
+
+
+def segment_name(day: datetime) -> str:
+    return f"{SEGMENT_PREFIX}{day:%Y%m%d}{SEGMENT_SUFFIX}"
+
+
+def segment_day(filename: str):
+    """Date of a segment file, None for other files"""
+    if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX)):
+        return None
+    try:
+        return datetime.strptime(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)], "%Y%m%d")
+    except ValueError:
+        return None
+
+
+def list_segments(archive_dir: str = ARCHIVE_DIR) -> list:
+    """(day, path) of every segment, oldest first"""
+    if not os.path.isdir(archive_dir):
+        return []
+    segments = []
+    for filename in os.listdir(archive_dir):
+        day = segment_day(filename)
+        if day is not None:
+            segments.append((day, os.path.join(archive_dir, filename)))
+    segments.sort()
+    return segments
+
+
+class FrameArchiveWriter:
+    """Appends frames to the daily segment and keeps the latest frame file"""
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, latest_path: str = LATEST_FRAME,
+                 retention_days: int = ARCHIVE_RETENTION_DAYS):
+        self.archive_dir = archive_dir
+        self.latest_path = latest_path
+        self.retention_days = retention_days
+        self._file = None
+        self._day = None
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def append(self, frame: bytes, timestamp: float = None):
+        """Store one frame"""
+        timestamp = time.time() if timestamp is None else timestamp
+        record = pack_record(frame, timestamp)
+
+        day = datetime.fromtimestamp(timestamp).date()
+        if day != self._day:
+            self._rotate(day)
+        self._file.write(record)
+        self._file.flush()
+
+        # Latest frame is replaced atomically so readers never see a partial record
+        tmp_path = self.latest_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(record)
+        os.replace(tmp_path, self.latest_path)
+
+    def _rotate(self, day):
+        if self._file:
+            self._file.close()
+        self._day = day
+        path = os.path.join(self.archive_dir, segment_name(datetime.combine(day, datetime.min.time())))
+        self._file = open(path, "ab")
+        self.cleanup()
+
+    def cleanup(self):
+        """Remove segments older than the retention period"""
+        if not self.retention_days:
+            return
+        cutoff = datetime.now() - timedelta(days=self.retention_days)
+        for day, path in list_segments(self.archive_dir):
+            if day < cutoff:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"[!] Error removing archive segment {path}: {e}")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._day = None
+
+
+class SegmentIndex:
+    """
+    Timestamp -> byte offset index of one segment, extended incrementally
+
+    Segments are append-only, so only the bytes added since the last call are
+    scanned. Timestamps within a segment are non-decreasing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.timestamps = array("d")
+        self.offsets = array("Q")
+        self.end = 0  # byte offset just past the last complete record
+
+    def update(self):
+        """Index records appended since the last update"""
+        size = os.path.getsize(self.path)
+        if size < self.end:
+            # Segment was replaced - start over
+            self.timestamps = array("d")
+            self.offsets = array("Q")
+            self.end = 0
+        if size == self.end:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.end)
+            pos = self.end
+            while pos + RECORD_HEADER.size <= size:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, timestamp = RECORD_HEADER.unpack(header)
+                if length > MAX_FRAME_SIZE or pos + RECORD_HEADER.size + length > size:
+                    break  # partial (still being written) or corrupt tail
+                self.timestamps.append(timestamp)
+                self.offsets.append(pos)
+                pos += RECORD_HEADER.size + length
+                f.seek(pos)
+        self.end = pos
+
+    def byte_range(self, start: float, end: float) -> tuple:
+        """(first_offset, end_offset) of records with start <= timestamp <= end"""
+        first = bisect_left(self.timestamps, start)
+        last = bisect_right(self.timestamps, end)
+        if first >= last:
+            return (0, 0)
+        stop = self.offsets[last] if last < len(self.offsets) else self.end
+        return (self.offsets[first], stop)
+
+
+class FrameArchiveReader:
+    """Time-range queries over archive segments"""
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def ranges(self, start: float, end: float) -> list:
+        """(path, first_offset, end_offset) byte ranges holding frames in [start, end]"""
+        with self._lock:
+            return self._ranges(start, end)
+
+    def _ranges(self, start: float, end: float) -> list:
+        start_day = datetime.fromtimestamp(start).replace(hour=0, minute=0, second=0, microsecond=0)
+        end_day = datetime.fromtimestamp(end)
+        result = []
+        live_paths = set()
+        for day, path in list_segments(self.archive_dir):
+            live_paths.add(path)
+            if day < start_day or day > end_day:
+                continue
+            index = self._indexes.get(path)
+            if index is None:
+                index = self._indexes[path] = SegmentIndex(path)
+            index.update()
+            first, stop = index.byte_range(start, end)
+            if stop > first:
+                result.append((path, first, stop))
+        # Forget indexes of segments removed by retention
+        for path in list(self._indexes):
+            if path not in live_paths:
+                del self._indexes[path]
+        return result
+
+
+def iter_records(path: str, start: int = 0):
+    """Yield (timestamp, frame) for every complete record in a segment, from byte offset `start`"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, timestamp = RECORD_HEADER.unpack(header)
+            if length > MAX_FRAME_SIZE:
+                return
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            yield timestamp, frame
+
+
+def iter_file_range(path: str, first: int, stop: int, chunk_size: int = 64 * 1024):
+    """Yield raw bytes of a segment between two offsets"""
+    with open(path, "rb") as f:
+        f.seek(first)
+        remaining = stop - first
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+class ArchiveFollower:
+    """
+    Feeds frames appended to the archive to a consumer, reading only the
+    records added since the previous poll
+
+    Args:
+        buffer: Consumer with add_frame(timestamp, frame) -> bool
+        archive_dir: Frame archive directory
+        seed_seconds: History read from the newest segment on the first poll
+            (None: the whole newest segment); set `path`/`offset` before the
+            first poll to resume from a checkpoint instead
+        max_lag: Re-seed instead of catching up when the oldest unread record is
+            older than this many seconds (None: read every record)
+
+    Once added to an ArchiveFanout the follower no longer reads the archive
+    itself: the fanout feeds the consumer and poll() returns how many records
+    it took since the previous poll.
+    """
+
+    def __init__(self, buffer, archive_dir: str = ARCHIVE_DIR, seed_seconds: float = None,
+                 max_lag: float = None):
+        self.buffer = buffer
+        self.archive_dir = archive_dir
+        self.seed_seconds = seed_seconds
+        self.max_lag = max_lag
+        self.path = None    # segment being followed
+        self.offset = 0     # byte offset just past the last record read
+        self.fanout = None  # ArchiveFanout reading for this follower
+        self.added = 0      # records the fanout passed to the consumer since the last poll
+        self._lock = threading.Lock()
+
+    def poll(self) -> int:
+        """Read records appended since the last poll, returns how many the consumer took"""
+        with self._lock:
+            if self.fanout is not None:
+                added, self.added = self.added, 0
+                return added
+            segments = [path for _, path in list_segments(self.archive_dir)]
+            if not segments:
+                return 0
+            self._start(segments)
+            added = 0
+            while True:
+                added += self._read()
+                later = [path for path in segments if path > self.path]
+                if not later:
+                    return added
+                self.path, self.offset = later[0], 0
+
+    def _start(self, segments: list):
+        """Seed on the first poll, or when more than max_lag behind"""
+        if self.path is None or (self.max_lag is not None and self._lag(segments) > self.max_lag):
+            self._seed(segments[-1])
+
+    def _seed(self, path: str):
+        """Start in the newest segment, seed_seconds back"""
+        self.path = path
+        self.offset = 0
+        if self.seed_seconds is not None:
+            index = SegmentIndex(path)
+            index.update()
+            first, stop = index.byte_range(time.time() - self.seed_seconds, float("inf"))
+            self.offset = first if stop > first else index.end
+
+    def _lag(self, segments: list) -> float:
+        """Age of the oldest unread record, 0 when caught up"""
+        for path, offset in [(self.path, self.offset)] + [(path, 0) for path in segments if path > self.path]:
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    header = f.read(RECORD_HEADER.size)
+            except OSError:
+                continue
+            if len(header) == RECORD_HEADER.size:
+                return time.time() - RECORD_HEADER.unpack(header)[1]
+        return 0.0
+
+    def _read(self) -> int:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0   # removed by retention
+        if size < self.offset:
+            self.offset = 0   # segment replaced
+        added = 0
+        for timestamp, frame in iter_records(self.path, self.offset):
+            self.offset += RECORD_HEADER.size + len(frame)
+            added += bool(self.buffer.add_frame(timestamp, frame))
+        return added
+
+
+class ArchiveFanout:
+    """
+    One archive reader for several ArchiveFollowers: each record is read once
+    and passed to every follower that has not had it yet
+
+    Followers keep their own position (checkpoints, seed_seconds and max_lag
+    work as before); reading starts at the earliest of them. A consumer is fed
+    under its lock, batch_size bytes of records at a time, so its queries
+    interleave with a long catch-up. A consumer that raises is skipped for the
+    rest of the poll and resumes after the failing record on the next one.
+    """
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, batch_size: int = 4 * 1024 * 1024):
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.followers = []  # (follower, lock guarding its consumer)
+        self._lock = threading.Lock()
+
+    def add(self, follower: ArchiveFollower, lock=None) -> ArchiveFollower:
+        """Feed a follower's consumer from this reader, holding `lock` (if any) while doing so"""
+        with self._lock:
+            follower.fanout = self
+            self.followers.append((follower, lock or threading.Lock()))
+        return follower
+
+    def poll(self) -> int:
+        """Read the records appended since the last poll and feed them, returns how many were read"""
+        with self._lock:
+            segments = [path for _, path in list_segments(self.archive_dir)]
+            if not segments or not self.followers:
+                return 0
+            for follower, lock in self.followers:
+                with lock:
+                    follower._start(segments)
+            active = list(self.followers)
+            read = 0
+            while active:
+                path = min(follower.path for follower, _ in active)
+                group = [(follower, lock) for follower, lock in active if follower.path == path]
+                read += self._read(path, group, active)
+                later = [segment for segment in segments if segment > path]
+                if not later:
+                    break
+                for follower, lock in group:
+                    with lock:
+                        follower.path, follower.offset = later[0], 0
+            return read
+
+    def _read(self, path: str, group: list, active: list) -> int:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 0   # removed by retention
+        for follower, lock in group:
+            if size < follower.offset:
+                with lock:
+                    follower.offset = 0   # segment replaced
+        offset = min(follower.offset for follower, _ in group)
+        read = 0
+        batch = []
+        batched = 0
+        for timestamp, frame in iter_records(path, offset):
+            batch.append((offset, timestamp, frame))
+            offset += RECORD_HEADER.size + len(frame)
+            batched += RECORD_HEADER.size + len(frame)
+            if batched >= self.batch_size:
+                self._feed(group, batch, active)
+                read += len(batch)
+                batch = []
+                batched = 0
+                if not group:
+                    break
+        if batch:
+            self._feed(group, batch, active)
+            read += len(batch)
+        return read
+
+    @staticmethod
+    def _feed(group: list, batch: list, active: list):
+        """Pass each follower the records of a batch at or after its offset; drops the followers that raise"""
+        for follower, lock in list(group):
+            if batch[-1][0] < follower.offset:
+                continue
+            with lock:
+                added = 0
+                try:
+                    for offset, timestamp, frame in batch:
+                        if offset >= follower.offset:
+                            follower.offset = offset + RECORD_HEADER.size + len(frame)
+                            added += bool(follower.buffer.add_frame(timestamp, frame))
+                except Exception as e:
+                    print(f"[!] Archive consumer {type(follower.buffer).__name__}: {e}")
+                    group.remove((follower, lock))
+                    active.remove((follower, lock))
+                with follower._lock:
+                    follower.added += added
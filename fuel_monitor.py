@@ -0,0 +1,284 @@
+"""
+Refuel and fuel theft detection from the tank level
+The controller's own "Fuel Filling!" / "Fuel Stealing!" alarms (252/253) only
+fire when they are configured on the controller, so the server watches the
+level itself. Per controller, in constant memory:
+
+    level       fuel_status_liters (fuel_level_percent if the tank capacity
+                at 585 is not set), median of the last MEDIAN_SAMPLES readings
+                against sloshing and sensor spikes, then an EWMA
+    consumed    liters burnt since monitoring started, from the flowmeter or
+                ECU consumption counter (577/598), else the integrated fuel
+                rate (612/614). The decoder's /10 scaling of the counters is
+                not certain (the structure template says /1000 and /1), so
+                a counter is used once its decimal scale has been calibrated
+                against CALIBRATION_LITERS of integrated fuel rate
+    balance     level + consumed - constant while the engine only burns fuel
+
+The balance follows a slow reference (sensor and counter never agree exactly).
+Once it leaves the reference by EVENT_PERCENT of the tank an event opens at
+the last steady sample; it closes when the balance has been steady for
+SETTLE_SECONDS. A net gain is a refuel, a net loss a theft; the volume
+includes the fuel consumed meanwhile.
+
+Replay against the archive:
+    python replay.py fuel --start 2025-01-01
+"""
+
+import math
+from collections import deque
+
+SNAPSHOT_JSON = "fuel_events.json"
+
+MEDIAN_SAMPLES = 5        # raw readings in the median window
+SMOOTH_SECONDS = 30.0     # EWMA time constant of the level after the median
+REFERENCE_SECONDS = 1800.0  # time constant of the reference balance
+EVENT_PERCENT = 3.0       # balance change opening an event, % of the tank
+EVENT_MIN_LITERS = 10.0   # ... but at least this much when the capacity is known
+STEADY_PERCENT = 0.5      # balance change per minute still counted as steady, % of the tank
+SETTLE_SECONDS = 120.0    # steady this long closes an event
+MAX_EVENT_SECONDS = 3600.0  # longer events are closed regardless
+GAP_SECONDS = 900.0       # silence after which smoothing restarts from the next reading
+MAX_RATE = 500.0          # lt./h; counter steps above this are corrupt readings
+CALIBRATION_LITERS = 5.0  # integrated fuel rate needed to calibrate a counter
+MAX_EVENTS = 200          # recent events kept for the API
+
+FILLING_ALARM = 252
+STEALING_ALARM = 253
+
+# Consumption sources in order of preference
+COUNTER_KEYS = ("fuel_consumption_flowm", "fuel_consumption_ecu")
+RATE_KEYS = ("fuel_rate_flowm", "fuel_rate_ecu")
+
+
+def first_reading(telemetry: dict, keys: tuple) -> tuple:
+    """(key, value) of the first key with a non-zero reading, (None, 0.0) if none has one"""
+    for key in keys:
+        value = number(telemetry, key)
+        if value:
+            return key, value
+    return None, 0.0
+
+
+def number(telemetry: dict, key: str):
+    item = telemetry.get(key)
+    if type(item) is dict:
+        value = item.get("value")
+        if type(value) in (int, float):
+            return value
+    return None
+
+
+class TankState:
+    """O(1) state of one controller's tank"""
+
+    __slots__ = ("unit", "scale", "window", "level", "source", "counter_key", "counter", "counter_scale",
+                 "counted", "integrated", "rate_key", "rate", "consumed", "reference", "balance", "steady",
+                 "steady_since", "event", "time")
+
+    def __init__(self, unit: str, scale: float, level: float, timestamp: float):
+        self.unit = unit
+        self.scale = scale          # tank capacity in `unit`
+        self.window = deque((level,), maxlen=MEDIAN_SAMPLES)
+        self.level = level
+        self.source = None          # consumption key in use
+        self.counter_key = None
+        self.counter = None         # last counter reading
+        self.counter_scale = None   # liters per counter unit, once calibrated
+        self.counted = 0.0          # counter steps and rate integral (liters) while calibrating
+        self.integrated = 0.0
+        self.rate_key = None
+        self.rate = 0.0             # last fuel rate, lt./h
+        self.consumed = 0.0
+        self.reference = level
+        self.balance = level
+        # Last steady sample: (time, level, balance, consumed)
+        self.steady = (timestamp, level, level, 0.0)
+        self.steady_since = timestamp
+        self.event = None           # open event
+        self.time = timestamp
+
+
+class FuelMonitor:
+    """
+    Refuel / theft detector for the outputs of decode_telemetry
+
+    Args:
+        event_percent: Unexplained level change opening an event, % of the tank
+        settle_seconds: Steady time closing an event
+    """
+
+    snapshot_file = SNAPSHOT_JSON
+
+    def __init__(self, event_percent: float = EVENT_PERCENT, settle_seconds: float = SETTLE_SECONDS):
+        self.event_percent = event_percent
+        self.settle_seconds = settle_seconds
+        self.controllers = {}   # controller id -> TankState
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.version = 0        # increments whenever an event opens or closes
+
+    def observe(self, controller: str, telemetry: dict, alerts: dict, timestamp: float) -> bool:
+        """Analytics stage hook (see packet_pipeline.render_snapshot): True if the snapshot changed"""
+        version = self.version
+        self.update(controller, telemetry, timestamp, alerts)
+        return self.version != version
+
+    def update(self, controller: str, telemetry: dict, timestamp: float, alerts: dict = None) -> list:
+        """
+        Feed one decoded frame, returns the refuel/theft events it completed
+
+        Args:
+            controller: Controller id (decoded unique_id)
+            telemetry: decode_telemetry output
+            timestamp: Frame time, unix seconds
+            alerts: Decoded alerts of the frame; marks events the controller alarmed on too
+        """
+        capacity = number(telemetry, "fuel_tank_capacity_liters")
+        if capacity:
+            unit, scale, level = "lt.", float(capacity), number(telemetry, "fuel_status_liters")
+        else:
+            unit, scale, level = "%", 100.0, number(telemetry, "fuel_level_percent")
+        if level is None:
+            return []
+
+        tank = self.controllers.get(controller)
+        if tank is None or tank.unit != unit or tank.scale != scale:
+            self.controllers[controller] = tank = TankState(unit, scale, level, timestamp)
+            self._consumption(tank, telemetry, 0.0)
+            return []
+        dt = timestamp - tank.time
+        if dt <= 0:
+            return []
+        tank.time = timestamp
+
+        if dt > GAP_SECONDS:
+            tank.window.clear()
+            tank.window.append(level)
+            tank.level = level
+        else:
+            tank.window.append(level)
+            median = sorted(tank.window)[len(tank.window) // 2]
+            tank.level += (median - tank.level) * (1 - math.exp(-dt / SMOOTH_SECONDS))
+
+        if not self._consumption(tank, telemetry, dt):
+            # Consumption source changed: the balance is not comparable with before
+            if tank.event is not None:
+                tank.event = None
+                self.version += 1
+            tank.reference = tank.balance = tank.level + tank.consumed
+            tank.steady = (timestamp, tank.level, tank.balance, tank.consumed)
+            tank.steady_since = timestamp
+            return []
+
+        previous = tank.balance
+        tank.balance = balance = tank.level + tank.consumed
+        steady = abs(balance - previous) <= tank.scale * STEADY_PERCENT / 100 * max(dt, 1.0) / 60
+        threshold = tank.scale * self.event_percent / 100
+        if unit == "lt.":
+            threshold = max(threshold, EVENT_MIN_LITERS)
+
+        event = tank.event
+        if event is None:
+            if abs(balance - tank.reference) >= threshold:
+                started, before, start_balance, start_consumed = tank.steady
+                tank.event = event = {
+                    "start": started,
+                    "level_before": before,
+                    "balance": start_balance,
+                    "consumed": start_consumed,
+                    "alarm": False,
+                }
+                tank.steady_since = timestamp
+                self.version += 1
+            else:
+                tank.reference += (balance - tank.reference) * (1 - math.exp(-dt / REFERENCE_SECONDS))
+                if steady:
+                    tank.steady = (timestamp, tank.level, balance, tank.consumed)
+                return []
+
+        if alerts and any(index in (FILLING_ALARM, STEALING_ALARM) for index in alerts.get("warning", ())):
+            event["alarm"] = True
+        if not steady:
+            tank.steady_since = timestamp
+        if timestamp - tank.steady_since < self.settle_seconds and timestamp - event["start"] < MAX_EVENT_SECONDS:
+            return []
+
+        # Settled: record the net change, start over from here
+        tank.event = None
+        tank.reference = balance
+        tank.steady = (timestamp, tank.level, balance, tank.consumed)
+        self.version += 1
+        volume = balance - event["balance"]
+        if abs(volume) < threshold:
+            return []   # sloshing or a sensor glitch that came back
+        completed = {
+            "controller": controller,
+            "kind": "refuel" if volume > 0 else "theft",
+            "volume": round(abs(volume), 1),
+            "unit": unit,
+            "level_before": round(event["level_before"], 1),
+            "level_after": round(tank.level, 1),
+            "consumed": round(tank.consumed - event["consumed"], 1),
+            "consumption_source": tank.source,
+            "counter_scale": tank.counter_scale,
+            "controller_alarm": event["alarm"],
+            "start": event["start"],
+            "end": timestamp,
+        }
+        self.events.append(completed)
+        return [completed]
+
+    def _consumption(self, tank: TankState, telemetry: dict, dt: float) -> bool:
+        """Add the fuel burnt over dt to tank.consumed; False if the source changed"""
+        if tank.unit != "lt.":
+            return True   # liters cannot be compared with a percentage of an unknown tank
+        counter_key, counter = first_reading(telemetry, COUNTER_KEYS)
+        rate_key, rate = first_reading(telemetry, RATE_KEYS)
+        burnt = (tank.rate + rate) / 2 * dt / 3600
+        tank.rate = rate
+        if rate_key is not None:
+            tank.rate_key = rate_key
+
+        step = 0.0
+        if counter_key != tank.counter_key:
+            tank.counter_key, tank.counted, tank.integrated, tank.counter_scale = counter_key, 0.0, 0.0, None
+        elif counter_key is not None:
+            # Negative: counter reset or rollover
+            step = max(counter - tank.counter, 0.0)
+            if tank.counter_scale is None and tank.rate_key is not None:
+                tank.counted += step
+                tank.integrated += burnt
+                if tank.integrated >= CALIBRATION_LITERS and tank.counted > 0:
+                    tank.counter_scale = 10.0 ** round(math.log10(tank.integrated / tank.counted))
+        tank.counter = counter
+
+        if counter_key is not None and (tank.counter_scale is not None or tank.rate_key is None):
+            source = counter_key
+            burnt = step * (tank.counter_scale or 1.0)
+            if burnt > MAX_RATE * dt / 3600 + 1:
+                burnt = 0.0   # corrupt reading
+        else:
+            source = tank.rate_key
+        if source != tank.source:
+            tank.source = source
+            return False
+        tank.consumed += burnt
+        return True
+
+    def open_events(self, controller: str = None) -> dict:
+        """Events in progress (not settled yet) per controller"""
+        return {
+            name: {"start": tank.event["start"],
+                   "level_before": round(tank.event["level_before"], 1),
+                   "level": round(tank.level, 1), "unit": tank.unit}
+            for name, tank in self.controllers.items()
+            if tank.event is not None and (controller is None or name == controller)
+        }
+
+    def snapshot(self) -> dict:
+        """Recent events and events in progress, for the API"""
+        return {
+            "events": list(self.events),
+            "open": self.open_events(),
+            "controllers": len(self.controllers),
+        }
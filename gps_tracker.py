@@ -0,0 +1,394 @@
+"""
+GPS positions, tracks, spatial queries and movement / geofence events
+Positions are read straight from the raw frame bytes (no decoding): the
+extended-frame coordinates at 10002/10006 when present, else 45/49, both
+micro-degrees. They are read signed, so positions west and south of Greenwich
+work too (decode_telemetry reads them unsigned, the same values elsewhere).
+
+Per controller, updated in O(1) per frame:
+
+    track       the last TRACK_POINTS positions, a point every TRACK_MIN_METERS
+    grid        controllers per CELL_DEGREES x CELL_DEGREES cell; bounding-box
+                queries visit only the cells they overlap, nearest-N queries
+                search rings of cells outwards until no closer controller can
+                be found, and exact distances are computed vectorized over the
+                candidates only
+    movement    a parked controller that leaves its parked position by more
+                than MOVE_METERS emits "moving"; once it stays within
+                STOP_METERS for STOP_SECONDS it emits "stopped" with the
+                distance travelled. Jumps faster than MAX_SPEED_KMH are
+                GPS glitches and ignored
+    geofences   circles and polygons from config.GEOFENCES_FILE (re-read when
+                the file changes), each optionally limited to some
+                controllers; crossing a boundary emits "geofence_exit" /
+                "geofence_enter" (circles with GEOFENCE_MARGIN_METERS of
+                hysteresis against GPS jitter)
+
+    {"geofences": [
+        {"name": "depot", "center": [50.45, 30.52], "radius_m": 500},
+        {"name": "site_7", "polygon": [[50.1, 30.1], [50.1, 30.3], [50.3, 30.2]],
+         "controllers": ["D50000000000000000000007"]}
+    ]}
+
+The API runs the tracker over the frame archive (frame_archive.ArchiveFollower).
+"""
+
+import json
+import math
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from config import GEOFENCES_FILE
+
+EARTH_RADIUS = 6371008.8    # meters
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+CELL_DEGREES = 0.05         # grid cell size (about 5.5 km of latitude)
+TRACK_POINTS = 720          # positions kept per controller
+TRACK_MIN_METERS = 25.0     # distance between stored track points
+MOVE_METERS = 150.0         # leaving the parked position by this much starts a movement
+STOP_METERS = 50.0          # staying within this radius ...
+STOP_SECONDS = 300.0        # ... this long ends it
+MAX_SPEED_KMH = 300.0       # faster jumps are GPS glitches
+GEOFENCE_MARGIN_METERS = 25.0
+MAX_EVENTS = 500            # recent events kept for the API
+RELOAD_INTERVAL = 2.0       # seconds between geofence file checks
+
+UNIQUE_ID = slice(21, 33)   # decode_telemetry's unique_id
+SATELLITES_OFFSET = 589
+
+
+def read_position(frame: bytes) -> tuple:
+    """(latitude, longitude) of a raw frame, None without a plausible fix"""
+    if len(frame) > 10010:
+        offset = 10002
+    elif len(frame) >= 53:
+        offset = 45
+    else:
+        return None
+    lat = int.from_bytes(frame[offset:offset + 4], "little", signed=True) / 1_000_000
+    lon = int.from_bytes(frame[offset + 4:offset + 8], "little", signed=True) / 1_000_000
+    if (lat == 0 and lon == 0) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters; works on floats and NumPy arrays"""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """haversine for scalars, without the NumPy overhead"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def cell_of(lat: float, lon: float) -> tuple:
+    return math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES)
+
+
+class Geofence:
+    """Circle (center, radius_m) or polygon of [lat, lon] vertices"""
+
+    def __init__(self, spec: dict):
+        self.name = str(spec["name"])
+        self.controllers = {str(item).upper() for item in spec["controllers"]} if spec.get("controllers") else None
+        if "polygon" in spec:
+            self.polygon = [(float(lat), float(lon)) for lat, lon in spec["polygon"]]
+            if len(self.polygon) < 3:
+                raise ValueError(f"Geofence {self.name}: a polygon needs 3 vertices")
+            self.center = self.radius = None
+        else:
+            self.polygon = None
+            self.center = (float(spec["center"][0]), float(spec["center"][1]))
+            self.radius = float(spec["radius_m"])
+
+    def applies(self, controller: str) -> bool:
+        return self.controllers is None or controller in self.controllers
+
+    def contains(self, lat: float, lon: float, inside: bool) -> bool:
+        """Inside test; `inside` is the previous state (hysteresis of circles)"""
+        if self.polygon is None:
+            margin = -GEOFENCE_MARGIN_METERS if not inside else GEOFENCE_MARGIN_METERS
+            return distance(lat, lon, *self.center) <= self.radius + margin
+        # Ray casting along the latitude
+        result = False
+        j = len(self.polygon) - 1
+        for i, (lat_i, lon_i) in enumerate(self.polygon):
+            lat_j, lon_j = self.polygon[j]
+            if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                result = not result
+            j = i
+        return result
+
+
+class Track:
+    """Position, track and movement state of one controller"""
+
+    __slots__ = ("row", "lat", "lon", "time", "cell", "points", "parked", "moving", "travelled",
+                 "still", "inside")
+
+    def __init__(self, row: int, lat: float, lon: float, timestamp: float):
+        self.row = row
+        self.lat, self.lon, self.time = lat, lon, timestamp
+        self.cell = cell_of(lat, lon)
+        self.points = deque([(timestamp, lat, lon)], maxlen=TRACK_POINTS)
+        self.parked = (lat, lon, timestamp)   # position before the current movement
+        self.moving = False
+        self.travelled = 0.0
+        self.still = (lat, lon, timestamp)    # where the controller has stayed since `time`
+        self.inside = {}                      # geofence name -> inside
+
+
+class GpsTracker:
+    """
+    Positions, tracks, grid index and events of the fleet
+
+    Args:
+        geofences_path: Geofence file (None: no geofences)
+    """
+
+    def __init__(self, geofences_path: str = GEOFENCES_FILE):
+        self.geofences_path = geofences_path
+        self.geofences = []
+        self._signature = None
+        self._next_check = 0.0
+        self.tracks = {}          # controller id -> Track
+        self.controllers = []     # row -> controller id
+        self.lat = np.full(64, np.nan)
+        self.lon = np.full(64, np.nan)
+        self.times = np.full(64, np.nan)
+        self.cells = {}           # (lat cell, lon cell) -> set of rows
+        self.bounds = None        # [min lat cell, max lat cell, min lon cell, max lon cell] ever occupied
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.version = 0          # increments with every position change
+        self.events_version = 0   # increments with every event
+
+    # --- updates ---
+
+    def add_frame(self, timestamp: float, frame: bytes) -> bool:
+        """Feed the position of a raw telemetry frame; False if it has no fix"""
+        position = read_position(frame)
+        if position is None:
+            return False
+        if len(frame) > SATELLITES_OFFSET and frame[SATELLITES_OFFSET] == 0:
+            return False
+        return self.update(frame[UNIQUE_ID].hex().upper(), position[0], position[1], timestamp)
+
+    def update(self, controller: str, lat: float, lon: float, timestamp: float) -> bool:
+        """Feed one position fix"""
+        if self.geofences_path and time.monotonic() >= self._next_check:
+            self.reload()
+        track = self.tracks.get(controller)
+        if track is None:
+            track = self.tracks[controller] = Track(self._row(controller), lat, lon, timestamp)
+            self._index(track, track.cell)
+            self._store(track)
+            for fence in self.geofences:
+                if fence.applies(controller):
+                    track.inside[fence.name] = fence.contains(lat, lon, False)
+            return True
+        dt = timestamp - track.time
+        if dt <= 0:
+            return False
+        step = distance(track.lat, track.lon, lat, lon)
+        if step > MAX_SPEED_KMH / 3.6 * dt + STOP_METERS:
+            return False   # glitch
+
+        track.lat, track.lon, track.time = lat, lon, timestamp
+        cell = cell_of(lat, lon)
+        if cell != track.cell:
+            rows = self.cells[track.cell]
+            rows.discard(track.row)
+            if not rows:
+                del self.cells[track.cell]
+            self._index(track, cell)
+        self._store(track)
+        last = track.points[-1]
+        if distance(last[1], last[2], lat, lon) >= TRACK_MIN_METERS:
+            track.points.append((timestamp, lat, lon))
+
+        self._movement(controller, track, step)
+        for fence in self.geofences:
+            if not fence.applies(controller):
+                continue
+            was_inside = track.inside.get(fence.name)
+            inside = fence.contains(lat, lon, bool(was_inside))
+            track.inside[fence.name] = inside
+            if was_inside is not None and inside != was_inside:
+                self._event(controller, "geofence_enter" if inside else "geofence_exit", track, geofence=fence.name)
+        return True
+
+    def _movement(self, controller: str, track: Track, step: float):
+        lat, lon, timestamp = track.lat, track.lon, track.time
+        if not track.moving:
+            parked_lat, parked_lon, _ = track.parked
+            if distance(parked_lat, parked_lon, lat, lon) > MOVE_METERS:
+                track.moving = True
+                track.travelled = distance(parked_lat, parked_lon, lat, lon)
+                track.still = (lat, lon, timestamp)
+                self._event(controller, "moving", track, parked_latitude=parked_lat, parked_longitude=parked_lon)
+            return
+        track.travelled += step
+        still_lat, still_lon, since = track.still
+        if distance(still_lat, still_lon, lat, lon) > STOP_METERS:
+            track.still = (lat, lon, timestamp)
+        elif timestamp - since >= STOP_SECONDS:
+            parked_lat, parked_lon, _ = track.parked
+            track.moving = False
+            track.parked = (still_lat, still_lon, since)
+            self._event(controller, "stopped", track, distance_m=round(track.travelled, 1),
+                        displacement_m=round(distance(parked_lat, parked_lon, still_lat, still_lon), 1))
+
+    def _event(self, controller: str, kind: str, track: Track, **details):
+        event = {"controller": controller, "kind": kind, "time": track.time,
+                 "latitude": track.lat, "longitude": track.lon}
+        event.update(details)
+        self.events.append(event)
+        self.events_version += 1
+
+    def _index(self, track: Track, cell: tuple):
+        self.cells.setdefault(cell, set()).add(track.row)
+        track.cell = cell
+        i, j = cell
+        if self.bounds is None:
+            self.bounds = [i, i, j, j]
+        else:
+            bounds = self.bounds
+            bounds[0], bounds[1] = min(bounds[0], i), max(bounds[1], i)
+            bounds[2], bounds[3] = min(bounds[2], j), max(bounds[3], j)
+
+    def _store(self, track: Track):
+        self.lat[track.row], self.lon[track.row], self.times[track.row] = track.lat, track.lon, track.time
+        self.version += 1
+
+    def _row(self, controller: str) -> int:
+        row = len(self.controllers)
+        self.controllers.append(controller)
+        if row == len(self.lat):
+            grow = np.full(row, np.nan)
+            self.lat, self.lon, self.times = (np.concatenate([array, grow]) for array in (self.lat, self.lon, self.times))
+        return row
+
+    def reload(self) -> bool:
+        """Load the geofence file if it changed"""
+        self._next_check = time.monotonic() + RELOAD_INTERVAL
+        try:
+            st = os.stat(self.geofences_path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            if signature:
+                with open(self.geofences_path, "r", encoding="utf-8") as f:
+                    geofences = [Geofence(spec) for spec in json.load(f)["geofences"]]
+            else:
+                geofences = []
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+            print(f"[!] Geofences in {self.geofences_path} not loaded, keeping {len(self.geofences)}: {e}")
+            return False
+        self.geofences = geofences
+        names = {fence.name for fence in geofences}
+        for controller, track in self.tracks.items():
+            # New or changed fences start from the current position, without an event
+            track.inside = {name: inside for name, inside in track.inside.items() if name in names}
+            for fence in geofences:
+                if fence.applies(controller) and fence.name not in track.inside:
+                    track.inside[fence.name] = fence.contains(track.lat, track.lon, False)
+        print(f"[+] Loaded {len(geofences)} geofences from {self.geofences_path}")
+        return True
+
+    # --- queries ---
+
+    def _entries(self, rows, distances=None) -> list:
+        entries = []
+        for i, row in enumerate(rows):
+            controller = self.controllers[row]
+            track = self.tracks[controller]
+            entry = {"controller": controller, "latitude": track.lat, "longitude": track.lon,
+                     "time": track.time, "moving": track.moving}
+            if distances is not None:
+                entry["distance_m"] = round(float(distances[i]), 1)
+            entries.append(entry)
+        return entries
+
+    def bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list:
+        """Controllers inside a bounding box (min_lon > max_lon crosses the antimeridian)"""
+        spans = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+        rows = []
+        for low, high in spans:
+            lat_cells = range(math.floor(min_lat / CELL_DEGREES), math.floor(max_lat / CELL_DEGREES) + 1)
+            lon_cells = range(math.floor(low / CELL_DEGREES), math.floor(high / CELL_DEGREES) + 1)
+            if len(lat_cells) * len(lon_cells) <= len(self.cells):
+                cells = ((i, j) for i in lat_cells for j in lon_cells)
+            else:
+                cells = (cell for cell in self.cells if cell[0] in lat_cells and cell[1] in lon_cells)
+            for cell in cells:
+                rows.extend(self.cells.get(cell, ()))
+        if not rows:
+            return []
+        rows = np.array(sorted(set(rows)))
+        lat, lon = self.lat[rows], self.lon[rows]
+        inside = (lat >= min_lat) & (lat <= max_lat)
+        inside &= ((lon >= min_lon) & (lon <= max_lon)) if min_lon <= max_lon else ((lon >= min_lon) | (lon <= max_lon))
+        return self._entries(rows[inside])
+
+    def nearest(self, lat: float, lon: float, n: int = 10, max_distance: float = None) -> list:
+        """The n controllers closest to a point, nearest first"""
+        if not self.cells:
+            return []
+        center_i, center_j = cell_of(lat, lon)
+        min_i, max_i, min_j, max_j = self.bounds
+        extent = max(center_i - min_i, max_i - center_i, center_j - min_j, max_j - center_j)
+        candidates = []
+        best = None
+        for ring in range(extent + 1):
+            if ring:
+                # Nothing in this ring or beyond is closer than `bound`
+                edge = min(89.9, abs(lat) + (ring + 1) * CELL_DEGREES)
+                bound = (ring - 1) * CELL_DEGREES * METERS_PER_DEGREE * math.cos(math.radians(edge))
+                if (best is not None and bound > best) or (max_distance is not None and bound > max_distance):
+                    break
+                if 8 * ring > len(self.cells):
+                    # The ring has more cells than are occupied: measure every position in one pass
+                    lat_rows = self.lat[:len(self.controllers)]
+                    candidates = np.flatnonzero(lat_rows == lat_rows)
+                    break
+            for i in range(center_i - ring, center_i + ring + 1):
+                step = 1 if abs(i - center_i) == ring else 2 * ring or 1
+                for j in range(center_j - ring, center_j + ring + 1, step):
+                    candidates.extend(self.cells.get((i, j), ()))
+            if len(candidates) >= n:
+                rows = np.array(candidates)
+                distances = haversine(lat, lon, self.lat[rows], self.lon[rows])
+                best = np.partition(distances, n - 1)[n - 1]
+        if not len(candidates):
+            return []
+        rows = np.array(candidates)
+        distances = haversine(lat, lon, self.lat[rows], self.lon[rows])
+        order = np.argsort(distances, kind="stable")[:n]
+        if max_distance is not None:
+            order = order[distances[order] <= max_distance]
+        return self._entries(rows[order], distances[order])
+
+    def track(self, controller: str, since: float = None) -> list:
+        """Stored track points of a controller, oldest first"""
+        track = self.tracks.get(controller)
+        if track is None:
+            return []
+        return [{"time": t, "latitude": lat, "longitude": lon} for t, lat, lon in track.points
+                if since is None or t >= since]
+
+    def recent_events(self, controller: str = None, kind: str = None) -> list:
+        return [event for event in self.events
+                if (controller is None or event["controller"] == controller) and (kind is None or event["kind"] == kind)]
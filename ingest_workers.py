@@ -0,0 +1,259 @@
+"""
+Multi-process ingest: N listener workers sharing LISTENER_PORT via SO_REUSEPORT
+The kernel spreads incoming connections over the workers. Each worker runs its
+own IngestEngine loop and does the CPU work (decode, JSON rendering); anything
+that touches shared files goes through the coordinator (parent process):
+
+    worker -> coordinator   telemetry (frame + rendered snapshot files), event
+                            packets, health changes, block and attempt reports
+    coordinator -> worker   newly blocked IPs, stop
+
+The coordinator owns packets/, the frame archive, health.json and
+blocked_ips.json. Per batch of queued frames it writes only the newest
+snapshot, and it restarts workers that exit unexpectedly. Anomaly baselines
+and analytics state live in the worker a controller is connected to, so
+anomalies.json, fuel_events.json and power_quality.json are the view of the
+worker that reported the last change.
+
+Usage (Linux):
+    python3 datakom_listener.py --workers 4
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+
+from datakom_listener import (
+    HOST, PORT, BASE_DIR, DATA_DIR,
+    IngestEngine, cleanup_old_packets, packet_filename, save_packet,
+)
+
+POLL_INTERVAL = 0.5   # coordinator: worker liveness and stop checks
+STOP_TIMEOUT = 10     # seconds workers get to finish their sessions
+MAX_BATCH = 500       # messages handled per snapshot write
+
+
+class WorkerEngine(IngestEngine):
+    """
+    IngestEngine of one worker process: shared-file work goes to the coordinator
+
+    Args:
+        index: Worker number, reported with every message
+        outbox: Queue to the coordinator
+        blocked: IPs blocked at spawn time; later blocks arrive via the inbox
+    """
+
+    def __init__(self, index: int, outbox, blocked, **kwargs):
+        super().__init__(archive=False, reuse_port=True, **kwargs)
+        self.index = index
+        self.outbox = outbox
+        self.blocked = set(blocked)
+
+    def prepare(self):
+        self.update_health("Listening")
+        return self
+
+    def update_health(self, state: str, error: dict = None):
+        self.outbox.put(("health", self.index, state, error))
+
+    def check_blocked(self, client_ip: str) -> bool:
+        if client_ip not in self.blocked:
+            return False
+        # The coordinator logs and counts the attempt
+        self.outbox.put(("block", self.index, client_ip, None, ""))
+        return True
+
+    def block_ip(self, ip: str, reason: str, first_packet_hex: str):
+        self.blocked.add(ip)
+        self.outbox.put(("block", self.index, ip, reason, first_packet_hex))
+
+    def save_event(self, data: bytes):
+        self.outbox.put(("event", self.index, data))
+
+    def handle_telemetry(self, data: bytes):
+        from packet_pipeline import render_snapshot
+
+        filename = packet_filename()
+        telemetry, alerts, files = render_snapshot(data, filename, detector=self.detector(), rules=self.rules(),
+                                                   stages=self.stages())
+        self.outbox.put(("telemetry", self.index, data, filename, files))
+        self.telemetry = (self.telemetry[0] + 1, telemetry)
+        self.alerts = (self.alerts[0] + 1, alerts)
+
+
+def follow_coordinator(engine: WorkerEngine, inbox, parent_pid: int):
+    """Apply blocklist updates and stop requests; stop if the coordinator died"""
+    while True:
+        try:
+            message = inbox.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                engine.stop()
+                return
+            continue
+        if message[0] == "blocked":
+            engine.blocked.add(message[1])
+        elif message[0] == "stop":
+            engine.stop()
+            return
+
+
+def worker_main(index: int, host: str, port: int, base_dir: str, data_dir: str,
+                outbox, inbox, blocked: list, parent_pid: int):
+    # Ctrl+C reaches the whole process group; the coordinator decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    engine = WorkerEngine(index, outbox, blocked, host=host, port=port, base_dir=base_dir, data_dir=data_dir)
+    engine.start().warm_up()
+    threading.Thread(target=follow_coordinator, args=(engine, inbox, parent_pid),
+                     name="coordinator-inbox", daemon=True).start()
+    engine.serve_forever()
+
+
+class Coordinator:
+    """
+    Supervises the worker processes and owns every shared file
+
+    Args:
+        workers: Number of worker processes
+        host, port, base_dir, data_dir, archive: As for IngestEngine
+    """
+
+    def __init__(self, workers: int, host: str = HOST, port: int = PORT, base_dir: str = BASE_DIR,
+                 data_dir: str = DATA_DIR, archive: bool = True):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        # Files only: blocklist, health, packets, archive - never binds
+        self.store = IngestEngine(host, port, base_dir, data_dir, archive)
+
+        self._context = multiprocessing.get_context("spawn")
+        self.outbox = self._context.Queue()
+        self.processes = {}
+        self.worker_state = {}
+        self.telemetry_counter = 0
+        self._stopping = False
+
+    def start(self):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("Multiple workers need SO_REUSEPORT (Linux, BSD)")
+        self.store.prepare()
+        for index in range(self.workers):
+            self._spawn(index)
+        print(f"[+] {self.workers} ingest workers on {self.host}:{self.port}")
+        return self
+
+    def _spawn(self, index: int):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main, name=f"ingest-worker-{index}",
+            args=(index, self.host, self.port, self.store.base_dir, self.store.data_dir,
+                  self.outbox, inbox, list(self.store.load_blocked_ips()), os.getpid()),
+        )
+        process.start()
+        self.processes[index] = (process, inbox)
+        self.worker_state[index] = {"state": "Starting", "pid": process.pid, "telemetry": 0}
+
+    def serve_forever(self):
+        while not self._stopping:
+            self._drain(POLL_INTERVAL)
+            self._check_workers()
+        self._shutdown()
+
+    def serve(self):
+        """serve_forever() until SIGINT/SIGTERM"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda signum, frame: self.stop())
+        self.serve_forever()
+
+    def stop(self):
+        self._stopping = True
+
+    def _check_workers(self):
+        for index, (process, _) in list(self.processes.items()):
+            if not process.is_alive() and not self._stopping:
+                print(f"[!] Worker {index} exited with code {process.exitcode}, restarting")
+                self._spawn(index)
+
+    def _drain(self, timeout: float) -> int:
+        """Handle queued worker messages, returns how many"""
+        try:
+            batch = [self.outbox.get(timeout=timeout)]
+        except queue.Empty:
+            return 0
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(self.outbox.get_nowait())
+            except queue.Empty:
+                break
+
+        store = self.store
+        latest = {}
+        events = 0
+        for message in batch:
+            kind, index = message[0], message[1]
+            if kind == "telemetry":
+                _, _, data, filename, files = message
+                save_packet(store.dir_telemetry, data, filename)
+                if store.frame_archive:
+                    store.frame_archive.append(data)
+                # anomalies.json & co. come only with frames that changed them
+                latest.update(files)
+                self.telemetry_counter += 1
+                self.worker_state[index]["telemetry"] += 1
+            elif kind == "event":
+                save_packet(store.dir_event, message[2])
+                events += 1
+            elif kind == "health":
+                self._worker_health(index, message[2], message[3])
+            elif kind == "block":
+                self._block(index, *message[2:])
+
+        # telemetry.json & co. only hold the newest frame
+        if latest:
+            from packet_pipeline import write_snapshot
+            write_snapshot(latest, store.data_dir)
+            cleanup_old_packets(store.dir_telemetry, 20)
+        if events:
+            cleanup_old_packets(store.dir_event, 10)
+        return len(batch)
+
+    def _worker_health(self, index: int, state: str, error: dict):
+        self.worker_state[index]["state"] = state
+        self.store.health_state["workers"] = {str(i): dict(s) for i, s in sorted(self.worker_state.items())}
+        if state in ("Listening", "Stopped"):
+            # Worker lifecycle, not a connection change
+            state = self.store.health_state["connect_state"]
+        self.store.update_health(state, error)
+
+    def _block(self, index: int, ip: str, reason: str, first_packet_hex: str):
+        if reason is None:
+            self.store.check_blocked(ip)
+            return
+        self.store.block_ip(ip, reason, first_packet_hex)
+        for other, (_, inbox) in self.processes.items():
+            if other != index:
+                inbox.put(("blocked", ip))
+
+    def _shutdown(self):
+        for _, inbox in self.processes.values():
+            inbox.put(("stop",))
+        # Keep reading while workers finish, so none blocks on a full queue
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while time.monotonic() < deadline and any(p.is_alive() for p, _ in self.processes.values()):
+            self._drain(0.1)
+        for process, _ in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        while self._drain(0.05):
+            pass
+
+        if self.store.frame_archive:
+            self.store.frame_archive.close()
+        self.store.update_health("Stopped")
+        print(f"[+] Stopped {self.workers} ingest workers ({self.telemetry_counter} telemetry frames)")
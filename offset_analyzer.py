@@ -0,0 +1,295 @@
+"""
+Offset discovery over the frame archive
+Every byte of the frame that no decoder field reads is a candidate field. For
+each candidate (u8, u16, i16 and u32 little-endian at every unknown offset)
+the analyzer accumulates, CHUNK_FRAMES frames at a time with constant memory:
+
+    std            spread of the value over all frames
+    change_rate    share of consecutive frames of one controller where it changes
+    monotonicity   |increases - decreases| / changes; 1.0 = counter-like
+    correlation    Pearson r against known parameters (RPM, voltages, state, ...)
+
+and ranks the candidates into a report of likely fields. This replaces
+looking at unknown_offsets.json of the latest packet, which the listener no
+longer writes unless DATAKOM_UNKNOWN_OFFSETS=1.
+
+Usage:
+    python offset_analyzer.py --top 40
+    python offset_analyzer.py --archive-dir packets/archive --start 2025-01-01 --output offsets.json
+"""
+
+import argparse
+import json
+from collections import Counter
+
+import numpy as np
+
+import batch_decoder
+from batch_decoder import decode_frames, iter_archive_frames, segment_sizes
+from frame_archive import ARCHIVE_DIR, list_segments
+from replay import parse_time
+
+# Known parameters the candidates are correlated with
+REFERENCE_KEYS = (
+    "engine_rpm", "state", "mode", "genset_L1_V", "genset_I1_A", "genset_P_total_kW", "genset_freq_Hz",
+    "mains_L1_V", "battery_voltage_Vdc", "coolant_temp_C", "oil_pressure_bar", "fuel_level_percent",
+    "runtime_counter_minutes", "total_kWh",
+)
+
+# Interpretations tried at every offset whose bytes are all unknown
+CANDIDATE_TYPES = (("u8", 1, "<u1"), ("u16", 2, "<u2"), ("i16", 2, "<i2"), ("u32", 4, "<u4"))
+
+# SENDER alarm slots and alarm messages (decoded as alerts)
+ALERT_REGION = (258, 503)
+
+UNIQUE_ID = (21, 33)
+
+# Frames per update step; the candidate matrix is ~45 MB per chunk for 11800-byte frames
+CHUNK_FRAMES = 128
+
+
+def known_mask(frame_size: int) -> np.ndarray:
+    """True for every byte some decoder field reads, for frames of this size"""
+    known = np.zeros(frame_size, dtype=bool)
+
+    def mark(start, end):
+        known[start:min(end, frame_size)] = True
+
+    for _, offset, width, _, na_below in batch_decoder.FIELDS:
+        if frame_size >= na_below:
+            mark(offset, offset + width)
+    for _, offset, width, _, present_above in batch_decoder.OPTIONAL_FIELDS:
+        if frame_size > present_above:
+            mark(offset, offset + width)
+    for _, offset, _ in batch_decoder.SERVICE_COUNTERS:
+        if frame_size > offset + 4:
+            mark(offset, offset + 4)
+    for _, start, end, na_below in batch_decoder.BYTE_FIELDS:
+        if frame_size >= max(na_below, end):
+            mark(start, end)
+    for _, offset, _, count, _ in (batch_decoder.HARMONICS, batch_decoder.SCOPEMETER):
+        mark(offset, offset + count * 2)
+    for _, offset in batch_decoder.ALARM_WORDS:
+        mark(offset, offset + batch_decoder.ALARM_WORD_COUNT * 2)
+    mark(18, 20)  # modbus_port
+    mark(*ALERT_REGION)
+    return known
+
+
+def candidates(frame_size: int) -> list:
+    """(name, offset, width, dtype) of every interpretation over unknown bytes only"""
+    unknown = ~known_mask(frame_size)
+    result = []
+    for name, width, dtype in CANDIDATE_TYPES:
+        for offset in range(frame_size - width + 1):
+            if unknown[offset:offset + width].all():
+                result.append((name, offset, width, dtype))
+    return result
+
+
+def candidate_matrix(frames: np.ndarray, specs: list) -> np.ndarray:
+    """(frames x candidates) float64 matrix of every candidate's value"""
+    values = np.empty((len(frames), len(specs)))
+    for column, (name, offset, width, _) in enumerate(specs):
+        values[:, column] = batch_decoder.field_view(frames, offset, width, signed=name.startswith("i"))
+    return values
+
+
+class OffsetStats:
+    """
+    Streaming statistics of candidate fields against reference parameters
+
+    Args:
+        frame_size: Only frames of this length are analyzed
+        reference_keys: decode_frames keys to correlate with
+    """
+
+    def __init__(self, frame_size: int, reference_keys=REFERENCE_KEYS):
+        self.frame_size = frame_size
+        self.specs = candidates(frame_size)
+        self.reference_keys = list(reference_keys)
+        self.frames = 0
+        self.transitions = 0
+        self._shift = None
+        self._ref_shift = None
+        size = len(self.specs)
+        self.sum = np.zeros(size)
+        self.sum_sq = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.changes = np.zeros(size)
+        self.increases = np.zeros(size)
+        self.decreases = np.zeros(size)
+        refs = len(self.reference_keys)
+        self.ref_sum = np.zeros(refs)
+        self.ref_sum_sq = np.zeros(refs)
+        self.cross = np.zeros((size, refs))
+        self._last = {}  # controller unique id -> last candidate row
+
+    def _references(self, frames: np.ndarray) -> np.ndarray:
+        columns = decode_frames(frames)
+        return np.column_stack([np.nan_to_num(np.asarray(columns[key], dtype=np.float64))
+                                for key in self.reference_keys])
+
+    def update(self, timestamps: np.ndarray, frames: np.ndarray):
+        """Add a batch of frames (any mix of controllers, each controller's frames in time order)"""
+        for first in range(0, len(frames), CHUNK_FRAMES):
+            self._update(timestamps[first:first + CHUNK_FRAMES], frames[first:first + CHUNK_FRAMES])
+
+    def _update(self, timestamps: np.ndarray, frames: np.ndarray):
+        if len(frames) == 0:
+            return
+        x = candidate_matrix(frames, self.specs)
+        refs = self._references(frames)
+        if self._shift is None:
+            # Shifted sums keep the variance exact for large counters
+            self._shift = x[0].copy()
+            self._ref_shift = refs[0].copy()
+
+        self.min = np.minimum(self.min, x.min(axis=0))
+        self.max = np.maximum(self.max, x.max(axis=0))
+        x -= self._shift
+        y = refs - self._ref_shift
+        self.frames += len(x)
+        self.sum += x.sum(axis=0)
+        self.sum_sq += np.einsum("ij,ij->j", x, x)
+        self.ref_sum += y.sum(axis=0)
+        self.ref_sum_sq += (y * y).sum(axis=0)
+        self.cross += x.T @ y
+
+        # Consecutive frames of the same controller, in time order (rows of _last are shifted too)
+        ids = frames[:, UNIQUE_ID[0]:UNIQUE_ID[1]].view(f"S{UNIQUE_ID[1] - UNIQUE_ID[0]}")[:, 0]
+        order = np.lexsort((timestamps, ids))
+        ids = ids[order]
+        same = ids[1:] == ids[:-1]
+        diffs = [x[order[1:][same]] - x[order[:-1][same]]]
+        starts = np.flatnonzero(np.concatenate(([True], ~same)))
+        ends = np.concatenate((starts[1:], [len(ids)])) - 1
+        for start, end in zip(starts, ends):
+            controller = bytes(ids[start])
+            last = self._last.get(controller)
+            if last is not None:
+                diffs.append((x[order[start]] - last)[None, :])
+            self._last[controller] = x[order[end]].copy()
+        for diff in diffs:
+            self.transitions += len(diff)
+            self.changes += (diff != 0).sum(axis=0)
+            self.increases += (diff > 0).sum(axis=0)
+            self.decreases += (diff < 0).sum(axis=0)
+
+    def report(self, top: int = 50, min_change_rate: float = 0.0) -> dict:
+        n = max(self.frames, 1)
+        mean = self.sum / n
+        var = np.maximum(self.sum_sq / n - mean * mean, 0.0)
+        ref_mean = self.ref_sum / n
+        ref_var = np.maximum(self.ref_sum_sq / n - ref_mean * ref_mean, 0.0)
+        cov = self.cross / n - np.outer(mean, ref_mean)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.sqrt(np.outer(var, ref_var))
+        corr = np.nan_to_num(corr)
+        best = np.abs(corr).argmax(axis=1) if corr.size else np.zeros(len(self.specs), dtype=int)
+        best_corr = corr[np.arange(len(self.specs)), best] if corr.size else np.zeros(len(self.specs))
+
+        transitions = max(self.transitions, 1)
+        change_rate = self.changes / transitions
+        with np.errstate(divide="ignore", invalid="ignore"):
+            monotonicity = np.nan_to_num(np.abs(self.increases - self.decreases) / self.changes)
+
+        # Varying fields that track a known parameter or count monotonically rank first
+        score = np.where(var > 0, np.maximum(np.abs(best_corr), monotonicity * (change_rate > 0)), 0.0)
+        varying = (var > 0) & (change_rate >= min_change_rate)
+        # A signed reading that never goes negative repeats the unsigned one
+        varying &= ~(np.array([name.startswith("i") for name, *_ in self.specs], dtype=bool) & (self.min >= 0))
+        ranked = sorted(np.flatnonzero(varying), key=lambda i: (-score[i], -change_rate[i]))
+
+        rows = []
+        for i in ranked[:top]:
+            name, offset, width, _ = self.specs[i]
+            rows.append({
+                "offset": offset,
+                "type": name,
+                "score": round(float(score[i]), 4),
+                "std": round(float(np.sqrt(var[i])), 4),
+                "min": float(self.min[i]),
+                "max": float(self.max[i]),
+                "change_rate": round(float(change_rate[i]), 4),
+                "monotonicity": round(float(monotonicity[i]), 4),
+                "best_reference": self.reference_keys[best[i]] if self.reference_keys else None,
+                "correlation": round(float(best_corr[i]), 4),
+            })
+        return {
+            "frame_size": self.frame_size,
+            "frames": self.frames,
+            "controllers": len(self._last),
+            "unknown_bytes": int((~known_mask(self.frame_size)).sum()),
+            "candidates": len(self.specs),
+            "constant_candidates": int((var == 0).sum()),
+            "ranked": rows,
+        }
+
+
+def analyze_archive(archive_dir: str = ARCHIVE_DIR, frame_size: int = None,
+                    start: float = None, end: float = None) -> OffsetStats:
+    """Run OffsetStats over every segment (most common frame size unless given)"""
+    segments = [path for _, path in list_segments(archive_dir)]
+    if frame_size is None:
+        sizes = Counter()
+        for path in segments:
+            sizes.update(segment_sizes(path))
+        if not sizes:
+            raise SystemExit(f"No frames in {archive_dir}")
+        frame_size = sizes.most_common(1)[0][0]
+
+    stats = OffsetStats(frame_size)
+    for path in segments:
+        for size, timestamps, frames in iter_archive_frames(path, CHUNK_FRAMES):
+            if size != frame_size:
+                continue
+            keep = np.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                keep &= timestamps >= start
+            if end is not None:
+                keep &= timestamps <= end
+            stats.update(timestamps[keep], frames[keep])
+    return stats
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['frames']} frames of {report['frame_size']} bytes from {report['controllers']} controllers, "
+        f"{report['unknown_bytes']} unknown bytes, {report['candidates']} candidates "
+        f"({report['constant_candidates']} constant)",
+        "",
+        f"{'offset':>6} {'type':4} {'score':>6} {'std':>12} {'min':>12} {'max':>12} "
+        f"{'change':>7} {'mono':>5}  best reference (r)",
+    ]
+    for row in report["ranked"]:
+        lines.append(
+            f"{row['offset']:6d} {row['type']:4} {row['score']:6.3f} {row['std']:12.2f} {row['min']:12.0f} "
+            f"{row['max']:12.0f} {row['change_rate']:7.3f} {row['monotonicity']:5.2f}  "
+            f"{row['best_reference']} ({row['correlation']:+.3f})"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank unknown frame offsets as candidate fields")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--frame-size", type=int, help="Frame length to analyze (default: most common)")
+    parser.add_argument("--start", help="First frame time (unix seconds or ISO 8601)")
+    parser.add_argument("--end", help="Last frame time (unix seconds or ISO 8601)")
+    parser.add_argument("--top", type=int, default=50, help="Candidates in the report")
+    parser.add_argument("--min-change-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    stats = analyze_archive(args.archive_dir, args.frame_size, parse_time(args.start), parse_time(args.end))
+    report = stats.report(args.top, args.min_change_rate)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Packet classification and telemetry persistence
+Shared by datakom_listener (live traffic) and replay.py (captured traffic), so
+both run exactly the same classify -> decode -> persist path.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from config import UNKNOWN_OFFSETS_SNAPSHOT
+from decoder import decode_telemetry, decode_unknown_offsets
+
+DATA_DIR = "data"
+TELEMETRY_JSON = "telemetry.json"
+ALERTS_JSON = "alerts.json"
+UNKNOWN_JSON = "unknown_offsets.json"
+ANOMALIES_JSON = "anomalies.json"
+
+TELEMETRY_MIN_SIZE = 600
+
+
+def classify_packet(data: bytes) -> str:
+    if len(data) <= 8:
+        return "keepalive"
+    if data.startswith(b"DY0DD500") or data.startswith(b"DKV0"):
+        if len(data) >= TELEMETRY_MIN_SIZE:
+            return "telemetry"
+        return "keepalive"
+    return "event"
+
+
+def json_text(content) -> str:
+    return json.dumps(content, indent=2, ensure_ascii=False)
+
+
+def write_json(path: str, content):
+    write_text(path, json_text(content))
+
+
+def write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def render_snapshot(data: bytes, raw_packet_file: str, timestamp: datetime = None, detector=None,
+                    rules=None, stages=(), snapshots: dict = None) -> tuple:
+    """
+    Decode a telemetry frame and render the snapshot files (no disk access)
+
+    Args:
+        data: Telemetry frame
+        raw_packet_file: Name of the saved packet file, stored with the snapshot
+        timestamp: Receive time (default: now)
+        detector: AnomalyDetector fed with the frame; its active anomalies go to
+            alerts["anomaly"], and anomalies.json is rendered when an event fired
+        rules: RuleEngine; results of the rules active for the controller go to alerts["rules"]
+        stages: Analytics stages (FuelMonitor, ...). stage.observe(controller, telemetry,
+            alerts, unix_time) returns True when the stage's snapshot changed, which is
+            then rendered to stage.snapshot_file
+        snapshots: Filled with snapshot_file -> data of the stages rendered for this
+            frame, so callers can serve them without calling stage.snapshot() again
+
+    Returns:
+        (telemetry, alerts, files) - files maps file name -> JSON text
+    """
+    timestamp = timestamp or datetime.now()
+
+    decoded = decode_telemetry(data)
+
+    # Extract alerts before saving telemetry
+    alerts = decoded.pop("_alerts_internal", {"shutDown": [], "warning": [], "loadDump": []})
+
+    files = {}
+    controller = decoded.get("unique_id", {}).get("value", "")
+    if detector is not None:
+        if detector.update(controller, decoded, timestamp.timestamp()):
+            files[ANOMALIES_JSON] = json_text(detector.snapshot())
+        alerts["anomaly"] = detector.active(controller)
+    if rules is not None:
+        alerts["rules"] = rules.evaluate(controller, decoded, timestamp.timestamp())
+    for stage in stages:
+        if stage.observe(controller, decoded, alerts, timestamp.timestamp()):
+            snapshot = stage.snapshot()
+            files[stage.snapshot_file] = json_text(snapshot)
+            if snapshots is not None:
+                snapshots[stage.snapshot_file] = snapshot
+
+    timestamp = timestamp.isoformat()
+
+    decoded["timestamp"] = timestamp
+    decoded["raw_packet_file"] = raw_packet_file
+
+    files[TELEMETRY_JSON] = json_text(decoded)
+    files[ALERTS_JSON] = json_text(alerts)
+    if UNKNOWN_OFFSETS_SNAPSHOT:
+        unknown = decode_unknown_offsets(data)
+        unknown["timestamp"] = timestamp
+        unknown["raw_packet_file"] = raw_packet_file
+        files[UNKNOWN_JSON] = json_text(unknown)
+    return decoded, alerts, files
+
+
+def write_snapshot(files: dict, data_dir: str = DATA_DIR):
+    for name, text in files.items():
+        write_text(os.path.join(data_dir, name), text)
+
+
+def persist_telemetry(data: bytes, raw_packet_file: str, data_dir: str = DATA_DIR,
+                      timestamp: datetime = None, detector=None, rules=None, stages=(),
+                      snapshots: dict = None) -> tuple:
+    """
+    Decode a telemetry frame and save telemetry and alerts (and unknown offsets if enabled)
+
+    Args:
+        data: Telemetry frame
+        raw_packet_file: Name of the saved packet file, stored with the snapshot
+        data_dir: Directory of the JSON snapshots
+        timestamp: Receive time (default: now)
+        detector: AnomalyDetector, see render_snapshot
+        rules: RuleEngine, see render_snapshot
+        stages: Analytics stages, see render_snapshot
+        snapshots: See render_snapshot
+
+    Returns:
+        (telemetry, alerts) as written to telemetry.json and alerts.json
+    """
+    decoded, alerts, files = render_snapshot(data, raw_packet_file, timestamp, detector, rules, stages, snapshots)
+    write_snapshot(files, data_dir)
+    return decoded, alerts
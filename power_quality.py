@@ -0,0 +1,195 @@
+"""
+Power quality from the scopemeter and harmonic fields of extended frames
+Every extended frame carries 100 scopemeter samples and the harmonic levels of
+one channel, chosen by the selector at 10403, which rotates from packet to
+packet. The monitor keeps the latest waveform of each channel per controller
+and computes, vectorized over all waveforms that changed since the last
+snapshot:
+
+    rms, peak, crest_factor   of the waveform with its DC offset removed
+    spectrum                  FFT amplitudes at the fundamental (strongest
+                              bin) and its multiples, % of the fundamental
+    thd_percent               total harmonic distortion from that spectrum
+    harmonic_thd_percent      THD from the controller's own harmonic levels
+
+Only harmonics 3-10 are used for harmonic_thd_percent: decode_telemetry reads
+29 levels from 10386, but from the 11th on they overlap the selector and the
+scopemeter points. For the same reason only the low byte of the selector is
+the channel (its high byte is the first scopemeter sample).
+
+Waveforms are stored raw (uint16). Metrics are computed when a snapshot is
+requested, once per version, and only for controllers that sent a waveform
+since the previous snapshot.
+"""
+
+from operator import itemgetter
+
+import numpy as np
+
+SNAPSHOT_JSON = "power_quality.json"
+
+SCOPE_POINTS = 100
+CHANNELS = 8               # selector values tracked per controller (0..CHANNELS-1)
+HARMONIC_ORDERS = range(3, 11)
+SPECTRUM_ORDERS = 15       # harmonic orders in the reported spectrum
+SNAPSHOT_INTERVAL = 5.0    # seconds between power_quality.json renders
+
+SCOPE_KEYS = tuple(f"scopemeter_point_{i + 1}" for i in range(SCOPE_POINTS))
+HARMONIC_KEYS = tuple(f"harmonic_{order:02}_level" for order in HARMONIC_ORDERS)
+CHANNEL_KEY = "selected_channel_harmonic_scopemeter"
+
+
+def waveform_metrics(samples: np.ndarray, orders: int = SPECTRUM_ORDERS) -> dict:
+    """
+    RMS, peak, crest factor, harmonic spectrum and THD of waveforms
+
+    Args:
+        samples: (waveforms x points) raw samples, any numeric dtype
+        orders: Harmonic orders in the returned spectrum
+
+    Returns:
+        Dict of arrays with one row per waveform; spectrum is (waveforms x orders),
+        % of the fundamental, NaN beyond the Nyquist bin
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    x = x - x.mean(axis=1, keepdims=True)
+    count, points = x.shape
+    rms = np.sqrt(np.einsum("ij,ij->i", x, x) / points)
+    peak = np.abs(x).max(axis=1)
+    crest = np.divide(peak, rms, out=np.full(count, np.nan), where=rms > 0)
+
+    amplitude = np.abs(np.fft.rfft(x, axis=1))
+    fundamental = amplitude[:, 1:].argmax(axis=1) + 1
+    rows = np.arange(count)
+    base = amplitude[rows, fundamental]
+
+    # Bins of orders 1..orders; orders past Nyquist are NaN
+    order_bins = fundamental[:, None] * np.arange(1, orders + 1)
+    valid = order_bins < amplitude.shape[1]
+    levels = np.where(valid, amplitude[rows[:, None], np.where(valid, order_bins, 0)], np.nan)
+    np.divide(levels, base[:, None], out=levels, where=base[:, None] > 0)
+    levels *= 100
+
+    # THD over every multiple of the fundamental up to Nyquist, not only the reported orders
+    bins = np.arange(amplitude.shape[1])
+    multiples = (bins % fundamental[:, None] == 0) & (bins > fundamental[:, None])
+    distortion = np.sqrt(np.einsum("ij,ij->i", amplitude * multiples, amplitude))
+    thd = np.divide(distortion, base, out=np.full(count, np.nan), where=base > 0) * 100
+    return {
+        "rms": rms,
+        "peak": peak,
+        "crest_factor": crest,
+        "fundamental_bin": fundamental,
+        "thd_percent": thd,
+        "spectrum": levels,
+    }
+
+
+def harmonic_thd(levels: np.ndarray) -> np.ndarray:
+    """THD (%) from harmonic levels given in % of the fundamental, one row per waveform"""
+    levels = np.asarray(levels, dtype=np.float64)
+    return np.sqrt(np.einsum("ij,ij->i", levels, levels))
+
+
+def _rounded(value, digits: int):
+    value = float(value)
+    return None if value != value else round(value, digits)
+
+
+class ChannelWaveforms:
+    """Latest waveform and harmonic levels of each channel of one controller"""
+
+    __slots__ = ("samples", "harmonics", "time", "changed")
+
+    def __init__(self):
+        self.samples = np.zeros((CHANNELS, SCOPE_POINTS), dtype=np.uint16)
+        self.harmonics = np.zeros((CHANNELS, len(HARMONIC_KEYS)))
+        self.time = np.full(CHANNELS, np.nan)
+        self.changed = True
+
+
+class PowerQualityMonitor:
+    """
+    Per-channel waveform assembly and power quality metrics (analytics stage)
+
+    Args:
+        snapshot_interval: Minimum frame time between power_quality.json renders
+    """
+
+    snapshot_file = SNAPSHOT_JSON
+
+    def __init__(self, snapshot_interval: float = SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.controllers = {}   # controller id -> ChannelWaveforms
+        self.metrics = {}       # controller id -> {channel: metrics}, of the last snapshot
+        self.version = 0        # increments with every waveform
+        self.rendered = None    # frame time of the last file render
+        self._scope = itemgetter(*SCOPE_KEYS)
+        self._harmonics = itemgetter(*HARMONIC_KEYS)
+
+    def observe(self, controller: str, telemetry: dict, alerts: dict, timestamp: float) -> bool:
+        """Analytics stage hook: True when power_quality.json is due"""
+        if not self.update(controller, telemetry, timestamp):
+            return False
+        if self.rendered is None or timestamp - self.rendered >= self.snapshot_interval or timestamp < self.rendered:
+            self.rendered = timestamp
+            return True
+        return False
+
+    def update(self, controller: str, telemetry: dict, timestamp: float) -> bool:
+        """Store the frame's waveform under its channel; False if the frame has none"""
+        try:
+            channel = telemetry[CHANNEL_KEY]["value"] & 0xFF
+            samples = [item["value"] for item in self._scope(telemetry)]
+            harmonics = [item["value"] for item in self._harmonics(telemetry)]
+        except (KeyError, TypeError):
+            return False
+        if channel >= CHANNELS:
+            return False
+        waveforms = self.controllers.get(controller)
+        if waveforms is None:
+            waveforms = self.controllers[controller] = ChannelWaveforms()
+        waveforms.samples[channel] = samples
+        waveforms.harmonics[channel] = harmonics
+        waveforms.time[channel] = timestamp
+        waveforms.changed = True
+        self.version += 1
+        return True
+
+    def _refresh(self):
+        """Recompute the metrics of controllers with new waveforms, all in one vectorized pass"""
+        stale = [(controller, waveforms) for controller, waveforms in self.controllers.items() if waveforms.changed]
+        if not stale:
+            return
+        rows = []
+        for controller, waveforms in stale:
+            waveforms.changed = False
+            for channel in np.flatnonzero(~np.isnan(waveforms.time)):
+                rows.append((controller, waveforms, channel.item()))
+        samples = np.stack([waveforms.samples[channel] for _, waveforms, channel in rows])
+        metrics = waveform_metrics(samples)
+        metrics["harmonic_thd_percent"] = harmonic_thd(
+            np.stack([waveforms.harmonics[channel] for _, waveforms, channel in rows]))
+
+        for controller, _ in stale:
+            self.metrics[controller] = {}
+        for row, (controller, waveforms, channel) in enumerate(rows):
+            self.metrics[controller][str(channel)] = {
+                "time": waveforms.time[channel].item(),
+                "rms": _rounded(metrics["rms"][row], 2),
+                "peak": _rounded(metrics["peak"][row], 1),
+                "crest_factor": _rounded(metrics["crest_factor"][row], 3),
+                "thd_percent": _rounded(metrics["thd_percent"][row], 2),
+                "harmonic_thd_percent": _rounded(metrics["harmonic_thd_percent"][row], 2),
+                "fundamental_bin": metrics["fundamental_bin"][row].item(),
+                "spectrum": [_rounded(level, 2) for level in metrics["spectrum"][row]],
+            }
+
+    def snapshot(self) -> dict:
+        """Metrics per controller and channel (spectrum: orders 1..SPECTRUM_ORDERS), for the API"""
+        self._refresh()
+        return {
+            "controllers": dict(self.metrics),
+            "spectrum_orders": SPECTRUM_ORDERS,
+            "units": "scopemeter counts",
+        }
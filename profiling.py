@@ -0,0 +1,316 @@
+"""
+Opt-in profiling of the listener loop, toggled without restart
+Modes (combine with commas):
+    sample     - stack sampler thread over all threads, collapsed stacks rooted at
+                 the thread name (flamegraph.pl / speedscope); cheap enough to
+                 leave running for an hour in production
+    cprofile   - deterministic cProfile of the main thread and of the attached
+                 executor threads (the ingest I/O thread that decodes and
+                 persists), merged into one .prof + text summary
+    tracemalloc- top allocations at window end and growth since window start
+
+Control:
+    DATAKOM_PROFILE=sample,tracemalloc   start a window at startup
+    DATAKOM_PROFILE_WINDOW=3600          window length, seconds
+    DATAKOM_PROFILE_INTERVAL=0.01        sampling interval, seconds
+    kill -USR1 <pid>                     start a window, or stop the running one and write reports
+                                         (pm2 sendSignal SIGUSR1 datakom-listener)
+
+Reports are written to logs/ as profile_<timestamp>.* files.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+LOG_DIR = "logs"
+MODES = ("sample", "cprofile", "tracemalloc")
+DEFAULT_MODES = ("sample",)
+DEFAULT_WINDOW = 600.0
+DEFAULT_INTERVAL = 0.01
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 50
+
+
+def parse_modes(value: str) -> tuple:
+    modes = tuple(mode.strip() for mode in value.split(",") if mode.strip())
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s): {', '.join(unknown)} (use {', '.join(MODES)})")
+    return modes
+
+
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples thread stacks at a fixed interval into collapsed-stack counts
+
+    Args:
+        thread_id: Only sample this thread (None = every thread but the sampler;
+                   stacks are then rooted at the thread name)
+        interval: Seconds between samples
+    """
+
+    def __init__(self, thread_id: int = None, interval: float = DEFAULT_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is not None:
+                    self._record(frame)
+                continue
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident != self.ident:
+                    self._record(frame, names.get(ident, str(ident)))
+
+    def _record(self, frame, root: str = None):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        if root is not None:
+            names.append(root)
+        self.stacks[";".join(reversed(names))] += 1
+        self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """One 'frame;frame;frame count' line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """
+    One profiling window at a time (cprofile covers the main thread and the attached executors)
+
+    Args:
+        log_dir: Where reports are written
+        window: Seconds until the window closes and reports are written
+        interval: Sampling interval of the 'sample' mode
+    """
+
+    def __init__(self, log_dir: str = LOG_DIR, window: float = DEFAULT_WINDOW, interval: float = DEFAULT_INTERVAL):
+        self.log_dir = log_dir
+        self.window = window
+        self.interval = interval
+        self.modes = ()
+        self.started = None
+        self._sampler = None
+        self._cprofile = None
+        self._executors = []        # single-thread executors profiled alongside the main thread
+        self._thread_profiles = []  # (executor, cProfile.Profile enabled on its worker thread)
+        self._malloc_start = None
+        self._timer = None
+        self._stopped_profiles = []
+        # Re-entrant: signal handlers run on the main thread, possibly inside start/stop
+        self._lock = threading.RLock()
+
+    @property
+    def active(self) -> bool:
+        return self.started is not None
+
+    def attach(self, executor):
+        """Profile the worker thread of a single-thread executor too (cprofile); detach() when it shuts down"""
+        with self._lock:
+            self._executors.append(executor)
+            if self._cprofile is not None:
+                self._enable_on(executor)
+
+    def detach(self, executor):
+        with self._lock:
+            if executor in self._executors:
+                self._executors.remove(executor)
+            for entry in [entry for entry in self._thread_profiles if entry[0] is executor]:
+                # Disable before the executor shuts down; its stats stay in the window
+                self._disable_on(*entry)
+
+    def _enable_on(self, executor):
+        profile = cProfile.Profile()
+        try:
+            executor.submit(profile.enable).result(timeout=5)
+        except ValueError:
+            return  # Python 3.12+: the main-thread profile already sees every thread
+        except Exception as e:
+            print(f"[PROFILE] Executor thread not profiled: {e}")
+            return
+        self._thread_profiles.append((executor, profile))
+
+    def _disable_on(self, executor, profile):
+        try:
+            executor.submit(profile.disable).result(timeout=5)
+        except Exception:
+            pass  # executor already shut down: its thread is gone, the stats are kept
+        self._thread_profiles.remove((executor, profile))
+        self._stopped_profiles.append(profile)
+
+    def start(self, modes=DEFAULT_MODES, window: float = None):
+        """Open a profiling window (cprofile: main thread plus the attached executor threads)"""
+        with self._lock:
+            if self.active:
+                return
+            self.modes = tuple(modes)
+            self.started = time.time()
+            if "tracemalloc" in self.modes:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._malloc_start = tracemalloc.take_snapshot()
+            if "cprofile" in self.modes:
+                self._cprofile = cProfile.Profile()
+                self._cprofile.enable()
+                self._stopped_profiles = []
+                for executor in self._executors:
+                    self._enable_on(executor)
+            if "sample" in self.modes:
+                # Every thread: the event loop plus the ingest and API I/O workers
+                self._sampler = StackSampler(interval=self.interval)
+                self._sampler.start()
+
+            window = self.window if window is None else window
+            if window:
+                self._schedule_stop(window)
+        print(f"[PROFILE] Started {','.join(self.modes)} for {window:.0f}s, reports in {self.log_dir}/")
+
+    def _schedule_stop(self, window: float):
+        # cProfile must be disabled on the thread it profiles: SIGALRM runs the
+        # handler in the main thread even while it blocks in accept()/recv()
+        if "cprofile" in self.modes and hasattr(signal, "SIGALRM") \
+                and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGALRM, lambda signum, frame: self.stop())
+            signal.setitimer(signal.ITIMER_REAL, window)
+        else:
+            self._timer = threading.Timer(window, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop(self) -> list:
+        """Close the window and write reports; returns the report paths"""
+        with self._lock:
+            if not self.active:
+                return []
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            elif hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread():
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+            os.makedirs(self.log_dir, exist_ok=True)
+            prefix = os.path.join(self.log_dir, f"profile_{datetime.now():%Y%m%d_%H%M%S}")
+            elapsed = time.time() - self.started
+            paths = []
+
+            if self._cprofile:
+                self._cprofile.disable()
+                for entry in list(self._thread_profiles):
+                    self._disable_on(*entry)
+                paths += self._write_cprofile(prefix)
+                self._cprofile = None
+                self._stopped_profiles = []
+            if self._sampler:
+                self._sampler.stop()
+                paths.append(self._write_text(f"{prefix}.collapsed", self._sampler.collapsed()))
+                self._sampler = None
+            if "tracemalloc" in self.modes and tracemalloc.is_tracing():
+                paths.append(self._write_text(f"{prefix}_alloc.txt", self._allocation_report()))
+                self._malloc_start = None
+                tracemalloc.stop()
+
+            self.started = None
+            self.modes = ()
+        print(f"[PROFILE] Stopped after {elapsed:.0f}s: {', '.join(paths)}")
+        return paths
+
+    def toggle(self, modes=DEFAULT_MODES):
+        if self.active:
+            self.stop()
+        else:
+            self.start(modes)
+
+    def _write_cprofile(self, prefix: str) -> list:
+        out = io.StringIO()
+        stats = pstats.Stats(self._cprofile, stream=out)
+        for profile in self._stopped_profiles:
+            stats.add(profile)
+        stats.dump_stats(f"{prefix}.prof")
+        stats.sort_stats("cumulative").print_stats(50)
+        return [f"{prefix}.prof", self._write_text(f"{prefix}_cprofile.txt", out.getvalue())]
+
+    def _allocation_report(self) -> str:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", ""]
+
+        lines.append(f"Top {TOP_ALLOCATIONS} allocation sites:")
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            lines.append(f"  {stat}")
+
+        if self._malloc_start is not None:
+            lines += ["", f"Top {TOP_ALLOCATIONS} growth since window start:"]
+            for stat in snapshot.compare_to(self._malloc_start, "lineno")[:TOP_ALLOCATIONS]:
+                lines.append(f"  {stat}")
+
+        lines += ["", "Largest allocation tracebacks:"]
+        for stat in snapshot.statistics("traceback")[:5]:
+            lines.append(f"  {stat.count} blocks, {stat.size / 1024:.1f} KiB")
+            lines += [f"    {line}" for line in stat.traceback.format()]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write_text(path: str, text: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+
+def install(log_dir: str = LOG_DIR) -> Profiler:
+    """
+    Create the process profiler from DATAKOM_PROFILE* env vars and bind SIGUSR1
+
+    Call from the main thread before entering the serve loop.
+    """
+    profiler = Profiler(
+        log_dir,
+        window=_float_env("DATAKOM_PROFILE_WINDOW", DEFAULT_WINDOW),
+        interval=_float_env("DATAKOM_PROFILE_INTERVAL", DEFAULT_INTERVAL),
+    )
+    try:
+        startup_modes = parse_modes(os.environ.get("DATAKOM_PROFILE", ""))
+    except ValueError as e:
+        print(f"[!] {e}")
+        startup_modes = ()
+    signal_modes = startup_modes or DEFAULT_MODES
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle(signal_modes))
+    if startup_modes:
+        profiler.start(startup_modes)
+    return profiler
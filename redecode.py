@@ -0,0 +1,238 @@
+"""
+Bulk re-decode of the raw frame archive with a process pool
+After a decoder change (e.g. a new offset found with decode_unknown_offsets)
+the whole history can be decoded again. Archive segments are split into shards
+of whole records, shards are decoded in parallel and every shard is written as
+one columnar file (one column per decoded key):
+
+    <output-dir>/frames_YYYYMMDD_<offset>.csv|.npz
+    <output-dir>/checkpoint.json      finished shards; a rerun skips them
+
+Usage:
+    python redecode.py --output-dir redecoded --jobs 4
+    python redecode.py --format npz --decoder HEAD~1 --start 2025-01-01
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from frame_archive import ARCHIVE_DIR, RECORD_HEADER, MAX_FRAME_SIZE, SegmentIndex, list_segments
+from replay import load_decoder, parse_time
+
+CHECKPOINT_JSON = "checkpoint.json"
+FORMATS = ("csv", "npz")
+DEFAULT_SHARD_MB = 32
+
+# Decoder of this worker process, set by init_worker
+_decode = None
+
+
+def init_worker(decoder: str = None):
+    global _decode
+    if decoder:
+        _decode = load_decoder(decoder).decode_telemetry
+    else:
+        from decoder import decode_telemetry
+        _decode = decode_telemetry
+
+
+def plan_shards(archive_dir: str, start: float = None, end: float = None, shard_mb: float = DEFAULT_SHARD_MB) -> list:
+    """(path, first, stop) byte ranges of whole records, about shard_mb each"""
+    shard_bytes = int(shard_mb * 1e6)
+    start = float("-inf") if start is None else start
+    end = float("inf") if end is None else end
+    shards = []
+    for _, path in list_segments(archive_dir):
+        index = SegmentIndex(path)
+        index.update()
+        first, stop = index.byte_range(start, end)
+        while first < stop:
+            # Cut at the first record boundary past first + shard_bytes
+            i = bisect_left(index.offsets, first + shard_bytes)
+            cut = index.offsets[i] if i < len(index.offsets) else index.end
+            cut = min(cut, stop)
+            shards.append((path, first, cut))
+            first = cut
+    return shards
+
+
+def shard_key(shard: tuple) -> str:
+    path, first, stop = shard
+    return f"{os.path.basename(path)}:{first}-{stop}"
+
+
+def shard_output(output_dir: str, shard: tuple, fmt: str) -> str:
+    path, first, _ = shard
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, f"{stem}_{first:012d}.{fmt}")
+
+
+def _cell(item):
+    value = item.get("value") if isinstance(item, dict) else item
+    if isinstance(value, list):
+        return ";".join(str(v) for v in value)
+    return value
+
+
+def decode_columns(data: bytes) -> tuple:
+    """Decode every record of a byte range into {key: [values]}, returns (columns, frames)"""
+    columns = {"timestamp": []}
+    frames = 0
+    view = memoryview(data)
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(view):
+        length, timestamp = RECORD_HEADER.unpack_from(view, pos)
+        pos += RECORD_HEADER.size
+        if length > MAX_FRAME_SIZE or pos + length > len(view):
+            break
+        decoded = _decode(bytes(view[pos:pos + length]))
+        pos += length
+        decoded.pop("_alerts_internal", None)
+
+        columns["timestamp"].append(timestamp)
+        for key, item in decoded.items():
+            column = columns.get(key)
+            if column is None:
+                # Key first seen in this frame (e.g. an extended frame): pad earlier rows
+                column = columns[key] = [None] * frames
+            column.append(_cell(item))
+        frames += 1
+        for column in columns.values():
+            if len(column) < frames:
+                column.append(None)
+    return columns, frames
+
+
+def write_csv(path: str, columns: dict):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*columns.values()))
+
+
+def write_npz(path: str, columns: dict):
+    import numpy as np
+
+    arrays = {}
+    for key, values in columns.items():
+        if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+            arrays[key] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            arrays[key] = np.array(["" if v is None else str(v) for v in values])
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def decode_shard(shard: tuple, output_path: str, fmt: str) -> dict:
+    """Worker: decode one shard and write its columnar file atomically"""
+    path, first, stop = shard
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        f.seek(first)
+        data = f.read(stop - first)
+    columns, frames = decode_columns(data)
+
+    tmp_path = output_path + ".tmp"
+    (write_npz if fmt == "npz" else write_csv)(tmp_path, columns)
+    os.replace(tmp_path, output_path)
+    return {"frames": frames, "bytes": len(data), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def load_checkpoint(output_dir: str, settings: dict, restart: bool = False) -> dict:
+    path = os.path.join(output_dir, CHECKPOINT_JSON)
+    if not os.path.exists(path):
+        return {"settings": settings, "shards": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if restart:
+        # Shards of another plan would overlap the new ones
+        for shard in checkpoint.get("shards", {}).values():
+            try:
+                os.remove(os.path.join(output_dir, shard["output"]))
+            except (OSError, KeyError):
+                pass
+        return {"settings": settings, "shards": {}}
+    if checkpoint.get("settings") != settings:
+        raise SystemExit(f"{path} was written with {checkpoint.get('settings')}; use --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(output_dir: str, checkpoint: dict):
+    path = os.path.join(output_dir, CHECKPOINT_JSON)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def redecode(archive_dir: str, output_dir: str, fmt: str = "csv", jobs: int = None, decoder: str = None,
+             start: float = None, end: float = None, shard_mb: float = DEFAULT_SHARD_MB,
+             restart: bool = False) -> dict:
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {"format": fmt, "decoder": decoder or "current", "start": start, "end": end, "shard_mb": shard_mb}
+    checkpoint = load_checkpoint(output_dir, settings, restart)
+
+    shards = plan_shards(archive_dir, start, end, shard_mb)
+    pending = [shard for shard in shards if shard_key(shard) not in checkpoint["shards"]]
+    print(f"[*] {len(shards)} shards, {len(shards) - len(pending)} already done, {len(pending)} to decode")
+
+    frames = total_bytes = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(decoder,)) as pool:
+        futures = {pool.submit(decode_shard, shard, shard_output(output_dir, shard, fmt), fmt): shard
+                   for shard in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            shard = futures[future]
+            result = future.result()
+            frames += result["frames"]
+            total_bytes += result["bytes"]
+            checkpoint["shards"][shard_key(shard)] = dict(result, output=os.path.basename(
+                shard_output(output_dir, shard, fmt)))
+            save_checkpoint(output_dir, checkpoint)
+
+            elapsed = time.perf_counter() - started
+            print(f"[{done}/{len(pending)}] {shard_key(shard)}: {result['frames']} frames "
+                  f"({frames / elapsed:.0f} frames/s, {total_bytes / elapsed / 1e6:.1f} MB/s)")
+    elapsed = time.perf_counter() - started
+
+    return {
+        "shards": len(shards),
+        "shards_decoded": len(pending),
+        "frames": frames,
+        "bytes": total_bytes,
+        "elapsed_s": round(elapsed, 3),
+        "frames_per_s": round(frames / elapsed, 1) if elapsed else 0.0,
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+        "jobs": jobs or os.cpu_count(),
+        "output_dir": output_dir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-decode the raw frame archive in parallel")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--output-dir", default="redecoded")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="npz needs numpy")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--decoder", help="Git revision or path of decoder.py (default: current)")
+    parser.add_argument("--start", help="First frame time (unix seconds or ISO 8601)")
+    parser.add_argument("--end", help="Last frame time (unix seconds or ISO 8601)")
+    parser.add_argument("--shard-mb", type=float, default=DEFAULT_SHARD_MB, help="Approximate shard size")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint, delete its shard files and decode everything")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = redecode(args.archive_dir, args.output_dir, args.format, args.jobs, args.decoder,
+                      parse_time(args.start), parse_time(args.end), args.shard_mb, args.restart)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Replay captured controller traffic through the ingest pipeline
+Frames come from the frame archive (packets/archive/frames_*.bin) or from hex
+packet files (packets/telemetry/pkt_*.txt).
+
+Modes:
+    run   - classify -> decode -> persist in-process, as fast as possible
+    tcp   - send frames to a running listener at N x real time, checking acks
+    diff  - decode every frame with two decoder versions and report differences
+    fuel  - run the refuel/theft monitor over the frames and list its events
+
+Usage:
+    python replay.py run --data-dir /tmp/replay_data
+    python replay.py tcp --speed 10
+    python replay.py diff --baseline HEAD~1
+    python replay.py diff --baseline /path/to/old_decoder.py --source packets/telemetry
+    python replay.py fuel --start 2025-01-01 --event-percent 2
+"""
+
+import argparse
+import heapq
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from config import LISTENER_PORT, UNKNOWN_OFFSETS_SNAPSHOT, ALERT_RULES_FILE
+from decoder import decode_telemetry, decode_unknown_offsets
+from frame_archive import ARCHIVE_DIR, iter_records, list_segments
+from fuel_monitor import EVENT_PERCENT, SETTLE_SECONDS
+from packet_pipeline import classify_packet, persist_telemetry
+from simulator import ACK_SIZE, percentile
+
+HEX_DIR = os.path.join("packets", "telemetry")
+HEX_PREFIX = "pkt_"
+HEX_SUFFIX = ".txt"
+
+
+def iter_hex_dir(directory: str):
+    """Yield (timestamp, frame) from pkt_YYYYMMDD_HHMMSS_ffffff.txt files, oldest first"""
+    files = []
+    for filename in os.listdir(directory):
+        if not (filename.startswith(HEX_PREFIX) and filename.endswith(HEX_SUFFIX)):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            ts = datetime.strptime(filename[len(HEX_PREFIX):-len(HEX_SUFFIX)], "%Y%m%d_%H%M%S_%f").timestamp()
+        except ValueError:
+            ts = os.path.getmtime(path)
+        files.append((ts, path))
+    files.sort()
+    for ts, path in files:
+        with open(path, "r", encoding="ascii") as f:
+            try:
+                yield ts, bytes.fromhex(f.read().strip())
+            except ValueError:
+                print(f"[!] Skipping malformed packet file {path}")
+
+
+def iter_archive(archive_dir: str):
+    for _, path in list_segments(archive_dir):
+        yield from iter_records(path)
+
+
+def iter_source(path: str):
+    """Frames of one source directory (archive segments or hex files)"""
+    if list_segments(path):
+        return iter_archive(path)
+    return iter_hex_dir(path)
+
+
+def default_sources() -> list:
+    # The listener writes every frame to both places - prefer the archive
+    if list_segments(ARCHIVE_DIR):
+        return [ARCHIVE_DIR]
+    return [HEX_DIR]
+
+
+def iter_frames(sources: list, start: float = None, end: float = None):
+    """Merged (timestamp, frame) stream of all sources in time order"""
+    for ts, frame in heapq.merge(*(iter_source(path) for path in sources), key=lambda item: item[0]):
+        if start is not None and ts < start:
+            continue
+        if end is not None and ts > end:
+            continue
+        yield ts, frame
+
+
+def parse_time(value: str):
+    """Unix seconds or ISO 8601"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def replay_in_process(frames, data_dir: str = None) -> dict:
+    """Push frames through classify -> decode -> persist; decode only if data_dir is None"""
+    detector = rules = None
+    stages = ()
+    if data_dir:
+        from anomaly_detector import AnomalyDetector
+        from fuel_monitor import FuelMonitor
+        from power_quality import PowerQualityMonitor
+        from rule_engine import RuleEngine
+        os.makedirs(data_dir, exist_ok=True)
+        detector = AnomalyDetector()
+        rules = RuleEngine(ALERT_RULES_FILE, reload_interval=0)
+        stages = (FuelMonitor(), PowerQualityMonitor())
+    counts = {"telemetry": 0, "keepalive": 0, "event": 0}
+    total_bytes = 0
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for ts, frame in frames:
+        total_bytes += len(frame)
+        pkt_type = classify_packet(frame)
+        counts[pkt_type] += 1
+        if pkt_type != "telemetry":
+            continue
+        if data_dir:
+            persist_telemetry(frame, f"replay_{ts:.6f}", data_dir, datetime.fromtimestamp(ts), detector, rules,
+                              stages)
+        else:
+            decode_telemetry(frame)
+            if UNKNOWN_OFFSETS_SNAPSHOT:
+                decode_unknown_offsets(frame)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    frames_total = sum(counts.values())
+    return {
+        "mode": "run",
+        "persist": bool(data_dir),
+        "frames": counts,
+        "bytes": total_bytes,
+        "elapsed_s": round(elapsed, 3),
+        "cpu_s": round(cpu, 3),
+        "frames_per_s": round(frames_total / elapsed, 1) if elapsed else 0.0,
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+    }
+
+
+def replay_tcp(frames, host: str, port: int, speed: float, ack_timeout: float = 10.0) -> dict:
+    """Send frames to a listener, spaced by original arrival times / speed (0 = no pacing)"""
+    sock = socket.create_connection((host, port), timeout=ack_timeout)
+    latencies = []
+    sent = acks_ok = acks_bad = 0
+    total_bytes = 0
+    max_lag = 0.0
+    first_ts = None
+    started = time.perf_counter()
+    try:
+        for ts, frame in frames:
+            if first_ts is None:
+                first_ts = ts
+            if speed:
+                due = started + (ts - first_ts) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+
+            sent_at = time.perf_counter()
+            sock.sendall(frame)
+            expected = frame[:ACK_SIZE]
+            ack = b""
+            while len(ack) < len(expected):
+                chunk = sock.recv(len(expected) - len(ack))
+                if not chunk:
+                    raise ConnectionError("listener closed the connection")
+                ack += chunk
+            latencies.append(time.perf_counter() - sent_at)
+            sent += 1
+            total_bytes += len(frame)
+            if ack == expected:
+                acks_ok += 1
+            else:
+                acks_bad += 1
+    finally:
+        sock.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "mode": "tcp",
+        "speed": speed,
+        "frames": sent,
+        "bytes": total_bytes,
+        "elapsed_s": round(elapsed, 3),
+        "frames_per_s": round(sent / elapsed, 1) if elapsed else 0.0,
+        "acks_ok": acks_ok,
+        "acks_bad": acks_bad,
+        "max_schedule_lag_s": round(max_lag, 3),
+        "ack_latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies, default=0.0) * 1000, 2),
+        },
+    }
+
+
+def load_decoder(baseline: str):
+    """
+    Load another version of decoder.py
+
+    Args:
+        baseline: Path to a decoder.py file, or a git revision of this repository
+    """
+    path = baseline
+    if not os.path.isfile(baseline):
+        repo_dir = os.path.dirname(os.path.abspath(__file__))
+        source = subprocess.run(["git", "show", f"{baseline}:decoder.py"], cwd=repo_dir,
+                                capture_output=True, check=True).stdout
+        fd, path = tempfile.mkstemp(prefix="decoder_baseline_", suffix=".py")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+
+    spec = importlib.util.spec_from_file_location("decoder_baseline", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if path != baseline:
+        os.remove(path)
+    return module
+
+
+def _value(item):
+    return item.get("value") if isinstance(item, dict) and "value" in item else item
+
+
+def diff_decoders(frames, baseline_decode, current_decode=decode_telemetry, max_examples: int = 3) -> dict:
+    """Decode telemetry frames with two decoders and summarize differing keys"""
+    compared = differing = 0
+    keys = {}
+    for ts, frame in frames:
+        if classify_packet(frame) != "telemetry":
+            continue
+        compared += 1
+        old = baseline_decode(frame)
+        new = current_decode(frame)
+        frame_differs = False
+        for key in old.keys() | new.keys():
+            if key not in new:
+                change, old_value, new_value = "removed", _value(old[key]), None
+            elif key not in old:
+                change, old_value, new_value = "added", None, _value(new[key])
+            else:
+                old_value, new_value = _value(old[key]), _value(new[key])
+                if old_value == new_value:
+                    continue
+                change = "changed"
+            frame_differs = True
+            entry = keys.setdefault(key, {"change": change, "frames": 0, "examples": []})
+            entry["frames"] += 1
+            if len(entry["examples"]) < max_examples:
+                entry["examples"].append({
+                    "timestamp": datetime.fromtimestamp(ts).isoformat(),
+                    "baseline": old_value,
+                    "current": new_value,
+                })
+        differing += frame_differs
+
+    return {
+        "mode": "diff",
+        "frames_compared": compared,
+        "frames_differing": differing,
+        "keys": dict(sorted(keys.items(), key=lambda item: -item[1]["frames"])),
+    }
+
+
+def replay_fuel(frames, event_percent: float, settle_seconds: float) -> dict:
+    """Refuel/theft events of the archived frames, as the live monitor would have seen them"""
+    from fuel_monitor import FuelMonitor
+
+    monitor = FuelMonitor(event_percent, settle_seconds)
+    telemetry = 0
+    events = []
+    for ts, frame in frames:
+        if classify_packet(frame) != "telemetry":
+            continue
+        telemetry += 1
+        decoded = decode_telemetry(frame)
+        alerts = decoded.pop("_alerts_internal", None)
+        events.extend(monitor.update(decoded.get("unique_id", {}).get("value", ""), decoded, ts, alerts))
+
+    opened = monitor.open_events()
+    for event in events + list(opened.values()):
+        for key in ("start", "end"):
+            if key in event:
+                event[key] = datetime.fromtimestamp(event[key]).isoformat()
+    return {
+        "mode": "fuel",
+        "frames": telemetry,
+        "controllers": len(monitor.controllers),
+        "refuels": sum(event["kind"] == "refuel" for event in events),
+        "thefts": sum(event["kind"] == "theft" for event in events),
+        "events": events,
+        "open": opened,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured Datakom traffic")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--source", action="append",
+                        help="Archive or hex packet directory (repeatable, default: archive if present)")
+    common.add_argument("--start", help="First frame time (unix seconds or ISO 8601)")
+    common.add_argument("--end", help="Last frame time (unix seconds or ISO 8601)")
+    common.add_argument("--output", help="Write the report as JSON to this file")
+
+    run_parser = sub.add_parser("run", parents=[common], help="In-process replay at maximum speed")
+    run_parser.add_argument("--data-dir", default="replay_data",
+                            help="Where telemetry/alerts JSON is written (never the live data/ by default)")
+    run_parser.add_argument("--no-persist", action="store_true", help="Decode only, write nothing")
+
+    tcp_parser = sub.add_parser("tcp", parents=[common], help="Replay over TCP to a running listener")
+    tcp_parser.add_argument("--host", default="127.0.0.1")
+    tcp_parser.add_argument("--port", type=int, default=LISTENER_PORT)
+    tcp_parser.add_argument("--speed", type=float, default=1.0, help="1, 10, 100 x real time; 0 = unpaced")
+
+    diff_parser = sub.add_parser("diff", parents=[common], help="Compare two decoder versions")
+    diff_parser.add_argument("--baseline", required=True, help="Git revision or path of the baseline decoder.py")
+
+    fuel_parser = sub.add_parser("fuel", parents=[common], help="Refuel/theft events of the frames")
+    fuel_parser.add_argument("--event-percent", type=float, default=EVENT_PERCENT,
+                             help="Unexplained level change that counts, %% of the tank")
+    fuel_parser.add_argument("--settle-seconds", type=float, default=SETTLE_SECONDS)
+
+    args = parser.parse_args()
+    frames = iter_frames(args.source or default_sources(), parse_time(args.start), parse_time(args.end))
+
+    if args.mode == "run":
+        report = replay_in_process(frames, None if args.no_persist else args.data_dir)
+    elif args.mode == "tcp":
+        report = replay_tcp(frames, args.host, args.port, args.speed)
+    elif args.mode == "fuel":
+        report = replay_fuel(frames, args.event_percent, args.settle_seconds)
+    else:
+        report = diff_decoders(frames, load_decoder(args.baseline).decode_telemetry)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Rendered and pre-compressed API responses
+Each response body is rendered once per snapshot version and compressed at
+most once per encoding (gzip/deflate), then served from memory to every
+client until the underlying snapshot changes.
+"""
+
+import gzip
+import json
+import zlib
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from fastapi.responses import Response
+
+# Bodies smaller than this are sent uncompressed (same default as GZipMiddleware)
+MIN_COMPRESS_SIZE = 500
+COMPRESS_LEVEL = 6
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+# Strong validators differ per content-coding: "<crc>-<len>" plus this suffix
+ETAG_SUFFIXES = {None: "", "gzip": "-gz", "deflate": "-df"}
+
+
+def render_json(content) -> bytes:
+    """Serialize like FastAPI's JSONResponse"""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick gzip or deflate from an Accept-Encoding header (None = identity)"""
+    if not accept_encoding:
+        return None
+    best, best_q = None, 0.0
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            name = SUPPORTED_ENCODINGS[0]
+        if name in SUPPORTED_ENCODINGS and q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: "*" or any listed tag, compared weakly (W/ ignored)"""
+    if not if_none_match:
+        return False
+    for item in if_none_match.split(","):
+        item = item.strip()
+        if item == "*" or item.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class RenderedBody:
+    """One rendered body plus lazily built compressed variants"""
+
+    def __init__(self, body: bytes, media_type: str, etag: str, headers: dict = None):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag        # of the identity body; see etag_for
+        self.headers = headers or {}
+        self.encoded = {}
+
+    def encode(self, encoding: str) -> bytes:
+        """Compressed body, computed on first use and kept"""
+        data = self.encoded.get(encoding)
+        if data is None:
+            if encoding == "gzip":
+                data = gzip.compress(self.body, compresslevel=COMPRESS_LEVEL, mtime=0)
+            else:
+                data = zlib.compress(self.body, COMPRESS_LEVEL)
+            self.encoded[encoding] = data
+        return data
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        return self.etag[:-1] + ETAG_SUFFIXES[encoding] + '"'
+
+    def respond(self, accept_encoding: Optional[str] = None, if_none_match: Optional[str] = None) -> Response:
+        """Response for a client, compressed if it accepts gzip/deflate"""
+        encoding = negotiate_encoding(accept_encoding)
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            encoding = None
+        headers = dict(self.headers)
+        headers["ETag"] = self.etag_for(encoding)
+        headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(self.encode(encoding), media_type=self.media_type, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
+
+
+class ResponseCache:
+    """
+    LRU of rendered bodies keyed by request variant
+
+    Args:
+        max_entries: Variants kept (language x id filter x format)
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version, render: Callable[[], bytes], media_type: str,
+            headers: dict = None) -> RenderedBody:
+        """Cached body for key at snapshot version, rendering it on a miss"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        body = render()
+        etag = f'"{zlib.crc32(body):08x}-{len(body):x}"'
+        rendered = RenderedBody(body, media_type, etag, headers)
+        self.entries[key] = (version, rendered)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return rendered
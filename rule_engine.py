@@ -0,0 +1,465 @@
+"""
+User-defined alert rules, compiled once and evaluated per packet
+Rules come from a JSON file (config.ALERT_RULES_FILE):
+
+    {"rules": [
+        {"name": "coolant_hot", "when": "coolant_temp_C > 95 for 60s", "hysteresis": 3},
+        {"name": "fuel_drop", "when": "fuel_level_percent drops 10% in 5 min", "severity": "shutDown"}
+    ]}
+
+    <param> <op> <number> [for <duration>]          op: > >= < <= == !=
+    <param> drops|rises <number>[%] in <duration>    duration: 90, 90s, 5 min, 2h
+
+At load time every rule becomes a pair of closures over a parameter slot (an
+index into the value list extracted once per packet) and a vectorized twin
+over a fleet matrix. A threshold rule fires once its condition held for the
+duration and clears only when the value is back past threshold -/+ hysteresis.
+A drop/rise rule compares the value with the max/min of its window, kept as
+WINDOW_BUCKETS bucket extremes per controller (constant memory).
+
+State (pending since, active, window buckets) lives in per-controller rows
+of NumPy arrays shared by both paths. The rule file is re-checked every
+RELOAD_INTERVAL seconds; a changed file is compiled and swapped in between
+packets, keeping the state of rules whose definition did not change.
+"""
+
+import json
+import math
+import operator
+import os
+import re
+import time
+
+import numpy as np
+
+RELOAD_INTERVAL = 2.0   # seconds between rule file checks
+WINDOW_BUCKETS = 12     # drop/rise window resolution: window / WINDOW_BUCKETS
+SEVERITIES = ("warning", "loadDump", "shutDown")
+
+OPERATORS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+THRESHOLD_RULE = re.compile(
+    r"^\s*(?P<key>\w+)\s*(?P<op>>=|<=|==|!=|>|<)\s*(?P<value>-?\d+(?:\.\d+)?)"
+    r"(?:\s+for\s+(?P<hold>\d+(?:\.\d+)?\s*[a-z]*))?\s*$")
+CHANGE_RULE = re.compile(
+    r"^\s*(?P<key>\w+)\s+(?P<direction>drops|rises)\s+(?P<amount>\d+(?:\.\d+)?)\s*(?P<percent>%?)"
+    r"\s+in\s+(?P<window>\d+(?:\.\d+)?\s*[a-z]*)\s*$")
+
+DURATION_UNITS = {"": 1, "s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hr": 3600}
+
+NAN = float("nan")
+
+
+def parse_duration(text: str) -> float:
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([a-z]*)", text.strip())
+    if not match or match.group(2) not in DURATION_UNITS:
+        raise ValueError(f"Bad duration: {text!r}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+class Rule:
+    """
+    One compiled rule
+
+    check(values, ref) / clear(values, ref) take the packet's value list (ref is
+    the window extreme of drop/rise rules); check_vector / clear_vector take a
+    fleet column and return boolean arrays. A missing value (NaN) neither
+    fires nor clears a rule.
+    """
+
+    __slots__ = ("name", "when", "severity", "message", "key", "slot", "hold", "hysteresis",
+                 "window", "direction", "check", "clear", "check_vector", "clear_vector")
+
+    def __init__(self, spec: dict, slots: dict):
+        self.name = spec["name"]
+        self.when = spec["when"]
+        self.severity = spec.get("severity", "warning")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Rule {self.name}: severity must be one of {SEVERITIES}")
+        self.message = spec.get("message", self.when)
+        self.hysteresis = float(spec.get("hysteresis", 0))
+        self.window = None
+        self.direction = None
+
+        match = THRESHOLD_RULE.match(self.when)
+        if match:
+            self.key = match.group("key")
+            self.slot = slots.setdefault(self.key, len(slots))
+            self.hold = parse_duration(match.group("hold")) if match.group("hold") else 0.0
+            self._compile_threshold(match.group("op"), float(match.group("value")))
+            return
+        match = CHANGE_RULE.match(self.when)
+        if match:
+            self.key = match.group("key")
+            self.slot = slots.setdefault(self.key, len(slots))
+            self.hold = 0.0
+            self.window = parse_duration(match.group("window"))
+            self.direction = match.group("direction")
+            self._compile_change(float(match.group("amount")), bool(match.group("percent")))
+            return
+        raise ValueError(f"Rule {self.name}: cannot parse {self.when!r}")
+
+    def _compile_threshold(self, op: str, threshold: float):
+        compare = OPERATORS[op]
+        slot = self.slot
+
+        def check(values, ref):
+            value = values[slot]
+            return value == value and compare(value, threshold)
+
+        def check_vector(column, ref):
+            return compare(column, threshold) & (column == column)
+
+        if self.hysteresis and op in (">", ">="):
+            limit = threshold - self.hysteresis
+
+            def clear(values, ref):
+                return values[slot] < limit
+
+            def clear_vector(column, ref):
+                return column < limit
+        elif self.hysteresis and op in ("<", "<="):
+            limit = threshold + self.hysteresis
+
+            def clear(values, ref):
+                return values[slot] > limit
+
+            def clear_vector(column, ref):
+                return column > limit
+        else:
+            def clear(values, ref):
+                value = values[slot]
+                return value == value and not compare(value, threshold)
+
+            def clear_vector(column, ref):
+                return ~compare(column, threshold)
+
+        self.check, self.clear = check, clear
+        self.check_vector, self.clear_vector = check_vector, clear_vector
+
+    def _compile_change(self, amount: float, percent: bool):
+        slot = self.slot
+        sign = 1.0 if self.direction == "drops" else -1.0
+        # Change is measured from the window max (drops) or min (rises)
+        if percent:
+            fraction = amount / 100
+
+            def check(values, ref):
+                value = values[slot]
+                return value == value and sign * (ref - value) >= fraction * abs(ref)
+
+            def check_vector(column, ref):
+                return sign * (ref - column) >= fraction * np.abs(ref)
+        else:
+            def check(values, ref):
+                value = values[slot]
+                return value == value and sign * (ref - value) >= amount
+
+            def check_vector(column, ref):
+                return sign * (ref - column) >= amount
+
+        def clear(values, ref):
+            return values[slot] == values[slot] and not check(values, ref)
+
+        def clear_vector(column, ref):
+            return ~check_vector(column, ref)
+
+        self.check, self.clear = check, clear
+        self.check_vector, self.clear_vector = check_vector, clear_vector
+
+    @property
+    def identity(self) -> tuple:
+        """Rules with the same identity keep their state across reloads"""
+        return self.name, self.when, self.hysteresis
+
+    def result(self, value, since: float) -> dict:
+        return {
+            "name": self.name,
+            "severity": self.severity,
+            "message": self.message,
+            "parameter": self.key,
+            "value": None if value != value else value,
+            "since": since,
+        }
+
+
+class RuleSet:
+    """Rules compiled from one rule file; keys[slot] is the parameter of each slot"""
+
+    def __init__(self, specs: list):
+        slots = {}
+        self.rules = [Rule(spec, slots) for spec in specs]
+        self.keys = list(slots)
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate rule names in {names}")
+        self.windows = [i for i, rule in enumerate(self.rules) if rule.window]
+
+    @classmethod
+    def load(cls, path: str) -> "RuleSet":
+        with open(path, "r", encoding="utf-8") as f:
+            content = json.load(f)
+        return cls(content.get("rules", []))
+
+    def values(self, telemetry: dict) -> list:
+        """Value of every slot in a decoded frame, NaN if missing or not numeric"""
+        values = []
+        for key in self.keys:
+            item = telemetry.get(key)
+            value = item.get("value") if type(item) is dict else None
+            values.append(value if type(value) in (int, float) else NAN)
+        return values
+
+
+class RuleEngine:
+    """
+    Per-controller rule state and evaluation
+
+    Args:
+        path: Rule file (JSON); a missing file means no rules until it appears
+        reload_interval: Seconds between rule file checks, 0 = never reload
+    """
+
+    def __init__(self, path: str = None, reload_interval: float = RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.ruleset = RuleSet([])
+        self.rows = {}          # controller id -> state row
+        self.since = np.zeros((0, 0))
+        self.active = np.zeros((0, 0), dtype=bool)
+        self.rings = []         # per window rule: rows x WINDOW_BUCKETS extremes
+        self.buckets = np.zeros((0, 0), dtype=np.int64)
+        self.version = 0        # increments with every rule start/end
+        self._signature = None
+        self._next_check = 0.0
+        if path:
+            self.reload()
+
+    # ------------------------------------------------------------------
+    # Rule file
+    # ------------------------------------------------------------------
+    def reload(self) -> bool:
+        """Compile the rule file if it changed, returns True if new rules are active"""
+        self._next_check = time.monotonic() + self.reload_interval
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            ruleset = RuleSet.load(self.path) if signature else RuleSet([])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[!] Rules in {self.path} not loaded, keeping {len(self.ruleset.rules)} rules: {e}")
+            return False
+        self.use(ruleset)
+        print(f"[+] Loaded {len(ruleset.rules)} alert rules from {self.path}")
+        return True
+
+    def use(self, ruleset: RuleSet):
+        """Switch to ruleset, keeping state of rules whose definition is unchanged"""
+        old = {rule.identity: i for i, rule in enumerate(self.ruleset.rules)}
+        old_windows = {i: w for w, i in enumerate(self.ruleset.windows)}
+        capacity = len(self.since)
+        since = np.full((capacity, len(ruleset.rules)), np.nan)
+        active = np.zeros((capacity, len(ruleset.rules)), dtype=bool)
+        rings = []
+        buckets = np.full((capacity, len(ruleset.windows)), -1, dtype=np.int64)
+        for i, rule in enumerate(ruleset.rules):
+            j = old.get(rule.identity)
+            if j is not None:
+                since[:, i] = self.since[:, j]
+                active[:, i] = self.active[:, j]
+            if rule.window:
+                w = len(rings)
+                if j is not None:
+                    rings.append(self.rings[old_windows[j]].copy())
+                    buckets[:, w] = self.buckets[:, old_windows[j]]
+                else:
+                    rings.append(np.full((capacity, WINDOW_BUCKETS), self._empty(rule)))
+        # One assignment per attribute; evaluation reads ruleset last
+        self.since, self.active, self.rings, self.buckets = since, active, rings, buckets
+        self.ruleset = ruleset
+        self.version += 1
+
+    @staticmethod
+    def _empty(rule: Rule) -> float:
+        return -math.inf if rule.direction == "drops" else math.inf
+
+    def _row(self, controller: str) -> int:
+        row = self.rows.get(controller)
+        if row is None:
+            row = self.rows[controller] = len(self.rows)
+            if row >= len(self.since):
+                self._grow(max(8, 2 * len(self.since)))
+        return row
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self.since)
+        rules = self.ruleset.rules
+        self.since = np.vstack((self.since, np.full((extra, len(rules)), np.nan)))
+        self.active = np.vstack((self.active, np.zeros((extra, len(rules)), dtype=bool)))
+        self.buckets = np.vstack((self.buckets, np.full((extra, len(self.ruleset.windows)), -1, dtype=np.int64)))
+        self.rings = [np.vstack((ring, np.full((extra, WINDOW_BUCKETS), self._empty(rules[i]))))
+                      for ring, i in zip(self.rings, self.ruleset.windows)]
+
+    # ------------------------------------------------------------------
+    # Per packet
+    # ------------------------------------------------------------------
+    def evaluate(self, controller: str, telemetry: dict, timestamp: float) -> list:
+        """
+        Evaluate every rule for one decoded frame
+
+        Returns:
+            Results of the rules active for this controller after the frame
+        """
+        if self.path and self.reload_interval and time.monotonic() >= self._next_check:
+            self.reload()
+        ruleset = self.ruleset
+        if not ruleset.rules:
+            return []
+
+        values = ruleset.values(telemetry)
+        row = self._row(controller)
+        since = self.since[row].tolist()
+        active = self.active[row].tolist()
+        changed = False
+        window = 0
+        results = []
+        for i, rule in enumerate(ruleset.rules):
+            ref = None
+            if rule.window:
+                ref = self._window(window, rule, row, values[rule.slot], timestamp)
+                window += 1
+            if active[i]:
+                if rule.clear(values, ref):
+                    active[i] = False
+                    since[i] = NAN
+                    changed = True
+            elif rule.check(values, ref):
+                if since[i] != since[i]:
+                    since[i] = timestamp
+                if timestamp - since[i] >= rule.hold:
+                    active[i] = True
+                    changed = True
+            else:
+                since[i] = NAN
+            if active[i]:
+                results.append(rule.result(values[rule.slot], since[i]))
+        self.since[row] = since
+        self.active[row] = active
+        if changed:
+            self.version += 1
+        return results
+
+    def _window(self, window: int, rule: Rule, row: int, value: float, timestamp: float) -> float:
+        """Insert value into the controller's window buckets, returns the window extreme"""
+        ring = self.rings[window][row]
+        width = rule.window / WINDOW_BUCKETS
+        bucket = int(timestamp // width)
+        last = int(self.buckets[row, window])
+        if bucket > last:
+            if last < 0 or bucket - last >= WINDOW_BUCKETS:
+                ring[:] = self._empty(rule)
+            else:
+                for b in range(last + 1, bucket + 1):
+                    ring[b % WINDOW_BUCKETS] = self._empty(rule)
+            self.buckets[row, window] = last = bucket
+        if value == value:
+            slot = last % WINDOW_BUCKETS
+            if rule.direction == "drops":
+                ring[slot] = max(ring[slot], value)
+            else:
+                ring[slot] = min(ring[slot], value)
+        return ring.max() if rule.direction == "drops" else ring.min()
+
+    # ------------------------------------------------------------------
+    # Fleet batch
+    # ------------------------------------------------------------------
+    def evaluate_fleet(self, controllers: list, columns: dict, timestamps) -> dict:
+        """
+        Evaluate every rule for one snapshot per controller, vectorized over the fleet
+
+        Args:
+            controllers: Controller ids, one per row, no duplicates
+            columns: Parameter key -> array of values per row (e.g. batch_decoder.decode_frames)
+            timestamps: Frame time per row, unix seconds
+
+        Returns:
+            controller -> results of its active rules
+        """
+        if self.path and self.reload_interval and time.monotonic() >= self._next_check:
+            self.reload()
+        ruleset = self.ruleset
+        if not ruleset.rules or not len(controllers):
+            return {}
+        if len(set(controllers)) != len(controllers):
+            raise ValueError("evaluate_fleet takes one snapshot per controller")
+
+        rows = np.array([self._row(controller) for controller in controllers])
+        times = np.asarray(timestamps, dtype=np.float64)
+        nan_column = np.full(len(rows), np.nan)
+        matrix = [np.asarray(columns.get(key, nan_column), dtype=np.float64) for key in ruleset.keys]
+        since = self.since[rows]
+        active = self.active[rows]
+
+        window = 0
+        for i, rule in enumerate(ruleset.rules):
+            column = matrix[rule.slot]
+            ref = None
+            if rule.window:
+                ref = self._window_vector(window, rule, rows, column, times)
+                window += 1
+            with np.errstate(invalid="ignore"):
+                condition = rule.check_vector(column, ref)
+                clear = rule.clear_vector(column, ref) & (column == column)
+            pending = np.where(condition, np.where(np.isnan(since[:, i]), times, since[:, i]), np.nan)
+            started = ~active[:, i] & condition & (times - pending >= rule.hold)
+            ended = active[:, i] & clear
+            if started.any() or ended.any():
+                self.version += 1
+            active[:, i] = (active[:, i] & ~clear) | started
+            # Active rules keep the time their condition started holding
+            since[:, i] = np.where(active[:, i] & ~started, since[:, i], pending)
+
+        self.since[rows] = since
+        self.active[rows] = active
+
+        results = {}
+        for r, c in zip(*np.nonzero(active)):
+            rule = ruleset.rules[c]
+            results.setdefault(controllers[r], []).append(
+                rule.result(matrix[rule.slot][r].item(), since[r, c].item()))
+        return results
+
+    def _window_vector(self, window: int, rule: Rule, rows: np.ndarray, column: np.ndarray,
+                       times: np.ndarray) -> np.ndarray:
+        ring = self.rings[window][rows]
+        last = self.buckets[rows, window]
+        bucket = np.maximum((times // (rule.window / WINDOW_BUCKETS)).astype(np.int64), last)
+        # Empty the buckets the clock moved past (all of them after a long gap)
+        advanced = np.where(last < 0, WINDOW_BUCKETS, np.minimum(bucket - last, WINDOW_BUCKETS))
+        offsets = (np.arange(WINDOW_BUCKETS) - (last[:, None] + 1)) % WINDOW_BUCKETS
+        ring[offsets < advanced[:, None]] = self._empty(rule)
+
+        index = np.arange(len(rows)), bucket % WINDOW_BUCKETS
+        combine = np.fmax if rule.direction == "drops" else np.fmin
+        ring[index] = combine(ring[index], column)
+        self.rings[window][rows] = ring
+        self.buckets[rows, window] = bucket
+        return ring.max(axis=1) if rule.direction == "drops" else ring.min(axis=1)
+
+    def snapshot(self) -> dict:
+        """Active rules per controller, for the API"""
+        rules = self.ruleset.rules
+        active = {}
+        for controller, row in self.rows.items():
+            names = [rules[i].name for i in np.flatnonzero(self.active[row])]
+            if names:
+                active[controller] = names
+        return {"rules": [{"name": r.name, "when": r.when, "severity": r.severity} for r in rules], "active": active}
@@ -0,0 +1,297 @@
+"""
+Service due-date forecasting from the run-hour and service counters
+Each controller counts down three service intervals, in engine hours
+(hours_to_service_1..3) and in calendar days (days_to_service_1..3); the
+service is due at whichever runs out first. The day counter gives a date
+directly; the hour counter needs the controller's run-hour accrual rate:
+
+    rate        slope of engine_run_hours_total over time (run hours per
+                day), an exponentially weighted least-squares fit updated
+                incrementally with one sample every SAMPLE_SECONDS (O(1),
+                older samples fade with a RATE_HALF_LIFE_DAYS half-life).
+                A counter that steps back restarts the fit
+    due         now + min(hours_left / rate, days_left)
+    due soon    a min-heap of (due, controller, interval) over the fleet.
+                A controller's entry is replaced (lazily: the old one stays
+                until it surfaces or the heap is compacted) only when its
+                forecast moved by more than DUE_RESOLUTION, and queries walk
+                the heap best-first, so neither packets nor requests touch
+                the whole fleet
+
+The hour registers are read 4 bytes wide, like the structure template and the
+day registers between them; decode_telemetry reads only their low 2 bytes,
+which wrap at 655.36 h.
+
+The API runs the forecaster over the frame archive
+(frame_archive.ArchiveFollower) and checkpoints it in data/service_forecast.json.
+"""
+
+import heapq
+import json
+import math
+import os
+import time
+
+from batch_decoder import SERVICE_COUNTER_EMPTY
+from frame_archive import ARCHIVE_DIR, ArchiveFollower, list_segments
+
+STATE_JSON = os.path.join("data", "service_forecast.json")
+
+INTERVALS = (1, 2, 3)
+RUN_HOURS_OFFSET = 511
+# interval -> (hours_to_service offset, days_to_service offset); all 4 bytes, /100
+SERVICE_OFFSETS = {1: (515, 519), 2: (523, 527), 3: (531, 535)}
+MIN_FRAME_SIZE = 539
+UNIQUE_ID = slice(21, 33)  # decode_telemetry's unique_id
+
+SAMPLE_SECONDS = 600.0       # regression samples at most this often per controller
+RATE_HALF_LIFE_DAYS = 14.0
+MIN_SPAN_DAYS = 1.0          # samples needed before the hour counter is forecast
+MIN_RATE = 0.01              # run hours per day; slower engines are due by days only
+DUE_RESOLUTION = 3600.0      # forecast change (seconds) that replaces a heap entry
+CHECKPOINT_INTERVAL = 60.0
+DEFAULT_DAYS = 30.0
+
+DECAY_PER_DAY = math.log(2) / RATE_HALF_LIFE_DAYS
+
+
+def _register(frame: bytes, offset: int):
+    value = int.from_bytes(frame[offset:offset + 4], "little") / 100
+    return None if value >= SERVICE_COUNTER_EMPTY else value
+
+
+class Controller:
+    """Run-hour regression and latest service counters of one controller"""
+
+    __slots__ = ("origin", "sample_time", "run_hours", "sums", "first_sample", "time", "counters")
+
+    def __init__(self):
+        self.origin = None          # time of the first sample (regression time axis origin)
+        self.sample_time = None     # time of the last regression sample
+        self.run_hours = None
+        self.sums = [0.0] * 5       # decayed sums of w, t, h, t*t, t*h (t in days since origin)
+        self.first_sample = None    # oldest sample still in the fit
+        self.time = None            # time of the latest frame
+        self.counters = {}          # interval -> (hours_left, days_left)
+
+    def state(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def restore(cls, state: dict) -> "Controller":
+        controller = cls()
+        for name in cls.__slots__:
+            setattr(controller, name, state.get(name, getattr(controller, name)))
+        controller.counters = {int(interval): tuple(value) for interval, value in controller.counters.items()}
+        return controller
+
+    def rate(self):
+        """Run hours per day, None until the fit spans MIN_SPAN_DAYS"""
+        if self.first_sample is None or self.sample_time - self.first_sample < MIN_SPAN_DAYS * 86400:
+            return None
+        w, t, h, tt, th = self.sums
+        denominator = w * tt - t * t
+        if denominator <= 1e-12:
+            return None
+        return max((w * th - t * h) / denominator, 0.0)
+
+
+class ServiceForecaster:
+    """
+    Per-controller service forecasts and a fleet-wide due-soon heap
+
+    Args:
+        state_path: Checkpoint file (archive position and controller state)
+    """
+
+    def __init__(self, state_path: str = STATE_JSON):
+        self.state_path = state_path
+        self.controllers = {}   # controller id -> Controller
+        self.heap = []          # (due, seq, controller, interval)
+        self.current = {}       # (controller, interval) -> seq of its live heap entry
+        self.due = {}           # (controller, interval) -> forecast dict of the live entry
+        self.seq = 0
+        self.version = 0        # increments whenever a forecast changes
+        self.follower = None
+        self.saved = 0.0
+
+    # --- updates ---
+
+    def add_frame(self, timestamp: float, frame: bytes) -> bool:
+        """Feed the counters of a raw telemetry frame"""
+        if len(frame) < MIN_FRAME_SIZE:
+            return False
+        counters = {}
+        for interval, (hours_offset, days_offset) in SERVICE_OFFSETS.items():
+            counters[interval] = (_register(frame, hours_offset), _register(frame, days_offset))
+        return self.update(frame[UNIQUE_ID].hex().upper(), _register(frame, RUN_HOURS_OFFSET), counters, timestamp)
+
+    def update(self, name: str, run_hours, counters: dict, timestamp: float) -> bool:
+        """
+        Feed one set of readings
+
+        Args:
+            name: Controller id
+            run_hours: engine_run_hours_total (None: not reported)
+            counters: interval -> (hours_to_service, days_to_service), None where not set
+            timestamp: Frame time, unix seconds
+        """
+        controller = self.controllers.get(name)
+        if controller is None:
+            controller = self.controllers[name] = Controller()
+        elif timestamp <= controller.time:
+            return False
+        controller.time = timestamp
+        controller.counters = counters
+        if run_hours is not None:
+            self._sample(controller, run_hours, timestamp)
+        rate = controller.rate()
+        for interval in INTERVALS:
+            self._forecast(name, interval, counters.get(interval, (None, None)), rate, timestamp)
+        return True
+
+    def _sample(self, controller: Controller, run_hours: float, timestamp: float):
+        if controller.run_hours is not None and run_hours < controller.run_hours - 0.01:
+            controller.origin = None   # counter reset or another engine: start over
+        if controller.origin is None:
+            controller.origin = controller.sample_time = controller.first_sample = timestamp
+            controller.sums = [0.0] * 5
+        elif timestamp - controller.sample_time < SAMPLE_SECONDS:
+            return
+        decay = math.exp(-DECAY_PER_DAY * (timestamp - controller.sample_time) / 86400)
+        t = (timestamp - controller.origin) / 86400
+        h = run_hours
+        sums = controller.sums
+        for i, value in enumerate((1.0, t, h, t * t, t * h)):
+            sums[i] = sums[i] * decay + value
+        controller.sample_time = timestamp
+        controller.run_hours = run_hours
+
+    def _forecast(self, name: str, interval: int, counter: tuple, rate, timestamp: float):
+        hours_left, days_left = counter
+        key = (name, interval)
+        by_hours = hours_left / rate if hours_left is not None and rate is not None and rate >= MIN_RATE else None
+        if by_hours is None and days_left is None:
+            if key in self.current:
+                del self.current[key], self.due[key]
+                self.version += 1
+            return
+        if days_left is None or (by_hours is not None and by_hours < days_left):
+            due_in, due_by = by_hours, "hours"
+        else:
+            due_in, due_by = days_left, "days"
+        due = timestamp + due_in * 86400
+
+        previous = self.due.get(key)
+        if previous is not None and abs(previous["due"] - due) < DUE_RESOLUTION and previous["due_by"] == due_by:
+            previous.update(hours_left=hours_left, days_left=days_left, rate_hours_per_day=rate, updated=timestamp)
+            return
+        self.seq += 1
+        self.current[key] = self.seq
+        self.due[key] = {
+            "controller": name,
+            "interval": interval,
+            "due": due,
+            "due_by": due_by,
+            "hours_left": hours_left,
+            "days_left": days_left,
+            "rate_hours_per_day": rate,
+            "updated": timestamp,
+        }
+        heapq.heappush(self.heap, (due, self.seq, name, interval))
+        if len(self.heap) > 2 * len(self.current) + 64:
+            self._compact()
+        self.version += 1
+
+    def _compact(self):
+        """Drop replaced entries"""
+        self.heap = [entry for entry in self.heap if self.current.get((entry[2], entry[3])) == entry[1]]
+        heapq.heapify(self.heap)
+
+    # --- queries ---
+
+    def _entry(self, key: tuple, now: float) -> dict:
+        entry = dict(self.due[key])
+        entry["due_in_days"] = round((entry["due"] - now) / 86400, 2)
+        if entry["rate_hours_per_day"] is not None:
+            entry["rate_hours_per_day"] = round(entry["rate_hours_per_day"], 3)
+        return entry
+
+    def due_soon(self, within_days: float = DEFAULT_DAYS, limit: int = 100, now: float = None) -> list:
+        """Intervals due within `within_days`, soonest first (overdue ones included)"""
+        now = time.time() if now is None else now
+        horizon = now + within_days * 86400
+        heap = self.heap
+        result = []
+        frontier = [(heap[0][0], heap[0][1], 0)] if heap else []
+        while frontier and len(result) < limit:
+            due, _, index = heapq.heappop(frontier)
+            if due > horizon:
+                break
+            _, seq, name, interval = heap[index]
+            if self.current.get((name, interval)) == seq:
+                result.append(self._entry((name, interval), now))
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child][0], heap[child][1], child))
+        return result
+
+    def forecast(self, name: str, now: float = None) -> dict:
+        """Forecast of every interval of one controller"""
+        now = time.time() if now is None else now
+        controller = self.controllers.get(name)
+        if controller is None:
+            return None
+        rate = controller.rate()
+        return {
+            "controller": name,
+            "run_hours": controller.run_hours,
+            "rate_hours_per_day": None if rate is None else round(rate, 3),
+            "intervals": [self._entry((name, interval), now) for interval in INTERVALS
+                          if (name, interval) in self.due],
+        }
+
+    # --- persistence ---
+
+    def flush(self):
+        """Write the checkpoint"""
+        follower = self.follower
+        state = {
+            "archive": {"path": follower.path, "offset": follower.offset} if follower else None,
+            "controllers": {name: controller.state() for name, controller in self.controllers.items()},
+        }
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+        self.saved = time.time()
+
+    def follow(self, archive_dir: str = ARCHIVE_DIR) -> "ServiceForecaster":
+        """Read the frame archive from the checkpoint (or the start of the newest segment) on poll()"""
+        self.follower = ArchiveFollower(self, archive_dir)
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return self
+        for name, saved in state.get("controllers", {}).items():
+            controller = self.controllers[name] = Controller.restore(saved)
+            rate = controller.rate()
+            for interval in INTERVALS:
+                self._forecast(name, interval, controller.counters.get(interval, (None, None)), rate,
+                               controller.time)
+        position = state.get("archive")
+        if position and position.get("path"):
+            path, offset = position["path"], position["offset"]
+            if not os.path.exists(path):
+                later = [segment for _, segment in list_segments(archive_dir) if segment > path]
+                path, offset = (later[0], 0) if later else (path, offset)
+            self.follower.path, self.follower.offset = path, offset
+        return self
+
+    def poll(self, checkpoint_interval: float = CHECKPOINT_INTERVAL) -> int:
+        """Feed the frames appended to the archive; checkpoints every checkpoint_interval seconds"""
+        added = self.follower.poll()
+        if added and time.time() - self.saved >= checkpoint_interval:
+            self.flush()
+        return added
@@ -0,0 +1,421 @@
+"""
+Datakom D500 MK3 controller fleet simulator
+Synthesizes DY0DD500 telemetry frames from structure/DK0ED500.json with
+evolving genset values, interleaves keepalives and event packets, and drives
+N concurrent TCP sessions against datakom_listener, checking the 8-byte acks.
+
+Usage:
+    python simulator.py --sessions 20 --duration 60
+    python simulator.py --sessions 200 --telemetry-interval 1 --time-scale 60 --output sim.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+
+from config import LISTENER_PORT
+
+STRUCTURE_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "structure", "DK0ED500.json")
+
+HEADER = b"DY0DD500"
+ACK_SIZE = 8
+
+# Template BusCnt -> bytes in the frame, MulIdx -> divisor
+BUS_CNT_BYTES = {0: 1, 1: 2, 2: 2, 3: 4}
+MUL_IDX_DIVISOR = {0: 1, 6: 10, 9: 100, 10: 1000}
+
+# Offsets the template does not describe but the decoder reads
+GENERATOR_NAME_OFFSET = 56
+UNIQUE_ID_OFFSET = 21
+LATITUDE_OFFSET = 45
+LONGITUDE_OFFSET = 49
+MAC_OFFSET = 592
+MODE_OFFSET = 103
+STATE_OFFSET = 105
+SENDER_SLOTS_OFFSET = 258
+SENDER_SLOT_SIZE = 19
+ALERT_MESSAGES_OFFSET = 413
+HARMONICS_OFFSET = 10386
+SELECTED_CHANNEL_OFFSET = 10403
+SCOPEMETER_OFFSET = 10404
+
+MODE_AUTO = 1
+STATE_AT_REST = 0
+STATE_MASTER_GENSET_ON_LOAD = 13
+
+
+def load_layout(path: str = STRUCTURE_JSON) -> tuple:
+    """
+    Numeric field layout from the structure template
+
+    Returns:
+        (frame_size, {bus_adr: (width, divisor, signed)})
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        structure = json.load(f)
+
+    layout = {}
+    frame_end = 0
+    for row in structure["ROWS"]:
+        width = BUS_CNT_BYTES.get(row["BusCnt"])
+        divisor = MUL_IDX_DIVISOR.get(row["MulIdx"])
+        if not row.get("Enable") or width is None or divisor is None:
+            continue
+        if row["BusAdr"] in layout:
+            continue  # same register listed on several tabs
+        layout[row["BusAdr"]] = (width, divisor, bool(row["Signed"]))
+        if row["BusAdr"] < 10000:
+            frame_end = max(frame_end, row["BusAdr"] + width)
+
+    return max(structure.get("MsgByteSize", 0), frame_end), layout
+
+
+def put_int(frame: bytearray, offset: int, width: int, value: int, signed: bool = False):
+    """Write a little-endian integer, clamped to the field range"""
+    if offset + width > len(frame):
+        return
+    bits = width * 8
+    low, high = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1) if signed else (0, (1 << bits) - 1)
+    frame[offset:offset + width] = max(low, min(high, value)).to_bytes(width, "little", signed=signed)
+
+
+class ControllerModel:
+    """
+    One simulated genset with slowly evolving physical values
+
+    Args:
+        index: Controller number (drives unique ID, name and position)
+        rnd: Random generator for this controller
+        rated_kva: Genset rating
+        tank_liters: Fuel tank capacity
+    """
+
+    def __init__(self, index: int, rnd: random.Random, rated_kva: float = 100.0, tank_liters: int = 500):
+        self.index = index
+        self.rnd = rnd
+        self.rated_kva = rated_kva
+        self.rated_current = rated_kva * 1000 / (math.sqrt(3) * 400)
+        self.tank_liters = tank_liters
+
+        self.unique_id = (0xD500_0000_0000_0000_0000_0000 + index).to_bytes(12, "big")
+        self.name = f"SIM-GENSET-{index:04d}"
+        self.mac = bytes((0x02, 0xD5, 0x00, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF))
+
+        self.running = rnd.random() < 0.7
+        self.load = rnd.uniform(0.3, 0.8)
+        self.power_factor = rnd.uniform(0.85, 0.95)
+        self.coolant_temp = 80.0 if self.running else 20.0
+        self.fuel_percent = rnd.uniform(40.0, 95.0)
+        self.battery_voltage = 27.2 if self.running else 25.6
+        self.run_hours = rnd.uniform(100.0, 5000.0)
+        self.service_hours = [rnd.uniform(10.0, 250.0), rnd.uniform(200.0, 500.0), rnd.uniform(500.0, 1000.0)]
+        self.service_days = [rnd.uniform(5.0, 180.0), rnd.uniform(90.0, 365.0), rnd.uniform(180.0, 730.0)]
+        self.total_kwh = rnd.uniform(1e4, 5e5)
+        self.total_kvarh = self.total_kwh * 0.3
+        self.mains_kwh = rnd.uniform(1e4, 5e5)
+        self.fuel_used_liters = rnd.uniform(1e3, 1e5)
+        self.starts = rnd.randint(50, 2000)
+        self.latitude = 50.45 + rnd.uniform(-0.5, 0.5)
+        self.longitude = 30.52 + rnd.uniform(-0.5, 0.5)
+        self.mobile = rnd.random() < 0.2
+        self.scope_channel = 0
+
+    def step(self, dt: float):
+        """Advance the model by dt simulated seconds"""
+        rnd = self.rnd
+        hours = dt / 3600
+
+        # Occasional start/stop, roughly every few simulated hours
+        if rnd.random() < min(1.0, dt / 14400):
+            self.running = not self.running
+            if self.running:
+                self.starts += 1
+
+        if self.running:
+            self.load = min(1.0, max(0.1, self.load + rnd.gauss(0, 0.02) * math.sqrt(max(dt, 1e-3))))
+            self.coolant_temp += (85.0 - self.coolant_temp) * min(1.0, dt / 600)
+            self.battery_voltage += (27.2 - self.battery_voltage) * min(1.0, dt / 300)
+            liters = (5.0 + 20.0 * self.load) * hours
+            self.fuel_used_liters += liters
+            self.fuel_percent -= liters / self.tank_liters * 100
+            self.run_hours += hours
+            for i in range(3):
+                self.service_hours[i] -= hours
+            kw = self.active_power_kw()
+            self.total_kwh += kw * hours
+            self.total_kvarh += kw * math.tan(math.acos(self.power_factor)) * hours
+        else:
+            self.coolant_temp += (20.0 - self.coolant_temp) * min(1.0, dt / 1800)
+            self.battery_voltage += (25.4 - self.battery_voltage) * min(1.0, dt / 3600)
+            self.mains_kwh += rnd.uniform(20.0, 60.0) * hours
+
+        for i in range(3):
+            self.service_days[i] -= dt / 86400
+            if self.service_hours[i] < 0 or self.service_days[i] < 0:
+                self.service_hours[i] = 250.0 * (i + 1)
+                self.service_days[i] = 180.0 * (i + 1)
+
+        # Refuel when low, rare siphoning
+        if self.fuel_percent < 15.0:
+            self.fuel_percent = rnd.uniform(85.0, 98.0)
+        elif rnd.random() < min(1.0, dt / 86400 / 7):
+            self.fuel_percent = max(0.0, self.fuel_percent - rnd.uniform(5.0, 15.0))
+
+        if self.mobile:
+            self.latitude += rnd.gauss(0, 0.0005) * math.sqrt(max(dt, 1e-3))
+            self.longitude += rnd.gauss(0, 0.0005) * math.sqrt(max(dt, 1e-3))
+
+        self.scope_channel = (self.scope_channel + 1) % 6
+
+    def active_power_kw(self) -> float:
+        return self.rated_kva * self.load * self.power_factor if self.running else 0.0
+
+    def values(self) -> dict:
+        """Physical values keyed by template BusAdr"""
+        rnd = self.rnd
+        v = {}
+        if self.running:
+            phase_v = [230.0 + rnd.gauss(0, 1.0) for _ in range(3)]
+            currents = [self.rated_current * self.load * (1 + rnd.gauss(0, 0.03)) for _ in range(3)]
+            p = self.active_power_kw()
+            s = p / self.power_factor
+            q = math.sqrt(max(0.0, s * s - p * p))
+            freq = 50.0 + rnd.gauss(0, 0.02)
+            v.update({
+                181: phase_v[0], 185: phase_v[1], 189: phase_v[2],
+                205: phase_v[0] * math.sqrt(3), 209: phase_v[1] * math.sqrt(3), 213: phase_v[2] * math.sqrt(3),
+                193: currents[0], 197: currents[1], 201: currents[2],
+                233: abs(currents[0] - currents[1]) / 2,
+                231: freq, 217: p, 221: q, 225: s, 229: self.power_factor,
+                237: 1500 + rnd.gauss(0, 3), 243: 4.5 + rnd.gauss(0, 0.1), 249: 90.0 + rnd.gauss(0, 0.5),
+                553: p, 614: 5.0 + 20.0 * self.load, 612: 5.0 + 20.0 * self.load,
+            })
+        else:
+            mains_v = [230.0 + rnd.gauss(0, 1.5) for _ in range(3)]
+            v.update({
+                125: mains_v[0], 129: mains_v[1], 133: mains_v[2],
+                149: mains_v[0] * math.sqrt(3), 153: mains_v[1] * math.sqrt(3), 157: mains_v[2] * math.sqrt(3),
+                175: 50.0 + rnd.gauss(0, 0.02), 173: 0.95,
+            })
+        v.update({
+            239: self.battery_voltage, 241: self.battery_voltage + 0.6, 555: self.battery_voltage - 0.1,
+            245: self.coolant_temp, 247: self.fuel_percent, 251: 25.0 + rnd.gauss(0, 0.3),
+            511: self.run_hours, 515: self.service_hours[0], 523: self.service_hours[1], 531: self.service_hours[2],
+            519: self.service_days[0], 527: self.service_days[1], 535: self.service_days[2],
+            539: self.total_kwh, 543: self.total_kvarh, 547: self.total_kvarh * 0.05,
+            561: self.mains_kwh, 565: self.mains_kwh * 0.3, 569: self.mains_kwh * 0.02, 573: 0.0,
+            577: self.fuel_used_liters, 598: self.fuel_used_liters, 585: self.tank_liters,
+            503: self.starts, 507: self.starts + 3, 589: 9,
+        })
+        return v
+
+
+class FrameSynthesizer:
+    """Builds telemetry frames for controller models from the template layout"""
+
+    def __init__(self, structure_path: str = STRUCTURE_JSON, frame_size: int = None):
+        template_size, self.layout = load_layout(structure_path)
+        self.frame_size = frame_size or template_size
+
+    def frame(self, model: ControllerModel) -> bytes:
+        data = bytearray(self.frame_size)
+        data[0:len(HEADER)] = HEADER
+        data[UNIQUE_ID_OFFSET:UNIQUE_ID_OFFSET + 12] = model.unique_id
+        name = model.name.encode("ascii")[:32]
+        data[GENERATOR_NAME_OFFSET:GENERATOR_NAME_OFFSET + len(name)] = name
+        put_int(data, LATITUDE_OFFSET, 4, round(model.latitude * 1_000_000))
+        put_int(data, LONGITUDE_OFFSET, 4, round(model.longitude * 1_000_000))
+        data[MODE_OFFSET] = MODE_AUTO
+        data[STATE_OFFSET] = STATE_MASTER_GENSET_ON_LOAD if model.running else STATE_AT_REST
+        if len(data) >= MAC_OFFSET + 6:
+            data[MAC_OFFSET:MAC_OFFSET + 6] = model.mac
+
+        for bus_adr, value in model.values().items():
+            field = self.layout.get(bus_adr)
+            if field is None:
+                continue
+            width, divisor, signed = field
+            put_int(data, bus_adr, width, round(value * divisor), signed)
+
+        if model.fuel_percent < 20.0:
+            self._put_alarm(data, "Low Fuel Level")
+
+        if len(data) > SCOPEMETER_OFFSET + 200:
+            self._put_waveform(data, model)
+        return bytes(data)
+
+    @staticmethod
+    def _put_alarm(data: bytearray, message: str):
+        """Mark SENDER slot 0 active and write its message"""
+        slot = SENDER_SLOTS_OFFSET
+        data[slot:slot + 16] = b"SENDER 0".ljust(16, b" ")
+        data[slot + 16:slot + 19] = bytes((0, 0x01, ord('3')))
+        text = message.encode("ascii") + b"|"
+        data[ALERT_MESSAGES_OFFSET:ALERT_MESSAGES_OFFSET + len(text)] = text
+
+    @staticmethod
+    def _put_waveform(data: bytearray, model: ControllerModel):
+        """Harmonic levels and 100 scopemeter points for the selected channel"""
+        rnd = model.rnd
+        harmonics = [rnd.uniform(0.2, 4.0) / (order - 1) for order in range(3, 32)]
+        for i, level in enumerate(harmonics):
+            put_int(data, HARMONICS_OFFSET + i * 2, 2, round(level * 100))
+        data[SELECTED_CHANNEL_OFFSET] = model.scope_channel
+        amplitude = 2000 * (model.load if model.running else 0.05)
+        for i in range(100):
+            angle = 2 * math.pi * i / 100
+            sample = amplitude * (math.sin(angle) + harmonics[0] / 100 * math.sin(3 * angle))
+            put_int(data, SCOPEMETER_OFFSET + i * 2, 2, round(32768 + sample))
+
+
+def keepalive_packet() -> bytes:
+    return HEADER
+
+
+def event_packet(rnd: random.Random) -> bytes:
+    return b"EV" + bytes(rnd.getrandbits(8) for _ in range(30))
+
+
+class Stats:
+    """Counters shared by all sessions"""
+
+    def __init__(self):
+        self.sent = {"telemetry": 0, "keepalive": 0, "event": 0}
+        self.acks_ok = 0
+        self.acks_bad = 0
+        self.ack_latencies = []
+        self.connects = 0
+        self.connect_failures = 0
+        self.dropped_sessions = 0
+
+
+async def run_session(index: int, args, synthesizer: FrameSynthesizer, stats: Stats, deadline: float):
+    """One controller: connect, stream packets, reconnect on drop"""
+    rnd = random.Random(args.seed * 100003 + index)
+    model = ControllerModel(index, rnd)
+    await asyncio.sleep(rnd.uniform(0, args.ramp))
+
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(args.host, args.port), timeout=args.ack_timeout)
+        except (OSError, asyncio.TimeoutError):
+            stats.connect_failures += 1
+            if not args.reconnect:
+                return
+            await asyncio.sleep(1.0)
+            continue
+
+        stats.connects += 1
+        last_step = time.monotonic()
+        next_telemetry = last_step
+        next_keepalive = last_step + args.keepalive_interval
+        # Events arrive as a Poisson process at event_rate per second
+        next_event = last_step + rnd.expovariate(args.event_rate) if args.event_rate else math.inf
+        try:
+            while time.monotonic() < deadline:
+                now = time.monotonic()
+                if now >= next_telemetry:
+                    model.step((now - last_step) * args.time_scale)
+                    last_step = now
+                    kind, packet = "telemetry", synthesizer.frame(model)
+                    next_telemetry = now + args.telemetry_interval
+                elif now >= next_event:
+                    kind, packet = "event", event_packet(rnd)
+                    next_event = now + rnd.expovariate(args.event_rate)
+                elif now >= next_keepalive:
+                    kind, packet = "keepalive", keepalive_packet()
+                    next_keepalive = now + args.keepalive_interval
+                else:
+                    await asyncio.sleep(min(next_telemetry, next_keepalive, next_event) - now)
+                    continue
+
+                started = time.perf_counter()
+                writer.write(packet)
+                stats.sent[kind] += 1
+                await writer.drain()
+                ack = await asyncio.wait_for(reader.readexactly(ACK_SIZE if len(packet) >= ACK_SIZE else len(packet)),
+                                             timeout=args.ack_timeout)
+                stats.ack_latencies.append(time.perf_counter() - started)
+                if ack == packet[:ACK_SIZE]:
+                    stats.acks_ok += 1
+                else:
+                    stats.acks_bad += 1
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            stats.dropped_sessions += 1
+        finally:
+            writer.close()
+
+        if not args.reconnect:
+            return
+        await asyncio.sleep(1.0)
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+async def run(args) -> dict:
+    synthesizer = FrameSynthesizer(frame_size=args.frame_size)
+    stats = Stats()
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(*(run_session(i, args, synthesizer, stats, deadline) for i in range(args.sessions)))
+    elapsed = time.monotonic() - started
+
+    total = sum(stats.sent.values())
+    return {
+        "sessions": args.sessions,
+        "duration_s": round(elapsed, 2),
+        "frame_size": synthesizer.frame_size,
+        "packets": stats.sent,
+        "packets_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "telemetry_per_s": round(stats.sent["telemetry"] / elapsed, 1) if elapsed else 0.0,
+        "acks_ok": stats.acks_ok,
+        "acks_bad": stats.acks_bad,
+        "ack_latency_ms": {
+            "p50": round(percentile(stats.ack_latencies, 50) * 1000, 2),
+            "p95": round(percentile(stats.ack_latencies, 95) * 1000, 2),
+            "p99": round(percentile(stats.ack_latencies, 99) * 1000, 2),
+            "max": round(max(stats.ack_latencies, default=0.0) * 1000, 2),
+        },
+        "connects": stats.connects,
+        "connect_failures": stats.connect_failures,
+        "dropped_sessions": stats.dropped_sessions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datakom D500 controller fleet simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=LISTENER_PORT)
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent controller sessions")
+    parser.add_argument("--duration", type=float, default=30.0, help="Test duration, seconds")
+    parser.add_argument("--telemetry-interval", type=float, default=5.0, help="Seconds between telemetry frames per session")
+    parser.add_argument("--keepalive-interval", type=float, default=1.0, help="Seconds between keepalives per session")
+    parser.add_argument("--event-rate", type=float, default=0.0, help="Event packets per second per session")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Simulated seconds per real second")
+    parser.add_argument("--frame-size", type=int, help="Frame size in bytes (default: template MsgByteSize)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Spread session starts over this many seconds")
+    parser.add_argument("--ack-timeout", type=float, default=10.0)
+    parser.add_argument("--no-reconnect", dest="reconnect", action="store_false")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
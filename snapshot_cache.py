@@ -0,0 +1,102 @@
+"""
+In-memory snapshot cache for JSON files written by datakom_listener
+Files are re-read only when their mtime/size changes, and all disk access
+runs in a bounded thread pool so asyncio handlers never block on I/O.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, Optional
+
+
+def file_signature(path: Path) -> Optional[tuple]:
+    """(mtime_ns, size) of a file, None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class JsonFileCache:
+    """
+    Stale-while-revalidate cache for one data file
+
+    Args:
+        path: File to watch
+        loader: Blocking function returning the parsed content (runs in executor)
+        executor: Bounded executor for stat/read calls
+        ttl: Seconds a checked snapshot is served before the file is re-checked
+    """
+
+    def __init__(self, path: Path, loader: Callable[[], dict], executor: Executor, ttl: float = 1.0):
+        self.path = path
+        self.loader = loader
+        self.executor = executor
+        self.ttl = ttl
+        self.data: Optional[dict] = None
+        self.signature: Optional[tuple] = None
+        self.version = 0  # increments every time new content is loaded
+        self.last_check = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _check_and_load(self) -> Optional[tuple]:
+        """Blocking part of a refresh: stat and, if changed, parse the file"""
+        signature = file_signature(self.path)
+        if self.data is not None and signature == self.signature:
+            return None
+        return signature, self.loader()
+
+    async def refresh(self):
+        """Re-check the file and reload it if it changed"""
+        loop = asyncio.get_running_loop()
+        try:
+            changed = await loop.run_in_executor(self.executor, self._check_and_load)
+        except Exception as e:
+            print(f"[!] Error reading {self.path}: {e}")
+            changed = None
+        if changed is not None:
+            self.signature, self.data = changed
+            self.version += 1
+        self.last_check = time.monotonic()
+
+    async def get(self) -> dict:
+        """Current snapshot; first call waits for the load, later calls never do"""
+        if self.data is None:
+            await self._single_flight()
+            return self.data if self.data is not None else {}
+        if time.monotonic() - self.last_check >= self.ttl:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self.refresh())
+        return self.data
+
+    async def _single_flight(self):
+        """Run one refresh shared by every concurrent caller"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+        await asyncio.shield(self._refresh_task)
+
+
+class LiveSnapshot:
+    """
+    JsonFileCache interface over in-process state (combined API + listener)
+
+    Args:
+        source: Callable returning (version, data), e.g. lambda: engine.telemetry
+    """
+
+    def __init__(self, source: Callable[[], tuple]):
+        self.source = source
+        self.version = 0
+        self.data: Optional[dict] = None
+
+    async def refresh(self):
+        self.version, self.data = self.source()
+
+    async def get(self) -> dict:
+        """Current state; `version` matches the returned data until the next get()"""
+        self.version, self.data = self.source()
+        return self.data
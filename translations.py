@@ -0,0 +1,186 @@
+"""
+Precompiled translation tables for Datakom D500 MK3
+Every language module in lang/ is loaded once and flattened into arrays
+indexed by parameter ID, state code and alarm index, so any language can be
+served per request without imports or dictionary lookups by label.
+Adding a language means adding lang/<code>.py - no code changes.
+A language module is imported and flattened on first use, not at import.
+"""
+
+import importlib
+import pkgutil
+
+import lang
+from config import DEFAULT_LANGUAGE
+from param_mapping import PARAM_MAPPING
+
+FALLBACK_LANGUAGE = "uk"
+
+# Alarm indices are a single byte in the controller string table
+ALARM_INDEX_COUNT = 256
+
+# Highest fixed parameter ID, sizes the per-ID arrays
+MAX_PARAM_ID = max(param_id for param_id, _ in PARAM_MAPPING.values())
+
+# Parameter label -> name of the value dictionary in language modules
+VALUE_HINT_DICTS = {
+    "Genset Mode": "MODE_NAMES",
+    "Genset State": "STATE_NAMES",
+    "Engine State": "ENGINE_STATE_NAMES",
+    "Breaker State": "BREAKER_STATE_NAMES",
+    "Mains State": "MAINS_STATE_NAMES",
+    "Battery State": "BATTERY_STATE_NAMES",
+    "Start Source": "START_SOURCE_NAMES",
+    "Running Type": "RUNNING_TYPE_NAMES",
+}
+
+# Code-indexed dictionaries every language module provides
+CODE_DICTS = (
+    "MODE_NAMES",
+    "STATE_NAMES",
+    "ENGINE_STATE_NAMES",
+    "BREAKER_STATE_NAMES",
+    "MAINS_STATE_NAMES",
+    "BATTERY_STATE_NAMES",
+    "START_SOURCE_NAMES",
+    "RUNNING_TYPE_NAMES",
+    "OUTPUT_FUNCTIONS",
+)
+
+
+def _code_array(names: dict) -> tuple:
+    """Flatten {code: text} into a tuple indexed by code ("" for gaps)"""
+    if not names:
+        return ()
+    array = [""] * (max(names) + 1)
+    for code, text in names.items():
+        array[code] = text
+    return tuple(array)
+
+
+def _param_labels() -> list:
+    """Label for every parameter ID (first mapping wins, as in get_all_param_names)"""
+    labels = [None] * (MAX_PARAM_ID + 1)
+    for param_id, label in PARAM_MAPPING.values():
+        if labels[param_id] is None:
+            labels[param_id] = label
+    return labels
+
+
+class LanguageTable:
+    """All translations of one language, flattened for O(1) lookups"""
+
+    def __init__(self, code: str, module):
+        self.code = code
+
+        # State/mode/output names indexed by code
+        self.codes = {name: _code_array(getattr(module, name, {})) for name in CODE_DICTS}
+
+        # Alarm messages indexed by alarm index, defaults precomputed
+        messages = getattr(module, "ALARM_MESSAGES", {})
+        self.alarm_messages = tuple(
+            messages.get(idx, f"Alarm #{idx}") for idx in range(ALARM_INDEX_COUNT)
+        )
+
+        # Label hints and value hints indexed by parameter ID
+        titles = getattr(module, "PARAM_TITLES", {})
+        labels = _param_labels()
+        self.param_titles = tuple(titles.get(label, "") if label else "" for label in labels)
+        self.value_hints = tuple(
+            self.codes.get(VALUE_HINT_DICTS.get(label)) if label else None
+            for label in labels
+        )
+
+        # Ready-made /api/dump_devm_param_names listing
+        self.param_names = tuple(
+            {"id": param_id, "label": label, "title": self.param_titles[param_id]}
+            for param_id, label in enumerate(labels) if label is not None
+        )
+
+        # Original dictionaries, for code that still expects dict access
+        self.dicts = {name: dict(getattr(module, name, {})) for name in CODE_DICTS}
+        self.dicts["ALARM_MESSAGES"] = dict(messages)
+
+    def title(self, param_id: int) -> str:
+        """Translated title for parameter ID"""
+        if 0 <= param_id <= MAX_PARAM_ID:
+            return self.param_titles[param_id]
+        return ""
+
+    def value_hint(self, param_id: int, value) -> str:
+        """Text description for a numeric parameter value"""
+        if not isinstance(value, (int, float)) or not 0 <= param_id <= MAX_PARAM_ID:
+            return ""
+        hints = self.value_hints[param_id]
+        if not hints:
+            return ""
+        code = int(value)
+        if 0 <= code < len(hints):
+            return hints[code]
+        return ""
+
+    def alarm_message(self, alarm_index) -> str:
+        """Translated alarm message for alarm index"""
+        if isinstance(alarm_index, int) and 0 <= alarm_index < ALARM_INDEX_COUNT:
+            return self.alarm_messages[alarm_index]
+        return f"Alarm #{alarm_index}"
+
+    def code_name(self, dict_name: str, code: int, unknown: str) -> str:
+        """Name for a state/mode code, `unknown` if not defined"""
+        names = self.codes[dict_name]
+        if 0 <= code < len(names) and names[code]:
+            return names[code]
+        return unknown
+
+
+def _discover_languages() -> tuple:
+    """Language codes of lang/*.py, without importing them"""
+    return tuple(sorted(module_info.name for module_info in pkgutil.iter_modules(lang.__path__)))
+
+
+SUPPORTED_LANGUAGES = _discover_languages()
+
+# Tables are built on first use, so importing this module loads no language
+TABLES = {}
+
+_alarm_index_by_message = None
+
+
+def _load_table(code: str) -> LanguageTable:
+    table = TABLES.get(code)
+    if table is None:
+        table = TABLES[code] = LanguageTable(code, importlib.import_module(f"lang.{code}"))
+    return table
+
+
+def default_table() -> LanguageTable:
+    """Table of DEFAULT_LANGUAGE (fallback language if it is not installed)"""
+    if DEFAULT_LANGUAGE in SUPPORTED_LANGUAGES:
+        return _load_table(DEFAULT_LANGUAGE)
+    return _load_table(FALLBACK_LANGUAGE)
+
+
+def get_table(lang_code: str = None) -> LanguageTable:
+    """Translation table for language code, default language if unknown"""
+    if lang_code and lang_code in SUPPORTED_LANGUAGES:
+        return _load_table(lang_code)
+    return default_table()
+
+
+def alarm_index_by_message() -> dict:
+    """English alarm text -> alarm index (decoder matches raw messages in English)"""
+    global _alarm_index_by_message
+    if _alarm_index_by_message is None:
+        _alarm_index_by_message = {
+            message: idx for idx, message in reversed(_load_table("en").dicts["ALARM_MESSAGES"].items())
+        }
+    return _alarm_index_by_message
+
+
+def __getattr__(name: str):
+    # Parameter listing served when no language is requested
+    if name == "UNTITLED_PARAM_NAMES":
+        value = tuple(dict(param, title="") for param in default_table().param_names)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,110 @@
+"""
+Recent scopemeter waveforms per controller and channel
+Each extended frame carries 100 scopemeter samples of the channel selected at
+10403; telemetry.json only ever holds the latest one. WaveformBuffer keeps a
+ring of the last HISTORY waveforms per controller and channel as a uint16
+block (HISTORY x 100, 200 bytes per waveform), filled straight from the raw
+frame bytes without decoding.
+
+The API fills its buffer with frame_archive.ArchiveFollower (fed by the shared
+ArchiveFanout), which gets only the records appended to the frame archive since
+the previous poll, so it works the same with the listener as a child process,
+in combined mode and with several ingest workers.
+
+Binary encoding of a waveform series (little-endian):
+    header  : magic "DKW1" | version u8 | channel u8 | points u16 | count u16 |
+              controller unique_id (12 bytes)
+    body    : timestamp f64 x count | samples u16 x (count x points), oldest first
+"""
+
+import struct
+
+import numpy as np
+
+from power_quality import CHANNELS, SCOPE_POINTS
+
+MEDIA_TYPE = "application/x-datakom-waveform"
+MAGIC = b"DKW1"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHH12s")
+
+HISTORY = 64               # waveforms kept per controller and channel
+UNIQUE_ID = slice(21, 33)  # decode_telemetry's unique_id
+SELECTOR_OFFSET = 10403    # low byte only, see power_quality
+SCOPE_OFFSET = 10404
+SCOPE_END = SCOPE_OFFSET + SCOPE_POINTS * 2
+
+
+class WaveformRing:
+    """The last `depth` waveforms of one channel"""
+
+    __slots__ = ("samples", "times", "head", "count")
+
+    def __init__(self, depth: int):
+        self.samples = np.zeros((depth, SCOPE_POINTS), dtype=np.uint16)
+        self.times = np.zeros(depth)
+        self.head = 0    # next row to write
+        self.count = 0
+
+    def append(self, timestamp: float, samples):
+        self.samples[self.head] = samples
+        self.times[self.head] = timestamp
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def recent(self, n: int) -> tuple:
+        """(times, samples) of the last n waveforms, oldest first"""
+        n = min(n, self.count)
+        rows = (np.arange(self.head - n, self.head)) % len(self.times)
+        return self.times[rows], self.samples[rows]
+
+
+class WaveformBuffer:
+    """
+    Bounded waveform history per controller and channel
+
+    Args:
+        depth: Waveforms kept per controller and channel
+    """
+
+    def __init__(self, depth: int = HISTORY):
+        self.depth = depth
+        self.rings = {}         # (controller, channel) -> WaveformRing
+        self.latest = None      # controller of the newest waveform
+        self.version = 0        # increments with every waveform
+
+    def add_frame(self, timestamp: float, frame: bytes) -> bool:
+        """Store the waveform of a raw telemetry frame; False if the frame has none"""
+        if len(frame) < SCOPE_END:
+            return False
+        channel = frame[SELECTOR_OFFSET]
+        if channel >= CHANNELS:
+            return False
+        controller = frame[UNIQUE_ID].hex().upper()
+        self.add(controller, channel, timestamp, np.frombuffer(frame, "<u2", SCOPE_POINTS, SCOPE_OFFSET))
+        return True
+
+    def add(self, controller: str, channel: int, timestamp: float, samples):
+        ring = self.rings.get((controller, channel))
+        if ring is None:
+            ring = self.rings[(controller, channel)] = WaveformRing(self.depth)
+        ring.append(timestamp, samples)
+        self.latest = controller
+        self.version += 1
+
+    def recent(self, controller: str, channel: int, n: int) -> tuple:
+        """(times, samples) of the controller's last n waveforms of a channel, oldest first"""
+        ring = self.rings.get((controller, channel))
+        if ring is None:
+            return np.zeros(0), np.zeros((0, SCOPE_POINTS), dtype=np.uint16)
+        return ring.recent(n)
+
+    def channels(self, controller: str) -> dict:
+        """Channel -> stored waveforms of a controller"""
+        return {channel: ring.count for (name, channel), ring in self.rings.items() if name == controller}
+
+
+def encode_waveforms(controller: str, channel: int, times: np.ndarray, samples: np.ndarray) -> bytes:
+    """Binary waveform series (see module docstring)"""
+    header = HEADER.pack(MAGIC, VERSION, channel, SCOPE_POINTS, len(times), bytes.fromhex(controller))
+    return header + times.astype("<f8").tobytes() + samples.astype("<u2").tobytes()